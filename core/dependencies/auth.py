@@ -1,41 +1,81 @@
 import os
 import base64
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Annotated
+from uuid import uuid4
+
+from functools import lru_cache
 
 import jwt
+from cachetools import TLRUCache, TTLCache
 from starlette.config import Config
-from authlib.integrations.starlette_client import OAuth
 from fastapi import Depends, Request, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, noload
 
 from modules.users.schemas import BaseCandidate, BaseClient, BaseUser
 from modules.auth.schemas import RefreshTokenSchema
 from modules.users.models import ClientProfile, User, UserType, Company
 
 from core.env import config
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db, use_writer
 from core.exceptions.base import UnauthorizedException
-from core.exceptions.auth import DecodeTokenException, ExpiredTokenException, UserNotFoundException
+from core.exceptions.auth import DecodeTokenException, ExpiredTokenException, RevokedTokenException, UserNotFoundException
+from core.helpers.revocation import revocation_list
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
+# BaseUser resolved by get_current_user, keyed by (user id, token iat).
+# Kept per process: writes in this worker evict right away, other workers
+# catch up when the entry expires.
+user_cache = TTLCache(maxsize=int(config.USER_CACHE_SIZE), ttl=int(config.USER_CACHE_TTL))
+
+# Claims of tokens whose signature was already checked, keyed by the token's
+# sha256 and dropped at the token's own exp (wall clock, like exp itself)
+token_cache = TLRUCache(maxsize=int(config.TOKEN_CACHE_SIZE),
+                        ttu=lambda _key, claims, _now: claims.get("exp", 0), timer=time.time)
+token_cache_stats = {"hits": 0, "misses": 0}
+
+
+# Set up oauth, built on first use so authlib isn't imported at startup
+@lru_cache(maxsize=None)
+def get_oauth():
+    from authlib.integrations.starlette_client import OAuth
+
+    config_data = {'GOOGLE_CLIENT_ID': config.GOOGLE_CLIENT_ID, 'GOOGLE_CLIENT_SECRET': config.GOOGLE_CLIENT_SECRET}
+    starlette_config = Config(environ=config_data)
+    custom_oauth = OAuth(starlette_config)
+
+    # google reg
+    custom_oauth.register(
+        name='google',
+        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        client_kwargs={'scope': 'openid email profile'},
+    )
+    # linkedin reg
+    # custom_oauth.register(name="linkedin",)
+    return custom_oauth
+
+
+@lru_cache(maxsize=None)
+def get_google_transport():
+    '''Fetches Google's signing certificates, cached for their max-age'''
+    # google-auth pulls in its http stack, imported on the first Google login
+    from core.helpers.google_certs import CachingRequest
+
+    return CachingRequest()
 
-# Set up oauth
-config_data = {'GOOGLE_CLIENT_ID': config.GOOGLE_CLIENT_ID, 'GOOGLE_CLIENT_SECRET': config.GOOGLE_CLIENT_SECRET}
-starlette_config = Config(environ=config_data)
-custom_oauth = OAuth(starlette_config)
 
-# google reg
-custom_oauth.register(
-    name='google',
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
-# linkedin reg
-# custom_oauth.register(name="linkedin",)
+def verify_google_token(token: str) -> dict:
+    '''Verifies a Google ID token for our client id, raises ValueError if invalid'''
+    from google.oauth2 import id_token
+
+    return id_token.verify_oauth2_token(token, get_google_transport(), config.GOOGLE_CLIENT_ID)
 
 
 
@@ -45,6 +85,9 @@ class TokenHelper:
         token = jwt.encode(
             payload = {
                 **data,
+                "iat": datetime.utcnow(),
+                # lets a single token be revoked on logout
+                "jti": uuid4().hex,
                 "exp": datetime.utcnow() + timedelta(seconds=expire_period),
             },
             key=config.JWT_SECRET_KEY
@@ -63,6 +106,20 @@ class TokenHelper:
         except jwt.exceptions.ExpiredSignatureError:
             raise ExpiredTokenException(message="Your token has expired")
 
+    @staticmethod
+    def verify(token: str) -> dict:
+        '''decode() that remembers the result, a token's signature is checked once per worker'''
+        digest = hashlib.sha256(token.encode() if isinstance(token, str) else token).digest()
+        claims = token_cache.get(digest)
+        if claims is None:
+            token_cache_stats["misses"] += 1
+            claims = TokenHelper.decode(token)
+            if "exp" in claims:
+                token_cache[digest] = claims
+        else:
+            token_cache_stats["hits"] += 1
+        return dict(claims)
+
     @staticmethod
     def decode_expired_token(token: str) -> dict:
         try:
@@ -91,8 +148,33 @@ class TokenHelper:
         )
 
 
+async def fetch_token_user(db: AsyncSession, user_email: str, role: str, with_company: bool = False):
+    # a user only has the profile of their role, the other one isn't queried
+    if (role == UserType.CLIENT):
+        client_profile = joinedload(User.client_profile)
+        if with_company:
+            client_profile = client_profile.joinedload(ClientProfile.company).joinedload(Company.profile)
+        query = select(User).options(client_profile, noload(User.candidate_profile))
+    elif (role == UserType.CANDIDATE):
+        query = select(User).options(joinedload(User.candidate_profile), noload(User.client_profile))
+    else:
+        query = select(User).options(noload(User.candidate_profile), noload(User.client_profile))
+
+    user = (await db.execute(query.filter(User.email == user_email))).scalars().first()
+    if user is None and use_writer(db):
+        # accounts created a moment ago may not have reached the replica yet
+        user = (await db.execute(query.filter(User.email == user_email))).scalars().first()
+    return user
+
+
+async def ensure_not_revoked(request: Request, claims: dict) -> None:
+    # the auth middleware already rejected revoked tokens it decoded
+    if not request.user and await revocation_list.is_revoked(claims.get("jti")):
+        raise RevokedTokenException
+
+
 async def get_current_user(request: Request, token: Annotated[str, Depends(oauth2_scheme)], 
-                           db: Session = Depends(get_db)) -> BaseUser:
+                           db: AsyncSession = Depends(get_async_db)) -> BaseUser:
     user_decoded_string : str
     # TODO: Refactor token capture, decode and validation into middleware [using oauth bearer doesnt work in middleware]
     # Get decoded token from auth middleware
@@ -100,32 +182,48 @@ async def get_current_user(request: Request, token: Annotated[str, Depends(oauth
         if request.user:
             user_decoded_string = request.user  
         else: # Get token from headers
-            user_decoded_string = TokenHelper.decode(token)
+            user_decoded_string = TokenHelper.verify(token)
     except:
         raise DecodeTokenException("Something went wrong decoding your access token")
-    
+    await ensure_not_revoked(request, user_decoded_string)
 
     user_email: str = user_decoded_string.get("email")
     role: str = user_decoded_string.get("role")
 
     if user_email is None:
         raise UnauthorizedException(message="Could not validate credentials")
-    
-    if (role == UserType.CLIENT):
-        user = db.query(User).options(
-                joinedload(User.client_profile)
-                .joinedload(ClientProfile.company)).filter(User.email == user_email).first()
-    elif (role == UserType.CANDIDATE):
-        user = db.query(User).options(
-                joinedload(User.candidate_profile)).filter(User.email == user_email).first()
-    else:
-        user = db.query(User).filter(User.email == user_email).first()
 
-    return BaseUser.from_orm(user)
+    # tokens issued before iat was added fall back to their expiry
+    cache_key = (user_decoded_string.get("id"), user_decoded_string.get("iat") or user_decoded_string.get("exp"))
+    cached = user_cache.get(cache_key)
+    if cached is None:
+        user = await fetch_token_user(db, user_email, role, with_company=True)
+        if user is None:
+            raise UserNotFoundException
+        cached = user_cache[cache_key] = BaseUser.from_orm(user)
+
+    # handlers may modify the user they get, never hand out the cached one
+    return cached.model_copy(deep=True)
+
+
+def invalidate_user(user_id) -> None:
+    '''Drops the cached users for `user_id`, call after committing a change to them'''
+    user_id = str(user_id)
+    for key in [key for key in list(user_cache) if str(key[0]) == user_id]:
+        user_cache.pop(key, None)
+
+
+def invalidate_company(company_id) -> None:
+    '''Drops every cached user whose client profile embeds the company'''
+    company_id = str(company_id)
+    for key, user in list(user_cache.items()):
+        company = user.client_profile.company if user.client_profile else None
+        if company is not None and str(company.id) == company_id:
+            user_cache.pop(key, None)
 
 
 async def get_current_user_object(request: Request, token: Annotated[str, Depends(oauth2_scheme)], 
-                           db: Session = Depends(get_db)) -> User:
+                           db: AsyncSession = Depends(get_async_db)) -> User:
     user_decoded_string : str
     # TODO: Refactor token capture, decode and validation into middleware [using oauth bearer doesnt work in middleware]
     # Get decoded token from auth middleware
@@ -133,22 +231,16 @@ async def get_current_user_object(request: Request, token: Annotated[str, Depend
         if request.user:
             user_decoded_string = request.user  
         else: # Get token from headers
-            user_decoded_string = TokenHelper.decode(token)
+            user_decoded_string = TokenHelper.verify(token)
     except:
         raise UnauthorizedException(message="Could not validate credentials")
+    await ensure_not_revoked(request, user_decoded_string)
     user_email: str = user_decoded_string.get("email")
     if user_email is None:
         raise UnauthorizedException(message="Could not validate credentials")
     
     role: str = user_decoded_string.get("role")
-    if (role == UserType.CLIENT):
-        user = db.query(User).options(
-                joinedload(User.client_profile)).filter(User.email == user_email).first()
-    elif (role == UserType.CANDIDATE):
-        user = db.query(User).options(
-                joinedload(User.candidate_profile)).filter(User.email == user_email).first()
-    else:
-        user = db.query(User).filter(User.email == user_email).first()
+    user = await fetch_token_user(db, user_email, role)
 
     if user is None:
         raise UserNotFoundException
@@ -0,0 +1,67 @@
+import inspect
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request
+
+from core.env import config
+from core.exceptions import TooManyRequestsException
+from core.helpers.rate_limit import take_token
+
+
+# requests from these carry the client's address in X-Forwarded-For
+TRUSTED_PROXIES = {address.strip() for address in config.FORWARDED_ALLOW_IPS.split(",")}
+
+
+def by_ip(request: Request) -> Optional[str]:
+    '''
+        The client's IP. Behind the load balancer uvicorn takes it from
+        X-Forwarded-For, only for the proxies in FORWARDED_ALLOW_IPS (see
+        gunicorn_conf.py). Unknown or still a proxy's address, the request
+        isn't limited by IP: every client would share that one bucket
+    '''
+    host = request.client.host if request.client else None
+    if not host or host in TRUSTED_PROXIES:
+        return None
+    return host
+
+
+def by_user(request: Request) -> Optional[str]:
+    if request.user and request.user.get("id"):
+        return f"user:{request.user['id']}"
+    return by_ip(request)
+
+
+async def by_email(request: Request) -> Optional[str]:
+    '''Email from the form (OAuth2 "username") or JSON body, both already parsed and cached by FastAPI'''
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            value = (await request.json()).get("email")
+        except (ValueError, AttributeError):
+            return None
+    else:
+        value = (await request.form()).get("username")
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+class RateLimit:
+    '''
+        Route dependency, raises a 429 once `key` has used up the bucket:
+            dependencies=[Depends(RateLimit("login", config.RATE_LIMIT_LOGIN_IP))]
+        `key` returns what the limit is counted per, the client IP by default.
+        Requests it returns None for are not limited
+    '''
+    def __init__(self, name: str, rate: str,
+                 key: Callable[[Request], str | None | Awaitable[Optional[str]]] = by_ip):
+        self.name, self.rate, self.key = name, rate, key
+
+    async def __call__(self, request: Request):
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        key = self.key(request)
+        if inspect.isawaitable(key):
+            key = await key
+        if key is None:
+            return
+        retry_after = await take_token(self.name, self.rate, key)
+        if retry_after:
+            raise TooManyRequestsException(retry_after=retry_after)
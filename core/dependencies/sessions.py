@@ -1,18 +1,86 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request
+from sqlalchemy import create_engine, text, Insert, Update, Delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 from core.env import config
-  
-  
-engine = create_engine(  
+from core.helpers.db_pool import pool_options
+from core.helpers.read_your_writes import RecentWriters, create_store
+
+
+engine = create_engine(
     config.WRITER_DB_URL
-)  
+)
 
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-  
+
+# Async engines used by the request handlers, the sync engine above is kept
+# for alembic and scripts
+async_engine = create_async_engine(
+    config.ASYNC_WRITER_DB_URL, **pool_options()
+)
+
+if config.ASYNC_READER_DB_URL == config.ASYNC_WRITER_DB_URL:
+    # no replica configured, don't open a second pool against the primary
+    async_reader_engine = async_engine
+else:
+    async_reader_engine = create_async_engine(
+        config.ASYNC_READER_DB_URL, **pool_options()
+    )
+
+# user ids that committed a write recently, their reads stay on the primary
+# until the replica has caught up. Shared between workers with a redis:// store
+recent_writers = RecentWriters(create_store(config.READ_YOUR_WRITES_STORE_URL,
+                                            float(config.READ_YOUR_WRITES_SECONDS)))
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    '''
+        Picks the engine per statement:
+        - flushes and INSERT/UPDATE/DELETE always go to the writer
+        - reads go to the reader when the request allowed it (info["use_reader"])
+        - once the session has written, everything after goes to the writer
+    '''
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info["wrote"] = True
+            return async_engine.sync_engine
+        if self.info.get("use_reader") and not self.info.get("wrote"):
+            return async_reader_engine.sync_engine
+        return async_engine.sync_engine
+
+
+class RoutingAsyncSession(AsyncSession):
+    async def commit(self) -> None:
+        await super().commit()
+        # inside the handler's commit, so the window is open before the
+        # response goes out
+        info = self.sync_session.info
+        if info.get("wrote") and info.get("user_id") and async_reader_engine is not async_engine:
+            await recent_writers.add(info["user_id"])
+
+
+AsyncSessionLocal = async_sessionmaker(
+    sync_session_class=RoutingSession, class_=RoutingAsyncSession,
+    autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+def pool_stats() -> dict:
+    stats = {"writer": async_engine.pool.stats()}
+    if async_reader_engine is not async_engine:
+        stats["reader"] = async_reader_engine.pool.stats()
+    return stats
+
+
+async def ping_db() -> None:
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -21,3 +89,29 @@ def get_db():
         db.rollback()
     finally:
         db.close()
+
+
+def use_writer(db: AsyncSession) -> bool:
+    '''
+        Pins the rest of the session to the primary.
+        Returns False if it was already reading from the primary
+    '''
+    was_on_reader = bool(db.sync_session.info.get("use_reader"))
+    db.sync_session.info["use_reader"] = False
+    return was_on_reader
+
+
+async def get_async_db(request: Request):
+    db = AsyncSessionLocal()
+    # request.user is the decoded token set by AuthBackend, None when anonymous
+    user_id = request.user.get("id") if request.user else None
+    db.sync_session.info["user_id"] = user_id
+    db.sync_session.info["use_reader"] = (request.method in READ_METHODS and async_reader_engine is not async_engine
+                                          and not (user_id and await recent_writers.contains(user_id)))
+    try:
+        yield db
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
@@ -15,10 +15,63 @@ class Config(BaseSettings):
     POSTGRES_USER : str | None = os.environ.get("POSTGRES_USER")
     POSTGRES_PASSWORD:str | None = os.environ.get("POSTGRES_PASSWORD")
     POSTGRES_SERVER : str | None= os.environ.get("POSTGRES_SERVER")
+    POSTGRES_READER_SERVER : str | None= os.environ.get("POSTGRES_READER_SERVER", POSTGRES_SERVER) # read replica, defaults to the primary
     POSTGRES_PORT : int | None = os.environ.get("POSTGRES_PORT",5432) # default postgres port is 5432
     POSTGRES_DB : str | None = os.environ.get("POSTGRES_DATABASE")
     WRITER_DB_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
-    READER_DB_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    READER_DB_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_READER_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    ASYNC_WRITER_DB_URL: str = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    ASYNC_READER_DB_URL: str = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_READER_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    # seconds a user keeps reading from the primary after they commit a write
+    READ_YOUR_WRITES_SECONDS: int = os.environ.get("READ_YOUR_WRITES_SECONDS", 5)
+    READ_YOUR_WRITES_STORE_URL: str = os.environ.get("READ_YOUR_WRITES_STORE_URL", "memory://") # single worker only, redis://host:6379/0 when running several workers with a replica
+    # connection pool, applied to the writer and reader engines
+    DB_POOL_SIZE: int = os.environ.get("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW: int = os.environ.get("DB_MAX_OVERFLOW", 10)
+    DB_POOL_TIMEOUT: float = os.environ.get("DB_POOL_TIMEOUT", 30) # seconds to wait for a checkout
+    DB_POOL_RECYCLE: int = os.environ.get("DB_POOL_RECYCLE", 1800) # seconds, -1 disables
+    DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", True)
+    # list totals on tables bigger than this are planner estimates, not exact counts
+    COUNT_ESTIMATE_THRESHOLD: int = os.environ.get("COUNT_ESTIMATE_THRESHOLD", 100000)
+    # production server (gunicorn_conf.py), workers default to one per available core
+    WEB_CONCURRENCY: int | None = os.environ.get("WEB_CONCURRENCY")
+    WORKER_MAX_REQUESTS: int = os.environ.get("WORKER_MAX_REQUESTS", 5000) # recycle a worker after this many requests, 0 disables
+    WORKER_MAX_REQUESTS_JITTER: int = os.environ.get("WORKER_MAX_REQUESTS_JITTER", 500) # so workers don't all restart together
+    WORKER_TIMEOUT: int = os.environ.get("WORKER_TIMEOUT", 60) # seconds before a silent worker is killed
+    WORKER_GRACEFUL_TIMEOUT: int = os.environ.get("WORKER_GRACEFUL_TIMEOUT", 30) # seconds to finish in-flight requests
+    FORWARDED_ALLOW_IPS: str = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1") # the load balancer's IPs, comma separated, see gunicorn_conf.py
+    # cache of the user resolved from the access token, per worker
+    USER_CACHE_TTL: int = os.environ.get("USER_CACHE_TTL", 60) # seconds
+    USER_CACHE_SIZE: int = os.environ.get("USER_CACHE_SIZE", 10000)
+    BCRYPT_ROUNDS: int = os.environ.get("BCRYPT_ROUNDS", 12) # cost factor, older hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = os.environ.get("PASSWORD_HASH_WORKERS", 2) # threads per worker process hashing passwords
+    PASSWORD_HASH_MAX_QUEUE: int = os.environ.get("PASSWORD_HASH_MAX_QUEUE", 64) # waiting hashes before new ones get a 503
+    TOKEN_CACHE_SIZE: int = os.environ.get("TOKEN_CACHE_SIZE", 10000) # verified access tokens kept per worker
+    REVOCATION_STORE_URL: str = os.environ.get("REVOCATION_STORE_URL", "memory://") # redis://host:6379/0 when running several workers
+    REVOCATION_REFRESH_SECONDS: float = os.environ.get("REVOCATION_REFRESH_SECONDS", 5) # how long a logout on another worker can go unseen
+    REVOCATION_FILTER_CAPACITY: int = os.environ.get("REVOCATION_FILTER_CAPACITY", 100000)
+    RATE_LIMIT_ENABLED: bool = os.environ.get("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT_STORE_URL: str = os.environ.get("RATE_LIMIT_STORE_URL", "memory://") # redis://host:6379/0 to share buckets between workers
+    RATE_LIMIT_MAX_KEYS: int = os.environ.get("RATE_LIMIT_MAX_KEYS", 100000) # buckets kept by the memory store
+    RATE_LIMIT_STORE_TIMEOUT: float = os.environ.get("RATE_LIMIT_STORE_TIMEOUT", 0.5) # seconds, a slower store lets the request through
+    # "<requests>/<second|minute|hour|day>", a burst of <requests> then spread over the period
+    RATE_LIMIT_LOGIN_IP: str = os.environ.get("RATE_LIMIT_LOGIN_IP", "30/minute")
+    RATE_LIMIT_LOGIN_EMAIL: str = os.environ.get("RATE_LIMIT_LOGIN_EMAIL", "10/minute")
+    RATE_LIMIT_SIGNUP_IP: str = os.environ.get("RATE_LIMIT_SIGNUP_IP", "10/hour")
+    RATE_LIMIT_RESET_IP: str = os.environ.get("RATE_LIMIT_RESET_IP", "10/hour")
+    RATE_LIMIT_RESET_EMAIL: str = os.environ.get("RATE_LIMIT_RESET_EMAIL", "3/hour")
+    RATE_LIMIT_APPLY_USER: str = os.environ.get("RATE_LIMIT_APPLY_USER", "30/minute")
+    REVOCATION_FILTER_ERROR_RATE: float = os.environ.get("REVOCATION_FILTER_ERROR_RATE", 0.001)
+    JOB_FACETS_CACHE_TTL: int = os.environ.get("JOB_FACETS_CACHE_TTL", 30) # seconds facet counts are reused for the same filters
+    JOB_FEED_CACHE_TTL: int = os.environ.get("JOB_FEED_CACHE_TTL", 60) # seconds, also how long a job change on another worker can go unseen without JOB_FEED_EVENTS_URL
+    JOB_FEED_CACHE_SIZE: int = os.environ.get("JOB_FEED_CACHE_SIZE", 2048) # feed pages kept per worker
+    JOB_FEED_EVENTS_URL: str = os.environ.get("JOB_FEED_EVENTS_URL", "memory://") # redis://host:6379/0 so a job write drops the feed pages of every worker
+    RECOMMENDER_SYNC_SECONDS: float = os.environ.get("RECOMMENDER_SYNC_SECONDS", 10) # how long a job changed on another worker can go unrecommended
+    RECOMMENDER_REBUILD_SECONDS: float = os.environ.get("RECOMMENDER_REBUILD_SECONDS", 3600) # full rebuild of the recommendation index, drops deleted jobs
+    JOB_LIFECYCLE_INTERVAL: float = os.environ.get("JOB_LIFECYCLE_INTERVAL", 60) # seconds between expired job sweeps, 0 disables
+    JOB_LIFECYCLE_BATCH: int = os.environ.get("JOB_LIFECYCLE_BATCH", 1000) # jobs closed per UPDATE
+    JOB_IMPORT_MAX_ROWS: int = os.environ.get("JOB_IMPORT_MAX_ROWS", 10000) # rows per bulk import upload
+    JOB_IMPORT_BATCH_SIZE: int = os.environ.get("JOB_IMPORT_BATCH_SIZE", 500) # rows per INSERT
     JWT_SECRET_KEY: str | None = os.environ.get("SECRET_KEY")
     JWT_ALGORITHM: str | None = os.environ.get("JWT_ALGORITHM")
     JWT_PRIVATE_KEY: str | None = os.environ.get("JWT_PRIVATE_KEY")
@@ -5,11 +5,14 @@ from .base import (
     ForbiddenException,
     UnprocessableEntity,
     DuplicateValueException,
-    UnauthorizedException
+    UnauthorizedException,
+    ServiceUnavailableException,
+    TooManyRequestsException
 )
 from .auth import (
     DecodeTokenException, 
     ExpiredTokenException,
+    RevokedTokenException,
     PasswordDoesNotMatchException,
     DuplicateEmailException,
     UserNotFoundException,
@@ -26,8 +29,11 @@ __all__ = [
     "UnprocessableEntity",
     "DuplicateValueException",
     "UnauthorizedException",
+    "ServiceUnavailableException",
+    "TooManyRequestsException",
     "DecodeTokenException",
     "ExpiredTokenException",
+    "RevokedTokenException",
     "PasswordDoesNotMatchException",
     "DuplicateEmailException",
     "UserNotFoundException",
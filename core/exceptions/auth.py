@@ -12,6 +12,11 @@ class ExpiredTokenException(CustomException):
     error_code = "TOKEN__EXPIRE_TOKEN"
     message = "Expired token"
 
+class RevokedTokenException(CustomException):
+    code = 401
+    error_code = "TOKEN__REVOKED"
+    message = "Token has been revoked, please log in again"
+
 class PasswordDoesNotMatchException(CustomException):
     code = 401
     error_code = "USER__PASSWORD_DOES_NOT_MATCH"
@@ -47,3 +47,19 @@ class DuplicateValueException(CustomException):
     code = HTTPStatus.CONFLICT
     error_code = HTTPStatus.CONFLICT
     message = HTTPStatus.CONFLICT.description
+
+
+class ServiceUnavailableException(CustomException):
+    code = HTTPStatus.SERVICE_UNAVAILABLE
+    error_code = HTTPStatus.SERVICE_UNAVAILABLE
+    message = HTTPStatus.SERVICE_UNAVAILABLE.description
+
+
+class TooManyRequestsException(CustomException):
+    code = HTTPStatus.TOO_MANY_REQUESTS
+    error_code = HTTPStatus.TOO_MANY_REQUESTS
+    message = "Too many requests, try again later"
+
+    def __init__(self, message=None, retry_after: int = 1):
+        super().__init__(message)
+        self.headers = {"Retry-After": str(retry_after)}
@@ -0,0 +1,24 @@
+from typing import List, Sequence
+
+from sqlalchemy import column, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def update_from_values(db: AsyncSession, model, rows: List[dict], columns: Sequence[str]) -> int:
+    '''
+        Updates many rows of `model` in one statement:
+            UPDATE table SET col = v.col, ... FROM (VALUES (...), (...)) AS v WHERE table.id = v.id
+        Each row needs "id" and every name in `columns`. Runs as plain SQL,
+        loaded instances are not refreshed. Returns the number of rows updated
+    '''
+    if not rows or not columns:
+        return 0
+
+    table = model.__table__
+    names = ["id", *columns]
+    changed = values(*[column(name, table.c[name].type) for name in names], name="changed").data(
+        [tuple(row[name] for name in names) for row in rows])
+
+    result = await db.execute(update(table).where(table.c.id == changed.c.id).values(
+        {name: changed.c[name] for name in columns}))
+    return result.rowcount
@@ -1,12 +1,9 @@
-import pandas as pd
 import re
 from core.exceptions import NotFoundException, BadRequestException
-from modules.assessments.repository import AssessmentRepository, QuestionRepository
+from modules.assessments.repository import QuestionRepository
 from modules.assessments.schemas import *
 from modules.assessments.models import *
 
-assessmentRepo = AssessmentRepository()
-questionRepo = QuestionRepository()
 CSV_HEADERS = [
     "Question",
     "A",
@@ -77,12 +74,14 @@ def check_truth(ans_list: List[dict], ans: str, quest: dict, cell: int, df):
         
         
         
-async def generate_questions(file: str, assessment_id: UUID): 
+async def generate_questions(file: str, assessment_id: UUID, questionRepo: QuestionRepository): 
     '''
         Questions are genrated by reading each row of the csv file and
         creating objects used to create question istances with the id
         of the assessment passed
     '''
+    import pandas as pd  # heavy import, only needed for uploads
+
     try:
         df = pd.read_csv(file, encoding='utf8')
     except:
@@ -178,8 +177,8 @@ async def generate_questions(file: str, assessment_id: UUID):
         assessment_questions["questions"].append(new_question)
         
     #Creating the question instances only after question and answer data has been collated with no errors
-    for question in assessment_questions["questions"]:
-        await questionRepo.create(CreateQuestionSchema(**question), assessment_id)
+    await questionRepo.bulk_create([CreateQuestionSchema(**question) for question in assessment_questions["questions"]],
+                                   assessment_id)
 
         
         
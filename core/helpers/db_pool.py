@@ -0,0 +1,99 @@
+import time
+from threading import Lock
+
+from greenlet import getcurrent
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.env import config
+
+
+# upper bounds in milliseconds, anything slower lands in the last bucket
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    '''
+        Queue pool that records how long each checkout waited and how many
+        checkouts timed out, so the pool can be sized against real traffic
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total = 0.0
+        self._waiting = set()
+
+    def _do_get(self):
+        # QueuePool._do_get calls itself again when it loses an overflow race,
+        # only the outermost call of each checkout is timed
+        waiter = getcurrent()
+        if waiter in self._waiting:
+            return super()._do_get()
+
+        self._waiting.add(waiter)
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        finally:
+            self._waiting.discard(waiter)
+        self._record_wait((time.perf_counter() - start) * 1000)
+        return connection
+
+    def _record_wait(self, waited_ms: float):
+        bucket = len(WAIT_BUCKETS_MS)
+        for index, upper in enumerate(WAIT_BUCKETS_MS):
+            if waited_ms <= upper:
+                bucket = index
+                break
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited_ms
+            self.wait_histogram[bucket] += 1
+
+    def recreate(self):
+        # engine.dispose() swaps the pool, carry the counters over
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.checkout_timeouts = self.checkout_timeouts
+        pool.wait_histogram = list(self.wait_histogram)
+        pool.wait_total = self.wait_total
+        return pool
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            histogram = list(self.wait_histogram)
+            checkouts = self.checkouts
+            wait_total = self.wait_total
+            timeouts = self.checkout_timeouts
+
+        labels = [f"<={upper}ms" for upper in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow_in_use": max(self.overflow(), 0),
+            "checkouts": checkouts,
+            "checkout_timeouts": timeouts,
+            "avg_wait_ms": round(wait_total / checkouts, 3) if checkouts else 0.0,
+            "wait_histogram_ms": dict(zip(labels, histogram)),
+        }
+
+
+def pool_options() -> dict:
+    '''Engine keyword arguments for the configured pool'''
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
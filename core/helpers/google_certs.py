@@ -0,0 +1,55 @@
+'''
+    Caching transport for Google ID token verification
+
+    google-auth downloads Google's signing certificates on every
+    verify_oauth2_token call. Google serves them with a Cache-Control
+    max-age of several hours, so CachingRequest keeps each GET response
+    for as long as it says and reuses one pooled session for the fetches.
+    A login then only costs the local signature check.
+'''
+import re
+import time
+
+import requests
+from google.auth import transport
+from google.auth.transport.requests import Request
+
+
+MAX_AGE = re.compile(r"max-age=(\d+)")
+# certificates are small, don't let a slow Google hold up a login for long
+FETCH_TIMEOUT = 10
+
+
+def cache_lifetime(headers) -> int:
+    '''Seconds a response may be reused for according to its Cache-Control and Age headers'''
+    cache_control = headers.get("Cache-Control", "") or headers.get("cache-control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    max_age = MAX_AGE.search(cache_control)
+    if max_age is None:
+        return 0
+    return max(int(max_age.group(1)) - int(headers.get("Age", 0) or 0), 0)
+
+
+class CachingRequest(transport.Request):
+    def __init__(self, inner: transport.Request = None):
+        self.inner = inner or Request(session=requests.Session())
+        # url -> (expires at, response)
+        self.cache = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=FETCH_TIMEOUT, **kwargs):
+        if method != "GET" or body is not None:
+            return self.inner(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        cached = self.cache.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return cached[1]
+
+        self.stats["misses"] += 1
+        response = self.inner(url, method=method, headers=headers, timeout=timeout, **kwargs)
+        lifetime = cache_lifetime(response.headers)
+        if response.status == 200 and lifetime:
+            self.cache[url] = (time.monotonic() + lifetime, response)
+        return response
@@ -0,0 +1,81 @@
+'''
+    Schema version checks
+
+    The app no longer creates tables when it starts: schema changes go
+    through `alembic upgrade head`, and startup only compares the database's
+    alembic revision with the head of migrations/. An empty database is
+    bootstrapped once with
+
+        python -m core.helpers.migrations
+'''
+import asyncio
+from functools import lru_cache
+from pathlib import Path
+
+from sqlalchemy import text
+
+from core.dependencies.logging import logger
+from core.dependencies.sessions import Base, async_engine, engine
+
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# filled in by check_db_revision at startup
+schema_status = {"head": [], "database": [], "up_to_date": False}
+_background_tasks = set()
+
+
+@lru_cache(maxsize=None)
+def head_revisions() -> tuple:
+    from alembic.script import ScriptDirectory
+
+    return tuple(sorted(ScriptDirectory(str(ROOT_DIR / "migrations")).get_heads()))
+
+
+async def database_revisions() -> tuple:
+    async with async_engine.connect() as conn:
+        if (await conn.execute(text("SELECT to_regclass('alembic_version')"))).scalar() is None:
+            return ()
+        rows = await conn.execute(text("SELECT version_num FROM alembic_version"))
+        return tuple(sorted(row.version_num for row in rows))
+
+
+async def check_db_revision() -> None:
+    '''Logs instead of failing so a worker can start before its migration has run'''
+    # loading the migration scripts takes a few hundred ms, keep it off the loop
+    head = await asyncio.to_thread(head_revisions)
+    try:
+        current = await database_revisions()
+    except Exception as err:
+        logger.error(f"Schema check skipped, database unreachable: {err}")
+        return
+
+    schema_status.update(head=list(head), database=list(current), up_to_date=current == head)
+    if not current:
+        logger.error("Database has no alembic revision, run `python -m core.helpers.migrations` on an empty database")
+    elif current != head:
+        logger.warning(f"Database is at revision {', '.join(current)}, code expects {', '.join(head)}. "
+                       "Run `alembic upgrade head`")
+
+
+async def start_db_revision_check() -> None:
+    '''Startup hook, the check runs in the background so it doesn't delay the first request'''
+    task = asyncio.create_task(check_db_revision())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def init_db() -> None:
+    '''Creates every table on an empty database and stamps it with the current head'''
+    from alembic import command
+    from alembic.config import Config
+
+    # register every model on Base.metadata
+    import modules.users.models, modules.jobs.models, modules.files.models, modules.assessments.models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+    command.stamp(Config(str(ROOT_DIR / "alembic.ini")), "head")
+
+
+if __name__ == "__main__":
+    init_db()
@@ -0,0 +1,171 @@
+'''
+    Keyset (cursor) pagination
+
+    Pages are read newest first on (created_at, id) by default. Instead of
+    skipping `offset` rows the next page starts after the last row served,
+    so a deep page costs the same as the first one. The cursor handed to
+    the client is an opaque base64 string of the last row's key values.
+
+    paginate_with_total also returns the size of the whole result in the
+    same statement (count(*) OVER ()). Tables above COUNT_ESTIMATE_THRESHOLD
+    rows report the planner's estimate instead of counting every match.
+'''
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Sequence
+from uuid import UUID
+
+from cachetools import TTLCache
+from sqlalchemy import Select, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from core.env import config
+from core.exceptions import BadRequestException
+
+
+# pg_class.reltuples per table, only used to pick between counting and
+# estimating so a few minutes of staleness is fine
+table_rows = TTLCache(maxsize=256, ttl=300)
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str] = None
+
+
+class CountedPage(NamedTuple):
+    items: list
+    next_cursor: Optional[str] = None
+    total_count: Optional[int] = None
+
+
+class Explain(Executable, ClauseElement):
+    '''EXPLAIN (FORMAT JSON) of a statement, the statement itself is not run'''
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_to_json(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [_from_json(key, value) for key, value in zip(keys, values)]
+    except (ValueError, TypeError, binascii.Error):
+        raise BadRequestException("Invalid pagination cursor")
+
+
+def _to_json(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _from_json(key, value: Any):
+    python_type = key.type.python_type
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def default_keys(query: Select) -> tuple:
+    entity = query.column_descriptions[0]["entity"]
+    return (entity.created_at, entity.id)
+
+
+def keyset_filter(query: Select, cursor: Optional[str], keys: Sequence) -> Select:
+    '''Restricts `query` to rows after `cursor` and orders it on `keys`, newest first'''
+    if cursor:
+        query = query.filter(tuple_(*keys) < tuple(decode_cursor(cursor, keys)))
+    return query.order_by(*[key.desc() for key in keys])
+
+
+def next_cursor_for(rows: list, limit: int, keys: Sequence) -> Optional[str]:
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor([getattr(last, key.key) for key in keys])
+
+
+def page_query(query: Select, limit: int, cursor: Optional[str], page: int, keys: Sequence) -> Select:
+    query = keyset_filter(query, cursor, keys)
+    if not cursor and page > 1:
+        query = query.offset((page - 1) * limit)
+    # one extra row tells us whether there is a next page
+    return query.limit(limit + 1)
+
+
+async def paginate(db: AsyncSession, query: Select, limit: int, cursor: Optional[str] = None,
+                   page: int = 1, keys: Optional[Sequence] = None) -> Page:
+    '''
+        Returns one page of `query` and the cursor for the page after it.
+        `page` is kept for clients that still send page numbers, it falls
+        back to an offset and is ignored once a cursor is sent.
+    '''
+    keys = keys or default_keys(query)
+    rows = (await db.execute(page_query(query, limit, cursor, page, keys))).scalars().all()
+    return Page(list(rows[:limit]), next_cursor_for(rows, limit, keys))
+
+
+async def estimate_rows(db: AsyncSession, table: str) -> int:
+    if table not in table_rows:
+        reltuples = (await db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                                      {"table": table})).scalar()
+        # -1 means the table was never analyzed
+        table_rows[table] = max(reltuples or 0, 0)
+    return table_rows[table]
+
+
+async def estimate_count(db: AsyncSession, query: Select) -> int:
+    '''Planner estimate of the number of rows `query` returns'''
+    plan = (await db.execute(Explain(query))).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def paginate_with_total(db: AsyncSession, query: Select, limit: int, cursor: Optional[str] = None,
+                              page: int = 1, keys: Optional[Sequence] = None) -> CountedPage:
+    '''
+        paginate() plus the total number of rows matching `query`, fetched
+        in the same statement. Relationships on `query` must be many-to-one,
+        a collection join would multiply the counted rows.
+    '''
+    keys = keys or default_keys(query)
+    table = query.column_descriptions[0]["entity"].__tablename__
+    if await estimate_rows(db, table) > config.COUNT_ESTIMATE_THRESHOLD:
+        items, next_cursor = await paginate(db, query, limit, cursor=cursor, page=page, keys=keys)
+        return CountedPage(items, next_cursor, await estimate_count(db, query))
+
+    if cursor or page > 1:
+        # the window would only see rows past the cursor/offset, count the
+        # whole query in a subquery the planner runs once
+        total = select(func.count()).select_from(query.order_by(None).subquery()).scalar_subquery()
+    else:
+        total = func.count().over()
+    counted = page_query(query, limit, cursor, page, keys).add_columns(total.label("total_count"))
+    rows = (await db.execute(counted)).all()
+
+    items = [row[0] for row in rows]
+    # an empty page past the end has no row to read the total from
+    total_count = rows[0].total_count if rows else (None if cursor or page > 1 else 0)
+    return CountedPage(items[:limit], next_cursor_for(items, limit, keys), total_count)
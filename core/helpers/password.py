@@ -1,10 +1,57 @@
+'''
+    Password hashing
+
+    bcrypt is deliberately slow, so it runs on a small thread pool of its own
+    instead of the event loop (bcrypt releases the GIL while hashing). The
+    pool is bounded: past PASSWORD_HASH_MAX_QUEUE waiting calls new ones are
+    refused with a 503 rather than queueing up behind a login burst.
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.hash import bcrypt
 
+from core.env import config
+from core.exceptions import ServiceUnavailableException
+
+
+# hashes made with another cost factor still verify, needs_rehash flags them
+hasher = bcrypt.using(rounds=int(config.BCRYPT_ROUNDS),
+                      min_desired_rounds=int(config.BCRYPT_ROUNDS),
+                      max_desired_rounds=int(config.BCRYPT_ROUNDS))
+
+hash_executor = ThreadPoolExecutor(max_workers=int(config.PASSWORD_HASH_WORKERS), thread_name_prefix="bcrypt")
+# only touched from the event loop thread
+hash_stats = {"in_flight": 0, "rejected": 0}
+
+
+async def _run(func, *args):
+    workers = int(config.PASSWORD_HASH_WORKERS)
+    if hash_stats["in_flight"] >= workers + int(config.PASSWORD_HASH_MAX_QUEUE):
+        hash_stats["rejected"] += 1
+        raise ServiceUnavailableException("Too many password checks in progress, try again shortly")
+
+    hash_stats["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        hash_stats["in_flight"] -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hasher.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run(hasher.verify, password, hashed_password)
 
-def hash_password(password: str):
-    return bcrypt.hash(password)
 
+def needs_rehash(hashed_password: str) -> bool:
+    '''True when the hash was made with a different BCRYPT_ROUNDS, cheap, only parses the hash'''
+    return hasher.needs_update(hashed_password)
 
-def verify_password(password: str, hashed_password: str):
-    return bcrypt.verify(password, hashed_password)
 
+def stats() -> dict:
+    workers, in_flight = int(config.PASSWORD_HASH_WORKERS), hash_stats["in_flight"]
+    return {"workers": workers, "running": min(in_flight, workers), "queued": max(in_flight - workers, 0),
+            "rejected": hash_stats["rejected"]}
@@ -0,0 +1,104 @@
+'''
+    Token bucket rate limits
+
+    A limit like "5/minute" is a bucket of 5 tokens refilled at 5 per
+    minute: bursts up to 5 are allowed, then one request every 12 seconds.
+    Each (limit, key) pair has its own bucket, the key being the client IP,
+    the email in the request or the user id.
+
+    Buckets live in RATE_LIMIT_STORE_URL:
+    - memory://     per worker, a client can use each worker's full bucket
+    - redis://...   shared, the bucket is updated atomically by a script
+'''
+import asyncio
+import math
+import time
+from typing import Tuple
+from urllib.parse import urlparse
+
+from cachetools import TLRUCache
+
+from core.dependencies.logging import logger
+from core.env import config
+from core.helpers.resp import RespClient
+
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    '''"10/minute" -> (capacity 10, refill 10/60 tokens a second)'''
+    count, period = rate.split("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip().rstrip("s")]
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int):
+        # a bucket is forgotten once it would be full again
+        self.buckets = TLRUCache(maxsize=max_keys, ttu=lambda _key, bucket, _now: bucket[2], timer=time.time)
+
+    async def take(self, key: str, capacity: int, refill: float) -> float:
+        '''Takes a token, returns 0 or the seconds until one is available'''
+        now = time.time()
+        tokens, updated, _ = self.buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / refill
+        self.buckets[key] = (tokens, now, now + (capacity - tokens) / refill)
+        return wait
+
+
+class RedisBucketStore:
+    # same steps as MemoryBucketStore.take, run inside Redis so workers can't race
+    SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, refill, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / refill end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / refill * 1000) + 1000)
+return tostring(wait)
+"""
+
+    def __init__(self, url: str):
+        self.client = RespClient(url)
+
+    async def take(self, key: str, capacity: int, refill: float) -> float:
+        return float(await self.client.execute("EVAL", self.SCRIPT, 1, f"rate_limit:{key}", capacity, refill, time.time()))
+
+
+def create_store(url: str):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBucketStore(int(config.RATE_LIMIT_MAX_KEYS))
+    if scheme in ("redis", "rediss"):
+        return RedisBucketStore(url)
+    raise ValueError(f"Unsupported rate limit store: {url}")
+
+
+bucket_store = create_store(config.RATE_LIMIT_STORE_URL)
+# allowed/limited requests per limit name
+rate_limit_stats = {}
+
+
+async def take_token(name: str, rate: str, key: str) -> int:
+    '''Returns 0 when the request may go ahead, else the Retry-After seconds'''
+    capacity, refill = parse_rate(rate)
+    stats = rate_limit_stats.setdefault(name, {"allowed": 0, "limited": 0, "errors": 0})
+    try:
+        wait = await asyncio.wait_for(bucket_store.take(f"{name}:{key}", capacity, refill),
+                                      timeout=float(config.RATE_LIMIT_STORE_TIMEOUT))
+    except Exception as err:
+        # fail open, a store outage shouldn't take logins and signups down with it
+        stats["errors"] += 1
+        logger.error(f"Rate limit store unavailable, {name} not enforced: {err}")
+        return 0
+    stats["limited" if wait else "allowed"] += 1
+    return math.ceil(wait)
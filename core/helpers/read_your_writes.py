@@ -0,0 +1,79 @@
+'''
+    Read-your-writes window
+
+    A user who just committed a write reads from the primary for
+    READ_YOUR_WRITES_SECONDS, until the replica has caught up. Only the
+    user id is kept, the window is the key's lifetime.
+
+    The users are kept in READ_YOUR_WRITES_STORE_URL:
+    - memory://     per worker, only right with a single worker. With
+                    several a user's next request can land on another
+                    worker and read the replica before it caught up, so
+                    gunicorn_conf.py refuses to start more than one worker
+                    on it while a replica is configured
+    - redis://...   shared by every worker, one expiring key per user
+'''
+from urllib.parse import urlparse
+
+from cachetools import TTLCache
+
+from core.dependencies.logging import logger
+from core.helpers.resp import RespClient
+
+
+class MemoryWriterStore:
+    def __init__(self, seconds: float):
+        self.users = TTLCache(maxsize=10000, ttl=seconds)
+
+    async def add(self, user_id: str) -> None:
+        self.users[user_id] = True
+
+    async def contains(self, user_id: str) -> bool:
+        return user_id in self.users
+
+
+class RedisWriterStore:
+    def __init__(self, url: str, seconds: float):
+        self.client = RespClient(url)
+        self.milliseconds = int(seconds * 1000)
+
+    async def add(self, user_id: str) -> None:
+        await self.client.execute("SET", f"recent_writer:{user_id}", 1, "PX", self.milliseconds)
+
+    async def contains(self, user_id: str) -> bool:
+        return bool(await self.client.execute("EXISTS", f"recent_writer:{user_id}"))
+
+
+class RecentWriters:
+    def __init__(self, store):
+        self.store = store
+        self.stats = {"writes": 0, "primary_reads": 0, "errors": 0}
+
+    async def add(self, user_id: str) -> None:
+        self.stats["writes"] += 1
+        try:
+            await self.store.add(user_id)
+        except Exception as err:
+            # the write is committed, only the next reads may miss it
+            self.stats["errors"] += 1
+            logger.error(f"Could not open the read-your-writes window: {err}")
+
+    async def contains(self, user_id: str) -> bool:
+        try:
+            recent = await self.store.contains(user_id)
+        except Exception as err:
+            # unknown, the primary is always up to date
+            self.stats["errors"] += 1
+            logger.error(f"Could not check the read-your-writes window: {err}")
+            recent = True
+        self.stats["primary_reads"] += recent
+        return recent
+
+
+def create_store(url: str, seconds: float):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryWriterStore(seconds)
+    if scheme in ("redis", "rediss"):
+        return RedisWriterStore(url, seconds)
+    raise ValueError(f"Unsupported read-your-writes store: {url}")
@@ -0,0 +1,76 @@
+'''
+    Minimal Redis client
+
+    Just enough RESP to send commands and read their replies, so the shared
+    stores (token revocation, rate limits) don't need a Redis library.
+    Works with Redis and anything that speaks its protocol.
+
+        redis://[:password@]host:port/db
+'''
+import asyncio
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+
+class RespClient:
+    '''One connection per worker, commands are serialised'''
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname or "localhost", parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self._streams: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self._streams = reader, writer
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    async def _send(self, *args):
+        reader, writer = self._streams
+        command = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            arg = str(arg).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        writer.write(b"".join(command))
+        await writer.drain()
+        return await self._read(reader)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        line = (await reader.readline()).rstrip(b"\r\n")
+        if not line:
+            raise ConnectionError("Redis closed the connection")
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            return None if length < 0 else (await reader.readexactly(length + 2))[:-2].decode()
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [await self._read(reader) for _ in range(length)]
+        raise RuntimeError(f"Unexpected reply from Redis: {line!r}")
+
+    async def execute(self, *args):
+        async with self._lock:
+            try:
+                if self._streams is None:
+                    await self._connect()
+                return await self._send(*args)
+            except BaseException:
+                # drop the connection, the next command reconnects. Also
+                # when cancelled (timeouts), the reply would be read as the
+                # next command's
+                if self._streams is not None:
+                    self._streams[1].close()
+                self._streams = None
+                raise
@@ -0,0 +1,158 @@
+'''
+    Revoked access tokens
+
+    Logged out tokens are stored by their jti until their own exp, after
+    which they'd be rejected anyway and are dropped. Every authenticated
+    request asks whether its token was revoked, so the answer comes from a
+    Bloom filter held in the worker first: a miss (the common case) means
+    "not revoked" without any I/O, and only a possible hit is confirmed
+    against the store.
+
+    The store is picked by REVOCATION_STORE_URL:
+    - memory://                 a dict in the process, for a single worker
+    - redis://[:password@]host:port/db
+                                a sorted set of jti scored by exp, shared by
+                                every worker. Speaks plain RESP, so anything
+                                that serves ZADD/ZSCORE/ZRANGEBYSCORE/
+                                ZREMRANGEBYSCORE will do.
+    Workers rebuild their filter from the store every
+    REVOCATION_REFRESH_SECONDS, a logout done on another worker is seen
+    within that window.
+'''
+import asyncio
+import hashlib
+import math
+import time
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from core.dependencies.logging import logger
+from core.env import config
+from core.helpers.resp import RespClient
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # double hashing, two 64 bit halves of one digest give every position
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class MemoryStore:
+    def __init__(self):
+        self.entries = {}
+
+    async def add(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        self.entries = {key: exp for key, exp in self.entries.items() if exp > now}
+        self.entries[jti] = expires_at
+
+    async def contains(self, jti: str) -> bool:
+        return self.entries.get(jti, 0) > time.time()
+
+    async def active(self) -> List[str]:
+        now = time.time()
+        return [key for key, exp in self.entries.items() if exp > now]
+
+
+class RedisStore:
+    KEY = "revoked_tokens"
+
+    def __init__(self, url: str):
+        self.client = RespClient(url)
+
+    async def execute(self, *args):
+        return await self.client.execute(*args)
+
+    async def add(self, jti: str, expires_at: float) -> None:
+        await self.execute("ZREMRANGEBYSCORE", self.KEY, "-inf", time.time())
+        await self.execute("ZADD", self.KEY, expires_at, jti)
+
+    async def contains(self, jti: str) -> bool:
+        score = await self.execute("ZSCORE", self.KEY, jti)
+        return score is not None and float(score) > time.time()
+
+    async def active(self) -> List[str]:
+        return await self.execute("ZRANGEBYSCORE", self.KEY, f"({time.time()}", "+inf")
+
+
+class RevocationList:
+    def __init__(self, store, capacity: int, error_rate: float, refresh_seconds: float):
+        self.store = store
+        self.capacity, self.error_rate = capacity, error_rate
+        self.refresh_seconds = refresh_seconds
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.stats = {"checks": 0, "filter_hits": 0, "revoked": 0}
+        self._refreshed_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        # revoked here since the last refresh, re-added to a rebuilt filter in
+        # case the store was read before they were written
+        self._pending: List[str] = []
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        self._pending.append(jti)
+        self.bloom.add(jti)
+        await self.store.add(jti, expires_at)
+
+    async def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            # issued before tokens carried a jti
+            return False
+        self.stats["checks"] += 1
+        self.schedule_refresh()
+        if jti not in self.bloom:
+            return False
+        self.stats["filter_hits"] += 1
+        revoked = await self.store.contains(jti)
+        self.stats["revoked"] += revoked
+        return revoked
+
+    def schedule_refresh(self) -> None:
+        '''Rebuilds the filter in the background, requests keep using the current one meanwhile'''
+        if time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshed_at = time.monotonic()
+            self._refreshing = asyncio.create_task(self.refresh())
+
+    async def refresh(self) -> None:
+        pending = len(self._pending)
+        try:
+            active = await self.store.active()
+        except Exception as err:
+            logger.error(f"Could not refresh the token revocation filter: {err}")
+            return
+        # expired entries are left out, so the filter never fills up with them
+        bloom = BloomFilter(max(self.capacity, 2 * len(active)), self.error_rate)
+        for jti in [*active, *self._pending]:
+            bloom.add(jti)
+        self.bloom = bloom
+        del self._pending[:pending]
+
+
+def create_store(url: str):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryStore()
+    if scheme in ("redis", "rediss"):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported revocation store: {url}")
+
+
+revocation_list = RevocationList(create_store(config.REVOCATION_STORE_URL),
+                                 capacity=int(config.REVOCATION_FILTER_CAPACITY),
+                                 error_rate=float(config.REVOCATION_FILTER_ERROR_RATE),
+                                 refresh_seconds=float(config.REVOCATION_REFRESH_SECONDS))
@@ -1,20 +1,25 @@
-import boto3  # pip install boto3
-from botocore.client import Config
-
+from functools import lru_cache
 
 from core.env import config
 from core.exceptions.base import BadRequestException
 from modules.files.models import FileType
 
 
-session = boto3.Session(
-    aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-    region_name=config.AWS_S3_REGION
-)
+@lru_cache(maxsize=None)
+def get_s3_client():
+    # boto3 takes a while to import and build a client, only pay for it
+    # on the first upload instead of at startup
+    import boto3  # pip install boto3
+    from botocore.client import Config
+
+    session = boto3.Session(
+        aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+        region_name=config.AWS_S3_REGION
+    )
 
-# Let's use Amazon S3
-s3Client = session.client('s3', config=Config(signature_version='s3v4'))
+    # Let's use Amazon S3
+    return session.client('s3', config=Config(signature_version='s3v4'))
 
 # bucket = s3Client.Bucket(config.AWS_S3_BUCKET)
 
@@ -47,7 +52,7 @@ async def upload_files(contents: bytes, key: str, type: FileType):
             folder = config.AWS_S3_FOLDER_ASSESSMENT
 
         file_name = folder + '/' + key
-        s3Client.put_object(Bucket=config.AWS_S3_BUCKET, Key=file_name, Body=contents, ACL='public-read')
+        get_s3_client().put_object(Bucket=config.AWS_S3_BUCKET, Key=file_name, Body=contents, ACL='public-read')
         return await generate_presigned_url(file_name)
     except Exception as err:
         raise BadRequestException(f'Error uploading file: {err}')
@@ -19,6 +19,7 @@ class CustomListResponse(BaseModel, Generic[DataT]):
     count: Optional[int] = None
     total_count: Optional[int] =None
     next_page: Optional[int] = None
+    next_cursor: Optional[str] = None
     data: Optional[List[DataT]] = None
 
 # Mailing Schemas
@@ -1,7 +1,20 @@
+import re
+from typing import Optional
+
 from slugify import slugify
 
 
 def to_slug(value: str):
     if value:
         return slugify(value, max_length=15, word_boundary=True, 
-                    separator=".", stopwords=['the', 'and', 'of'])
\ No newline at end of file
+                    separator=".", stopwords=['the', 'and', 'of'])
+
+
+def to_prefix_tsquery(value: str, max_terms: int = 8) -> Optional[str]:
+    '''
+        Free text to a to_tsquery() string matching every word as a prefix:
+        "python dev" -> "python:* & dev:*". Anything but letters and digits
+        is dropped, so user input can't inject tsquery operators
+    '''
+    words = re.findall(r"\w+", (value or "").lower())[:max_terms]
+    return " & ".join(f"{word}:*" for word in words) or None
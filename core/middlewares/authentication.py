@@ -9,6 +9,7 @@ from starlette.middleware.authentication import (
 from starlette.requests import HTTPConnection
 
 from core.env import config
+from core.helpers.revocation import revocation_list
 from modules.users.schemas import BaseUser
 
 '''
@@ -34,11 +35,13 @@ class AuthBackend(AuthenticationBackend):
             return False, current_user
 
         try:
-            current_user: BaseUser = TokenHelper.decode(
+            current_user: BaseUser = TokenHelper.verify(
                 credentials
             )
         except jwt.exceptions.PyJWTError:
             return False, current_user
+        if await revocation_list.is_revoked(current_user.get("jti")):
+            return False, None
         return True, current_user
 
 
@@ -1,10 +1,26 @@
+import asyncio
+import os
 import time
+from typing import Annotated
+
 from fastapi import APIRouter, Response, Depends
 from core.dependencies import PermissionDependency, AllowAll
+from core.dependencies.auth import get_current_user, token_cache, token_cache_stats
+from core.dependencies.sessions import ping_db, pool_stats, recent_writers
+from core.exceptions import ForbiddenException, ServiceUnavailableException
+from core.helpers import password
+from core.helpers.rate_limit import rate_limit_stats
+from core.helpers.revocation import revocation_list
+from core.helpers.migrations import schema_status
 from modules.auth.services import router as auth_router
 from modules.users.services import router as user_router
 from modules.jobs.services import router as jobs_router
+from modules.jobs.lifecycle import job_lifecycle
+from modules.jobs.recommender import job_index
+from modules.jobs.repository import feed_cache, feed_cache_stats, feed_events
 from modules.files.services import router as files_router
+from modules.users.models import UserType
+from modules.users.schemas import BaseUser
 from modules.assessments.services import router as assessment_router
 
 router = APIRouter(
@@ -22,6 +38,38 @@ async def health_check():
     "entities":[]
 }
 
+# Readiness of the worker that serves the probe: uvicorn only accepts
+# requests once the app's startup has run, so this just checks the database
+@router.get("/health/ready", dependencies=[Depends(PermissionDependency([AllowAll]))], tags=["Health-Check"])
+async def readiness_check():
+    try:
+        await asyncio.wait_for(ping_db(), timeout=2)
+    except Exception:
+        raise ServiceUnavailableException("Database unreachable")
+    return {
+    "status":"Ready",
+    "worker": os.getpid(),
+}
+
+# Runtime statistics used to size the service against real traffic. They
+# describe the internals (pools, caches, limits), admins only
+@router.get("/health/stats", tags=["Health-Check"])
+async def health_stats(current_user: Annotated[BaseUser, Depends(get_current_user)]):
+    if current_user.role != UserType.ADMIN:
+        raise ForbiddenException("Only admins can read the service statistics")
+    return {
+    "db_pool": pool_stats(),
+    "read_your_writes": recent_writers.stats,
+    "schema": schema_status,
+    "password_hashing": password.stats(),
+    "token_cache": {**token_cache_stats, "size": len(token_cache)},
+    "token_revocation": revocation_list.stats,
+    "rate_limits": rate_limit_stats,
+    "job_recommendations": job_index.info(),
+    "job_feed_cache": {**feed_cache_stats, "size": len(feed_cache), "events": feed_events.stats},
+    "job_lifecycle": job_lifecycle.stats,
+}
+
 router.include_router(user_router)
 router.include_router(auth_router)
 router.include_router(jobs_router)
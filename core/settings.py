@@ -16,7 +16,7 @@ from sentry_sdk.integrations.fastapi import FastApiIntegration
 from core.router import router
 from core.env import config
 from core.exceptions import CustomException
-from core.dependencies import Logging, engine, Base
+from core.dependencies import Logging
 from core.middlewares import (
     AuthenticationMiddleware,
     AuthBackend,
@@ -26,10 +26,23 @@ from core.middlewares import (
 # from core.helpers.cache import Cache, RedisBackend, CustomKeyMaker
 from core.exceptions.handler import http_exception_handler, request_validation_exception_handler, unhandled_exception_handler
 from core.middlewares.response_log import log_request_middleware
+from core.helpers.migrations import start_db_revision_check
+from core.helpers.revocation import revocation_list
+from modules.jobs.lifecycle import job_lifecycle
 
 
 def init_db(app_: FastAPI) -> None:
-    Base.metadata.create_all(bind=engine, checkfirst=True)
+    # tables are managed by alembic, startup only checks the revision
+    app_.add_event_handler("startup", start_db_revision_check)
+
+def init_auth(app_: FastAPI) -> None:
+    # load tokens revoked by other workers, in the background like the schema check
+    app_.add_event_handler("startup", revocation_list.schedule_refresh)
+
+def init_jobs(app_: FastAPI) -> None:
+    # every worker sweeps expired jobs, SKIP LOCKED keeps them apart
+    app_.add_event_handler("startup", job_lifecycle.start)
+    app_.add_event_handler("shutdown", job_lifecycle.stop)
 
 def init_routers(app_: FastAPI) -> None:
     app_.include_router(router)
@@ -42,6 +55,7 @@ def init_listeners(app_: FastAPI) -> None:
         return JSONResponse(
             status_code=exc.code,
             content={"error_code": exc.error_code, "message": exc.message},
+            headers=getattr(exc, "headers", None),
         )
 
 
@@ -86,20 +100,22 @@ def init_exception_handlers(app_: FastAPI) -> None:
 #     Cache.init(backend=RedisBackend(), key_maker=CustomKeyMaker())
 
 
-# Sentry bug tracking
-sentry_sdk.init(
-    dsn=config.SENTRY_DSN,
-    traces_sample_rate= 0.5 if config.ENV == "production" else 1.0,
-    integrations=[StarletteIntegration(
-                        transaction_style="endpoint"
-                    ),
-                  FastApiIntegration(
-                        transaction_style="endpoint"
-                    ),
-                ],
-    enable_tracing=True,
-    environment=config.ENV,
-)
+# Sentry bug tracking, skipped without a DSN: init loads every auto
+# enabled integration (botocore among them) even though nothing is sent
+if config.SENTRY_DSN:
+    sentry_sdk.init(
+        dsn=config.SENTRY_DSN,
+        traces_sample_rate= 0.5 if config.ENV == "production" else 1.0,
+        integrations=[StarletteIntegration(
+                            transaction_style="endpoint"
+                        ),
+                      FastApiIntegration(
+                            transaction_style="endpoint"
+                        ),
+                    ],
+        enable_tracing=True,
+        environment=config.ENV,
+    )
 
 def create_app() -> FastAPI:
     app_ = FastAPI(
@@ -112,6 +128,8 @@ def create_app() -> FastAPI:
         # openapi_tags=tags_metadata
     )
     init_db(app_=app_)
+    init_auth(app_=app_)
+    init_jobs(app_=app_)
     init_routers(app_=app_)
     init_listeners(app_=app_)
     init_middleware(app_=app_)
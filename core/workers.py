@@ -0,0 +1,16 @@
+from uvicorn.workers import UvicornWorker
+
+
+class ProductionWorker(UvicornWorker):
+    '''
+        Uvicorn worker for gunicorn, pinned to uvloop and httptools instead
+        of "auto" so a missing package fails the boot rather than quietly
+        falling back to asyncio and h11
+    '''
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "proxy_headers": True,
+        "server_header": False,
+    }
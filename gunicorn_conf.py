@@ -0,0 +1,67 @@
+'''
+    Gunicorn settings for production, used by `ENV=production python main.py`
+    or directly with `gunicorn core.settings:app -c gunicorn_conf.py`.
+
+    Each worker has its own DB pool (DB_POOL_SIZE + DB_MAX_OVERFLOW), keep
+    workers * that under the database's max_connections.
+
+    Behind a load balancer set FORWARDED_ALLOW_IPS to its addresses (comma
+    separated, exact IPs). Requests from them get request.client from
+    X-Forwarded-For, the last address in it that isn't one of them, which
+    is what the per-IP rate limits count. Left at 127.0.0.1 every request
+    seems to come from the load balancer. Avoid "*": it trusts the first
+    address of the header, which the client can set to anything.
+'''
+import os
+from urllib.parse import urlparse
+
+from core.env import config as app_config  # "config" is a gunicorn setting name
+
+
+def available_cores() -> int:
+    # respects the container's cpuset, os.cpu_count() reports the host
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"{app_config.APP_HOST}:{app_config.APP_PORT}"
+workers = int(app_config.WEB_CONCURRENCY or available_cores())
+worker_class = "core.workers.ProductionWorker"
+# a per-worker read-your-writes window (memory://) would send a user's next
+# request on another worker to a replica that hasn't caught up yet
+if (workers > 1 and app_config.ASYNC_READER_DB_URL != app_config.ASYNC_WRITER_DB_URL
+        and urlparse(app_config.READ_YOUR_WRITES_STORE_URL).scheme == "memory"):
+    raise RuntimeError(f"READ_YOUR_WRITES_STORE_URL is per worker, set it to a redis:// store to run "
+                       f"{workers} workers against a read replica")
+# proxies whose X-Forwarded-For/-Proto are believed, see above
+forwarded_allow_ips = app_config.FORWARDED_ALLOW_IPS
+
+# import the app once in the master, workers fork with it already loaded
+preload_app = True
+
+# recycle workers gracefully, jittered so they don't restart at the same time
+max_requests = int(app_config.WORKER_MAX_REQUESTS)
+max_requests_jitter = int(app_config.WORKER_MAX_REQUESTS_JITTER)
+timeout = int(app_config.WORKER_TIMEOUT)
+graceful_timeout = int(app_config.WORKER_GRACEFUL_TIMEOUT)
+keepalive = 5
+
+# heartbeat files on tmpfs, a disk-backed /tmp can stall workers into timeouts
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = None
+errorlog = "-"
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    # the engines were created in the master by preload_app, drop any pooled
+    # connections it holds without closing them, the master still owns them
+    from core.dependencies.sessions import async_engine, async_reader_engine, engine
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    if async_reader_engine is not async_engine:
+        async_reader_engine.sync_engine.dispose(close=False)
@@ -6,12 +6,22 @@ load_dotenv()
 
 from core.env import config
 
+
+def serve_production():
+    # gunicorn manages a pool of uvicorn workers, see gunicorn_conf.py.
+    # exec so gunicorn replaces this process and gets the container's signals
+    os.execvp("gunicorn", ["gunicorn", "core.settings:app", "--config", "gunicorn_conf.py"])
+
+
 def main():
+    if config.ENV == "production":
+        serve_production()
+
     uvicorn.run(
         app="core.settings:app",
         host=config.APP_HOST,
         port=config.APP_PORT,
-        reload=True if config.ENV != "production" else False,
+        reload=config.DEBUG,
         workers=1,
     )
 
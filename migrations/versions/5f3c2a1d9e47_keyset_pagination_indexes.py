@@ -0,0 +1,44 @@
+"""keyset pagination indexes
+
+Revision ID: 5f3c2a1d9e47
+Revises: bc9c221f69ab
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3c2a1d9e47'
+down_revision = 'bc9c221f69ab'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns), each list endpoint seeks on (created_at, id)
+# after its equality filter
+INDEXES = [
+    ('ix_jobs_created_at_id', 'jobs', ['created_at', 'id']),
+    ('ix_jobs_company_created_at_id', 'jobs', ['company_id', 'created_at', 'id']),
+    ('ix_jobs_status_created_at_id', 'jobs', ['status', 'created_at', 'id']),
+    ('ix_users_role_created_at_id', 'users', ['role', 'created_at', 'id']),
+    ('ix_companies_created_at_id', 'companies', ['created_at', 'id']),
+    ('ix_files_owner_created_at_id', 'files', ['owner_id', 'created_at', 'id']),
+    ('ix_assessments_created_at_id', 'assessments', ['created_at', 'id']),
+    ('ix_questions_assessment_created_at_id', 'questions', ['assessment_id', 'created_at', 'id']),
+    ('ix_answers_question_created_at_id', 'answers', ['question_id', 'created_at', 'id']),
+    ('ix_user_assessments_user_created_at_id', 'user_assessments', ['user_id', 'created_at', 'id']),
+    ('ix_user_assessments_assessment_created_at_id', 'user_assessments', ['assessment_id', 'created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS: databases built with create_all already have them
+    for name, table, columns in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
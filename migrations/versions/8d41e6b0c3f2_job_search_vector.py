@@ -0,0 +1,42 @@
+"""job full-text search
+
+Revision ID: 8d41e6b0c3f2
+Revises: 5f3c2a1d9e47
+Create Date: 2026-10-18 21:04:17.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b0c3f2'
+down_revision = '5f3c2a1d9e47'
+branch_labels = None
+depends_on = None
+
+
+# same as SEARCH_TEXT_FUNCTION / SEARCH_VECTOR in modules/jobs/models.py
+SEARCH_TEXT_FUNCTION = '''
+CREATE OR REPLACE FUNCTION job_search_text(text[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT coalesce(array_to_string($1, ' '), '') $$
+'''
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', job_search_text(skills::text[]) || ' ' || job_search_text(tags)), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')")
+
+
+def upgrade() -> None:
+    op.execute(SEARCH_TEXT_FUNCTION)
+    # adding a stored generated column rewrites the table once to fill it
+    op.execute(f'ALTER TABLE jobs ADD COLUMN IF NOT EXISTS search_vector tsvector '
+               f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED NOT NULL')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_jobs_search_vector ON jobs USING gin (search_vector)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_jobs_search_vector')
+    op.execute('ALTER TABLE jobs DROP COLUMN IF EXISTS search_vector')
+    op.execute('DROP FUNCTION IF EXISTS job_search_text(text[])')
@@ -0,0 +1,38 @@
+"""job application counts
+
+Revision ID: a6d2f9e4b713
+Revises: f1c4a7d2e850
+Create Date: 2026-10-19 02:17:52.640193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2f9e4b713'
+down_revision = 'f1c4a7d2e850'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # applications per job and status, maintained by the application
+    # endpoints from here on (count_applications in modules/jobs/repository.py)
+    op.execute('''
+        CREATE TABLE IF NOT EXISTS job_application_counts (
+            job_id uuid NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+            status applicationstatus NOT NULL,
+            count integer NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, status)
+        )''')
+    # the counts so far. The running version doesn't keep them, running this
+    # INSERT again once it is replaced counts what it took meanwhile
+    op.execute('''
+        INSERT INTO job_application_counts (job_id, status, count)
+        SELECT job_id, status, count(*) FROM applications WHERE job_id IS NOT NULL GROUP BY job_id, status
+        ON CONFLICT (job_id, status) DO UPDATE SET count = EXCLUDED.count''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TABLE IF EXISTS job_application_counts')
@@ -0,0 +1,40 @@
+"""job feed filter indexes
+
+Revision ID: c7a9e2f41b6d
+Revises: 8d41e6b0c3f2
+Create Date: 2026-10-18 22:31:05.774126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a9e2f41b6d'
+down_revision = '8d41e6b0c3f2'
+branch_labels = None
+depends_on = None
+
+
+# (name, definition); candidates only ever see ACTIVE jobs, so the btree
+# indexes are partial and stay small
+INDEXES = [
+    ('ix_jobs_skills', 'jobs USING gin (skills)'),
+    ('ix_jobs_qualifications', 'jobs USING gin (qualifications)'),
+    ('ix_jobs_active_created_at_id', "jobs (created_at, id) WHERE status = 'ACTIVE'"),
+    ('ix_jobs_active_location_type', "jobs (\"locationType\", created_at, id) WHERE status = 'ACTIVE'"),
+    # covering index for the facet counts
+    ('ix_jobs_active_facets', "jobs (\"locationType\", \"experienceLevel\", type, currency) "
+                              "INCLUDE (qualifications, \"salaryRangeFrom\", \"salaryRangeTo\") WHERE status = 'ACTIVE'"),
+    ('ix_jobs_active_salary', "jobs (\"salaryRangeTo\", \"salaryRangeFrom\") WHERE status = 'ACTIVE'"),
+]
+
+
+def upgrade() -> None:
+    for name, definition in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+
+def downgrade() -> None:
+    for name, _ in reversed(INDEXES):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
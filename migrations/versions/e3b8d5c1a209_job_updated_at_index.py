@@ -0,0 +1,25 @@
+"""job updated_at index
+
+Revision ID: e3b8d5c1a209
+Revises: c7a9e2f41b6d
+Create Date: 2026-10-18 23:48:12.402913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8d5c1a209'
+down_revision = 'c7a9e2f41b6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the recommendation index fetches the jobs updated since its last sync
+    op.execute('CREATE INDEX IF NOT EXISTS ix_jobs_updated_at ON jobs (updated_at)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_jobs_updated_at')
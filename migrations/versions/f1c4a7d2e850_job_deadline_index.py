@@ -0,0 +1,26 @@
+"""job deadline index
+
+Revision ID: f1c4a7d2e850
+Revises: e3b8d5c1a209
+Create Date: 2026-10-19 00:41:37.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c4a7d2e850'
+down_revision = 'e3b8d5c1a209'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the lifecycle sweep looks for ACTIVE jobs past their deadline; partial
+    # like the feed indexes, a closed job leaves it
+    op.execute("CREATE INDEX IF NOT EXISTS ix_jobs_active_deadline ON jobs (deadline) WHERE status = 'ACTIVE'")
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_jobs_active_deadline')
@@ -4,7 +4,7 @@ from sqlalchemy import (TIMESTAMP, Column, ForeignKey,
                         String, Boolean, text, Enum, Integer, 
                         Text, cast, Index)
 from sqlalchemy.dialects.postgresql import ARRAY, array, JSONB, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import query_expression, relationship
 from sqlalchemy_mixins import AllFeaturesMixin
 
 from core.dependencies.sessions import Base
@@ -48,7 +48,8 @@ class Assessment(Base):
     questions = relationship('Question', back_populates='assessment')
 
     tags = Column(ARRAY(Text), nullable=False, default=cast(array([], type_=Text), ARRAY(Text)))
-    __table_args__ = (Index('ix_assessments_tags', tags, postgresql_using="gin"), )
+    __table_args__ = (Index('ix_assessments_tags', tags, postgresql_using="gin"),
+                      Index('ix_assessments_created_at_id', 'created_at', 'id'), )
 
     skills = Column(ARRAY(String), nullable=False)
     duration = Column(String, nullable=False) # In Minutes
@@ -77,9 +78,13 @@ class Question(Base):
     options = Column(ARRAY(String), nullable=True)
     assessment = relationship('Assessment', back_populates='questions')
     answers = relationship('Answer', back_populates='question')
+    # position of the question in a candidate's shuffled order, only loaded
+    # by the candidate question list
+    shuffle_key = query_expression()
 
     tags = Column(ARRAY(Text), nullable=False, default=cast(array([], type_=Text), ARRAY(Text)))
-    __table_args__ = (Index('ix_questions_tags', tags, postgresql_using="gin"), )
+    __table_args__ = (Index('ix_questions_tags', tags, postgresql_using="gin"),
+                      Index('ix_questions_assessment_created_at_id', 'assessment_id', 'created_at', 'id'), )
 
     # Audit logs
     created_at = Column(TIMESTAMP(timezone=True),
@@ -110,6 +115,8 @@ class Answer(Base):
     updated_at = Column(TIMESTAMP(timezone=True),
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
+    __table_args__ = (Index('ix_answers_question_created_at_id', 'question_id', 'created_at', 'id'), )
+
     def __repr__(self):
         return f"{self.id}"
     
@@ -131,5 +138,8 @@ class UserResult(Base):
     updated_at = Column(TIMESTAMP(timezone=True),
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
+    __table_args__ = (Index('ix_user_assessments_user_created_at_id', 'user_id', 'created_at', 'id'),
+                      Index('ix_user_assessments_assessment_created_at_id', 'assessment_id', 'created_at', 'id'), )
+
     def __repr__(self):
         return f"<Assessment Result: {self.id}>"
\ No newline at end of file
@@ -1,4 +1,6 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import String, cast, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, with_expression
 from sqlalchemy.sql import func
 from typing import List
 from datetime import datetime
@@ -8,34 +10,54 @@ import json
 from fastapi import Depends
 
 from core.exceptions.base import BadRequestException, NotFoundException
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db
+from core.helpers.bulk_update import update_from_values
+from core.helpers.pagination import paginate
 from core.helpers.score_utils import mark_questions 
 
 from .models import Assessment, Question, Answer, UserResult, AssessmentDifficulty, QuestionDifficulty, QuestionType
 from .schemas import *
 
 
+ASSESSMENT_FIELDS = ("name", "slug", "description", "instructions", "difficulty", "tags", "skills", "duration")
+QUESTION_FIELDS = ("title", "category", "question_type", "difficulty", "tags")
+ANSWER_FIELDS = ("answer_text", "boolean_text", "is_correct", "feedback")
+
+
+def questions_with_answers():
+    '''Loader option for the questions BaseAssessment serialises, with their answers'''
+    return selectinload(Assessment.questions).selectinload(Question.answers)
+
+
+def changed_fields(stored, sent: dict, fields) -> dict:
+    '''Fields in `sent` whose value differs from the stored instance'''
+    return {field: sent[field] for field in fields if field in sent and sent[field] != getattr(stored, field)}
+
+
+def diff_row(stored, diff: dict, fields) -> dict:
+    '''Full row for update_from_values, stored values with the changes applied'''
+    return {"id": stored.id, **{field: getattr(stored, field) for field in fields}, **diff}
+
+
 class AssessmentRepository:
-    def __init__(
-        self, db: Session = get_db().__next__()
-    ) -> None:
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
         self.db = db
 
     
     async def getOrCreate(self, payload: CreateAssessmentSchema):
         if payload.id:
-            assessment = self.db.query(Assessment).filter(Assessment.id==payload.id).first()
+            assessment = (await self.db.execute(select(Assessment).filter(Assessment.id==payload.id))).scalars().first()
             if assessment is None:
                 raise NotFoundException("No assessment not found!")
         else:        
-            assessment = self.create(payload=payload)
+            assessment = await self.create(payload=payload)
 
         return assessment
 
     
     async def create(self, payload: CreateAssessmentSchema):
         
-        assessment = self.db.query(Assessment).filter(Assessment.name==payload.name).first()
+        assessment = (await self.db.execute(select(Assessment).filter(Assessment.name==payload.name))).scalars().first()
         if assessment is not None:
             raise BadRequestException("Assessment already exists!")
         
@@ -50,350 +72,330 @@ class AssessmentRepository:
             duration = payload.duration,
         )
         self.db.add(assessment)
-        self.db.commit()
-        self.db.refresh(assessment)
-        if payload.questions and len(payload.questions) > 0:
-            
-            for question_item in payload.questions:
-                question =  Question(
-                title = question_item.title,
-                category = question_item.category,
-                assessment_id = assessment.id,
-                question_type = question_item.question_type,
-                difficulty = question_item.difficulty,
-                tags = question_item.tags,
-                )
-                self.db.add(question)
-                self.db.commit()
-                for answer_item in question_item.answers:
-                    answer = Answer(
-                        question_id = question.id,
-                        answer_text = answer_item.answer_text,
-                        boolean_text = answer_item.boolean_text,
-                        is_correct = answer_item.is_correct,
-                        feedback = answer_item.feedback
-                    )
-                    self.db.add(answer)
-                self.db.commit()
-                self.db.refresh(answer)
-            
-            self.db.commit()
-            self.db.refresh(question)
-            self.db.refresh(assessment)
+        await self.db.flush()
+        if payload.questions:
+            await QuestionRepository(self.db).bulk_create(payload.questions, assessment.id)
             
+        return await self.get_by_id(assessment.id)
+
+    
+    async def get(self, assessment_id: str):
+        '''The assessment without its questions'''
+        assessment = (await self.db.execute(select(Assessment).filter(Assessment.id==assessment_id))).scalars().first()
+        if assessment is None:
+            raise NotFoundException("Assessment not found!")
+        
         return assessment
 
     
     async def get_by_id(self, assessment_id: str):
-        assessment = self.db.query(Assessment).options(joinedload(Assessment.questions).joinedload(Question.answers)).filter(Assessment.id==assessment_id).first()
+        assessment = (await self.db.execute(select(Assessment).options(questions_with_answers()).filter(Assessment.id==assessment_id))).scalars().first()
         if assessment is None:
             raise NotFoundException("Assessment not found!")
         
         return assessment
 
     
-    async def get_list(self,  page: int, limit: int, filter: str):
-        skip = (page - 1) * limit
-
-        assessments = self.db.query(Assessment
-                                    ).order_by(Assessment.created_at.desc()
-                                                         ).limit(limit).offset(skip).all()
+    async def get_list(self,  page: int, limit: int, filter: str, cursor: str = None):
+        assessments = await paginate(self.db, select(Assessment).options(questions_with_answers()),
+                            limit=limit, cursor=cursor, page=page)
         
-        if len(assessments) < 1:
+        if len(assessments.items) < 1:
             raise NotFoundException("Assessments not found!")  
         
         return assessments
     
 
-    async def get_by_difficulty(self,  page: int, limit: int, difficulty: AssessmentDifficulty):
-        skip = (page - 1) * limit
-        assessments = self.db.query(Assessment).filter(Assessment.difficulty == difficulty
-            ).order_by(Assessment.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_difficulty(self,  page: int, limit: int, difficulty: AssessmentDifficulty, cursor: str = None):
+        assessments = await paginate(self.db, select(Assessment).options(questions_with_answers()).filter(
+                            Assessment.difficulty == difficulty),
+                            limit=limit, cursor=cursor, page=page)
             
         return assessments
 
     
-    async def update(self, payload: BaseAssessment):
-        assessment_query = self.db.query(Assessment).filter(Assessment.id==payload.id)
-        assessment = assessment_query.first()
-        
-        if assessment is None:
-            raise NotFoundException("Assessment not found!")
-        
-        print(assessment.questions)
-        for quest in range(0, len(payload.questions)):
-            print("Updating questions")
-            for ans in range(0, len(payload.questions[quest].answers)):
-                print("Updating answers")
-                answer_query = self.db.query(Answer).filter(Answer.id == payload.questions[quest].answers[ans].id)
-                answer_query.update(payload.questions[quest].answers[ans].__dict__, synchronize_session=False)
-                self.db.commit()
-            
-            question_query = self.db.query(Question).filter(Question.id == payload.questions[quest].id)
-            payload.questions[quest].__dict__.pop("answers")
-            question_query.update(payload.questions[quest].__dict__, synchronize_session=False)
-            self.db.commit()
-
-        payload.__dict__.pop("questions")
-        assessment_query.update(payload.__dict__, synchronize_session=False)
-        self.db.commit()
+    async def update(self, assessment_id: UUID, payload: BaseAssessment) -> AssessmentChanges:
+        '''
+            Diffs the payload against the stored assessment and writes only what
+            changed: one UPDATE for the assessment, one UPDATE ... FROM (VALUES)
+            each for the changed questions and answers, and bulk inserts for
+            questions or answers sent without an id. Fields left out of the
+            payload are not touched
+        '''
+        assessment = await self.get_by_id(assessment_id)
+        changes = AssessmentChanges()
+
+        assessment_diff = changed_fields(assessment, payload.model_dump(exclude_unset=True), ASSESSMENT_FIELDS)
+        if assessment_diff:
+            await self.db.execute(update(Assessment.__table__).where(
+                Assessment.__table__.c.id == assessment.id).values(assessment_diff))
+            changes.assessment = sorted(assessment_diff)
+
+        stored_questions = {question.id: question for question in assessment.questions}
+        question_rows, question_columns = [], set()
+        answer_rows, answer_columns = [], set()
+        new_questions, new_answers = [], []
+
+        for question in payload.questions or []:
+            if question.id is None:
+                new_questions.append(question)
+                continue
+            stored_question = stored_questions.get(question.id)
+            if stored_question is None:
+                raise BadRequestException(f"Question {question.id} is not part of this assessment")
+
+            question_diff = changed_fields(stored_question, question.model_dump(exclude_unset=True), QUESTION_FIELDS)
+            if question_diff:
+                question_rows.append(diff_row(stored_question, question_diff, QUESTION_FIELDS))
+                question_columns.update(question_diff)
+                changes.questions_updated.append(stored_question.id)
+
+            stored_answers = {answer.id: answer for answer in stored_question.answers}
+            for answer in question.answers or []:
+                if answer.id is None:
+                    new_answers.append({"question_id": stored_question.id,
+                                        **{field: getattr(answer, field) for field in ANSWER_FIELDS}})
+                    continue
+                stored_answer = stored_answers.get(answer.id)
+                if stored_answer is None:
+                    raise BadRequestException(f"Answer {answer.id} is not part of question {question.id}")
+
+                answer_diff = changed_fields(stored_answer, answer.model_dump(exclude_unset=True), ANSWER_FIELDS)
+                if answer_diff:
+                    answer_rows.append(diff_row(stored_answer, answer_diff, ANSWER_FIELDS))
+                    answer_columns.update(answer_diff)
+                    changes.answers_updated.append(stored_answer.id)
+
+        await update_from_values(self.db, Question, question_rows, sorted(question_columns))
+        await update_from_values(self.db, Answer, answer_rows, sorted(answer_columns))
+        if new_questions:
+            changes.questions_created = await QuestionRepository(self.db).bulk_create(new_questions, assessment.id)
+        if new_answers:
+            changes.answers_created = (await self.db.execute(
+                insert(Answer).returning(Answer.id), new_answers)).scalars().all()
+
+        # the statements above bypass the loaded instances, reload them on next access
+        for question in assessment.questions:
+            for answer in question.answers:
+                self.db.expire(answer)
+            self.db.expire(question)
+        self.db.expire(assessment)
+
+        return changes
         
         
     
     async def delete(self, assessment_id: str):
-        assessment_query = self.db.query(Assessment).filter(Assessment.id==assessment_id)
-        assessment = assessment_query.first()
+        assessment = (await self.db.execute(select(Assessment).filter(Assessment.id==assessment_id))).scalars().first()
         if assessment is None:
             raise NotFoundException("Assessment not found!")
         
         try:
-            self.db.delete(assessment)
-            self.db.commit()
+            await self.db.delete(assessment)
+            await self.db.flush()
             return {"message": "Assessment deleted successfully"}
         except BadRequestException:
-            self.db.rollback()
+            await self.db.rollback()
             raise BadRequestException("Assessment delete failed")
 
         
 class QuestionRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
-    async def create(self, payload: CreateQuestionSchema, assessment_id: UUID):
-        question =  Question(
-            title = payload.title,
-            category = payload.category,
-            assessment_id = assessment_id,
-            question_type = payload.question_type,
-            difficulty = payload.difficulty,
-            tags = payload.tags,
-        )
-        self.db.add(question)
-        self.db.commit()
-        
-        if payload.answers:    
-            for answer_item in payload.answers:
-                answer = Answer(
-                    question_id = question.id,
-                    answer_text = answer_item.answer_text,
-                    boolean_text = answer_item.boolean_text,
-                    is_correct = answer_item.is_correct,
-                    feedback = answer_item.feedback
-                )
-                self.db.add(answer)
-                self.db.commit()
-                self.db.refresh(answer)
-        
-        self.db.commit()
-        self.db.refresh(question)
+    async def bulk_create(self, questions: List[CreateQuestionSchema], assessment_id: UUID) -> List[UUID]:
+        '''
+            Inserts all questions in one multi-row INSERT ... RETURNING id and
+            all of their answers in another, inside the caller's transaction.
+            Returns the question ids in the order they were given
+        '''
+        if not questions:
+            return []
+        question_ids = (await self.db.execute(
+            insert(Question).returning(Question.id, sort_by_parameter_order=True),
+            [{
+                "title": question.title,
+                "category": question.category,
+                "assessment_id": assessment_id,
+                "question_type": question.question_type,
+                "difficulty": question.difficulty,
+                "tags": question.tags or [],
+            } for question in questions])).scalars().all()
+
+        answers = [{
+            "question_id": question_id,
+            "answer_text": answer.answer_text,
+            "boolean_text": answer.boolean_text,
+            "is_correct": answer.is_correct,
+            "feedback": answer.feedback,
+        } for question, question_id in zip(questions, question_ids) for answer in question.answers or []]
+        if answers:
+            await self.db.execute(insert(Answer), answers)
+
+        return question_ids
 
-        return question
+
+    async def create(self, payload: CreateQuestionSchema, assessment_id: UUID):
+        question_ids = await self.bulk_create([payload], assessment_id)
+        return await self.get(question_ids[0])
     
     async def create_with_answers(self, payload: BaseQuestion, assessment_id: UUID):        
-        new_question =  Question(
-            title = payload.title,
-            category = payload.category,
-            assessment_id = assessment_id,
-            question_type = payload.question_type,
-            difficulty = payload.difficulty,
-            tags = payload.tags,
-        )
-        self.db.add(new_question)
-        self.db.commit()
-        for answer_item in payload.answers:
-            answer = Answer(
-                question_id = new_question.id,
-                answer_text = answer_item.answer_text,
-                boolean_text = answer_item.boolean_text,
-                is_correct = answer_item.is_correct,
-                feedback = answer_item.feedback
-            )
-            self.db.add(answer)
-            self.db.commit()
-            self.db.refresh(answer)
-        
-        self.db.commit()
-        self.db.refresh(new_question)
-        
-        return new_question 
+        return await self.create(payload, assessment_id)
 
 
     async def get(self, question_id: UUID):
-        question = self.db.query(Question).filter(Question.id==question_id).first()
+        question = (await self.db.execute(select(Question).options(selectinload(Question.answers)).filter(
+            Question.id==question_id))).scalars().first()
         if question is None:
             raise NotFoundException("Question not found!")
         
         return question
 
 
-    async def get_random_list(self,  page: int, limit: int, filter: str, assessment_id: UUID):
-        skip = (page - 1) * limit
-
-        questions = self.db.query(Question
-                                ).order_by(func.random()
-                                ).filter(Question.assessment_id == assessment_id).limit(limit
-                                ).offset(skip).all()
-
-        if len(questions) is None:
-            raise NotFoundException("Question not found!")  
+    async def get_random_list(self,  page: int, limit: int, filter: str, assessment_id: UUID, seed: UUID,
+                              cursor: str = None):
+        # a shuffle that stays put between requests, so a candidate can page
+        # through it; every seed gets its own order
+        shuffle = func.md5(cast(Question.id, String) + str(seed), type_=String).label("shuffle_key")
+        questions = await paginate(self.db, select(Question).options(
+                                selectinload(Question.answers), with_expression(Question.shuffle_key, shuffle)
+                                ).filter(Question.assessment_id == assessment_id),
+                            limit=limit, cursor=cursor, page=page, keys=(shuffle, Question.id))
         return questions
     
     
-    async def get_list(self,  page: int, limit: int, filter: str, assessment_id: UUID):
-        skip = (page - 1) * limit
-
-        questions = self.db.query(Question
-                                    ).order_by(Question.created_at.desc()
-                                                        ).limit(limit).offset(skip).all()
-
-        if len(questions) is None:
-            raise NotFoundException("Question not found!")  
+    async def get_list(self,  page: int, limit: int, filter: str, assessment_id: UUID, cursor: str = None):
+        questions = await paginate(self.db, select(Question).options(selectinload(Question.answers)).filter(
+                            Question.assessment_id == assessment_id),
+                            limit=limit, cursor=cursor, page=page)
         return questions
     
 
-    async def get_by_assessment(self,  page: int, limit: int, assessment_id: str):
-        skip = (page - 1) * limit
-        questions = self.db.query(Question).filter(Question.assessment_id == assessment_id
-            ).order_by(Question.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_assessment(self,  page: int, limit: int, assessment_id: str, cursor: str = None):
+        questions = await paginate(self.db, select(Question).filter(Question.assessment_id == assessment_id),
+                            limit=limit, cursor=cursor, page=page)
         return questions
     
 
-    async def get_by_difficulty(self,  page: int, limit: int, difficulty: QuestionDifficulty):
-        skip = (page - 1) * limit
-        questions = self.db.query(Question).filter(Question.difficulty == difficulty
-            ).order_by(Question.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_difficulty(self,  page: int, limit: int, difficulty: QuestionDifficulty, cursor: str = None):
+        questions = await paginate(self.db, select(Question).filter(Question.difficulty == difficulty),
+                            limit=limit, cursor=cursor, page=page)
         return questions
     
 
-    async def get_by_type(self,  page: int, limit: int, type: QuestionType):
-        skip = (page - 1) * limit
-        questions = self.db.query(Question).filter(Question.type == type
-            ).order_by(Question.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_type(self,  page: int, limit: int, type: QuestionType, cursor: str = None):
+        questions = await paginate(self.db, select(Question).filter(Question.type == type),
+                            limit=limit, cursor=cursor, page=page)
         return questions
     
 
-    async def get_by_category(self,  page: int, limit: int, category: str):
-        skip = (page - 1) * limit
-        questions = self.db.query(Question).filter(Question.category == category
-            ).order_by(Question.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_category(self,  page: int, limit: int, category: str, cursor: str = None):
+        questions = await paginate(self.db, select(Question).filter(Question.category == category),
+                            limit=limit, cursor=cursor, page=page)
         return questions
 
 
     async def update(self, payload: BaseQuestion):
-        question_query = self.db.query(Question).filter(Question.id==payload.id)
-        question = question_query.first()
+        question_query = update(Question).filter(Question.id==payload.id)
+        question = (await self.db.execute(select(Question).options(selectinload(Question.answers)).filter(
+            Question.id==payload.id))).scalars().first()
         if question is None:
             raise NotFoundException("Question not found!")
         
         # question_query.update(payload.dict(exclude_unset=True), synchronize_session=False)
         for ans in range(0, len(question.answers)):
-            answer_query = self.db.query(Answer).filter(Answer.id == question.answers[ans].id)
-            answer_query = answer_query.__dict__
-            question.answers[ans].__dict__.pop("_sa_instance_state")
-            answer_query.update(question.answers[ans].__dict__, synchronize_session=False)
-            self.db.commit()
+            answer_query = update(Answer).filter(Answer.id == question.answers[ans].id)
+            answer_values = dict(question.answers[ans].__dict__)
+            answer_values.pop("_sa_instance_state")
+            await self.db.execute(answer_query.values(answer_values))
+            await self.db.flush()
         
         payload.__dict__.pop("answers")
-        question_query.update(payload.__dict__, synchronize_session=False)
-        self.db.commit()
+        await self.db.execute(question_query.values(payload.__dict__))
+        await self.db.flush()
 
         return question
     
 
     async def delete(self, question_id: str):
-        question_query = self.db.query(Question).filter(Question.id==question_id)
-        question = question_query.first()
+        question = (await self.db.execute(select(Question).filter(Question.id==question_id))).scalars().first()
         if question is None:
             raise NotFoundException("Question not found!")
         
         try:
-            self.db.delete(question)
-            self.db.commit()
+            await self.db.delete(question)
+            await self.db.flush()
             return {"message": "Question deleted successfully"}
         except BadRequestException:
-            self.db.rollback()
+            await self.db.rollback()
             raise BadRequestException("Question delete failed")
 
 
 class AnswerRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self, payload):
         answer = Answer(**payload.__dict__)
 
         self.db.add(answer)
-        self.db.commit()
-        self.db.refresh(answer)
+        await self.db.flush()
+        await self.db.refresh(answer)
 
         return answer
 
 
     async def get(self, answer_id: str):
-        answer = self.db.query(Answer).filter(Answer.id==answer_id).first()
+        answer = (await self.db.execute(select(Answer).filter(Answer.id==answer_id))).scalars().first()
         if answer is None:
             raise NotFoundException("Answer not found!")
         
         return answer
 
 
-    async def get_list(self, page: int, limit: int, filter):
-        skip = (page - 1) * limit
-
-        answers = self.db.query(Answer
-                                    ).order_by(Answer.created_at.desc()
-                                                ).limit(limit).offset(skip).all()
-
-        if len(answers) is None:
-            raise NotFoundException("Answers not found!")  
+    async def get_list(self, page: int, limit: int, filter, cursor: str = None):
+        answers = await paginate(self.db, select(Answer),
+                            limit=limit, cursor=cursor, page=page)
         return answers
     
 
-    async def get_by_question_id(self,  page: int, limit: int, question_id: str):
-        skip = (page - 1) * limit
-        answers = self.db.query(Answer).filter(Answer.question_id == question_id
-            ).order_by(Answer.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_question_id(self,  page: int, limit: int, question_id: str, cursor: str = None):
+        answers = await paginate(self.db, select(Answer).filter(Answer.question_id == question_id),
+                            limit=limit, cursor=cursor, page=page)
         return answers
 
 
     async def update(self, payload):
-        answer_query = self.db.query(Answer).filter(Answer.id==payload.id)
-        answer = answer_query.first()
+        answer_query = update(Answer).filter(Answer.id==payload.id)
+        answer = (await self.db.execute(select(Answer).filter(Answer.id==payload.id))).scalars().first()
         if answer is None:
             raise NotFoundException("Answer not found!")
         
-        answer_query.update(payload.dict(exclude_unset=True), synchronize_session=False)
+        await self.db.execute(answer_query.values(payload.dict(exclude_unset=True)))
 
         self.db.add(answer)
-        self.db.commit()
+        await self.db.flush()
 
         return answer
 
     async def delete(self, answer_id: str):
-        answer_query = self.db.query(Answer).filter(Answer.id==answer_id)
-        answer = answer_query.first()
+        answer = (await self.db.execute(select(Answer).filter(Answer.id==answer_id))).scalars().first()
         if answer is None:
             raise NotFoundException("Answer not found!")
         
         try:
-            self.db.delete(answer)
-            self.db.commit()
+            await self.db.delete(answer)
+            await self.db.flush()
             return {"message": "Answer deleted successfully"}
         except BadRequestException:
-            self.db.rollback()
+            await self.db.rollback()
             raise BadRequestException("Answer delete failed")
 
 
 
 class UserResultRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self, payload: CreateAssessmentResults):
         assessment_review = mark_questions(payload)
@@ -409,81 +411,67 @@ class UserResultRepository:
         userResult = UserResult(**new_result)
         
         self.db.add(userResult)
-        self.db.commit()
+        await self.db.flush()
         result = userResult
-        self.db.refresh(userResult)
+        await self.db.refresh(userResult)
 
         return result
 
     async def get(self, result_id: str):
-        userResult = self.db.query(UserResult).filter(UserResult.id==result_id).first()
+        userResult = (await self.db.execute(select(UserResult).filter(UserResult.id==result_id))).scalars().first()
         if userResult is None:
             raise NotFoundException("Result not found!")
         
         return userResult
 
-    async def get_list(self, page: int, limit: int, filter):
-        skip = (page - 1) * limit
-
-        userResults = self.db.query(UserResult
-                                    ).order_by(UserResult.created_at.desc()
-                                                ).limit(limit).offset(skip).all()
-
-        if len(userResults) is None:
-            raise NotFoundException("Result not found!")  
+    async def get_list(self, page: int, limit: int, filter, cursor: str = None):
+        userResults = await paginate(self.db, select(UserResult),
+                            limit=limit, cursor=cursor, page=page)
         return userResults
     
 
-    async def get_by_user_id(self, page: int, limit: int, user_id: UUID):
-        skip = (page - 1) * limit 
-
-        user_results = self.db.query(UserResult).filter(UserResult.user_id == user_id
-            ).order_by(UserResult.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_user_id(self, page: int, limit: int, user_id: UUID, cursor: str = None):
+        user_results = await paginate(self.db, select(UserResult).filter(UserResult.user_id == user_id),
+                            limit=limit, cursor=cursor, page=page)
         
         return user_results
     
 
-    async def get_by_assessment_id(self, page: int, limit: int, assessment_id: UUID):
-        
-        skip = (page - 1) * limit
-
-        results = self.db.query(UserResult).filter(UserResult.assessment_id == assessment_id
-            ).order_by(UserResult.created_at.desc()
-                       ).limit(limit).offset(skip).all()
+    async def get_by_assessment_id(self, page: int, limit: int, assessment_id: UUID, cursor: str = None):
+        results = await paginate(self.db, select(UserResult).filter(UserResult.assessment_id == assessment_id),
+                            limit=limit, cursor=cursor, page=page)
         
         return results
     
     async def get_by_result_id(self, result_id: UUID):
 
-        result = self.db.query(UserResult).filter(UserResult.id == result_id).first()
+        result = (await self.db.execute(select(UserResult).filter(UserResult.id == result_id))).scalars().first()
         
         return result
 
 
     async def update(self, payload):
-        userResult_query = self.db.query(UserResult).filter(UserResult.id==payload.id)
-        userResults = userResult_query.first()
+        userResult_query = update(UserResult).filter(UserResult.id==payload.id)
+        userResults = (await self.db.execute(select(UserResult).filter(UserResult.id==payload.id))).scalars().first()
         if userResults is None:
             raise NotFoundException("Result not found!")
         
-        userResults.update(payload.dict(exclude_unset=True), synchronize_session=False)
+        await self.db.execute(userResult_query.values(payload.dict(exclude_unset=True)))
 
         self.db.add(userResults)
-        self.db.commit()
+        await self.db.flush()
 
         return userResults
 
     async def delete(self, userResult_id):
-        userResult_query = self.db.query(UserResult).filter(UserResult.id==userResult_id)
-        userResults = userResult_query.first()
+        userResults = (await self.db.execute(select(UserResult).filter(UserResult.id==userResult_id))).scalars().first()
         if userResults is None:
             raise NotFoundException("Result not found!")
         
         try:
-            self.db.delete(userResults)
-            self.db.commit()
+            await self.db.delete(userResults)
+            await self.db.flush()
             return {"message": "Result deleted successfully"}
         except BadRequestException:
-            self.db.rollback()
+            await self.db.rollback()
             raise BadRequestException("Result delete failed")
\ No newline at end of file
@@ -74,6 +74,19 @@ class CreateAssessmentSchema(BaseModel):
 
 
 
+class AssessmentChanges(BaseModel):
+    assessment: List[str] = []
+    questions_updated: List[UUID] = []
+    questions_created: List[UUID] = []
+    answers_updated: List[UUID] = []
+    answers_created: List[UUID] = []
+
+
+class UpdatedAssessment(BaseAssessment):
+    changes: Optional[AssessmentChanges] = None
+
+
+
 class ScoreDetails(BaseModel):
     total_questions: Optional[int] = 0
     total_score: Optional[int] = 0
@@ -4,7 +4,7 @@ from uuid import UUID, uuid4
 from fastapi import Depends, HTTPException, status, APIRouter, Response, Path, UploadFile, Form
 
 from core.exceptions import NotFoundException, BadRequestException, UnauthorisedUserException
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db
 from core.dependencies.auth import get_current_user
 from core.helpers.schemas import CustomResponse, CustomListResponse
 from core.helpers.s3client import upload_files
@@ -12,11 +12,11 @@ from core.helpers.csv_utils import generate_questions
 from modules.users.schemas import BaseUser
 
 from modules.files.models import FileType
-from .schemas import BaseAssessment, BaseQuestion, CreateQuestionSchema, BaseUserResults, CreateAssessmentSchema, CreateAssessmentResults
+from .schemas import BaseAssessment, BaseQuestion, CreateQuestionSchema, BaseUserResults, CreateAssessmentSchema, CreateAssessmentResults, UpdatedAssessment
 from .repository import AssessmentRepository, QuestionRepository, UserResultRepository
 
 from sqlalchemy import or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from modules.users.models import User, UserType
 import magic
@@ -26,10 +26,6 @@ router = APIRouter(
 )
 
 
-assessmentRepo = AssessmentRepository()
-questionRepo = QuestionRepository()
-resultRepo = UserResultRepository()
-
 KB = 1024
 MB = 1024 * KB
 
@@ -41,7 +37,9 @@ SUPPORTED_FILE_TYPES = {
 # fetch and update delete results
 @router.post('/', response_model=CustomResponse[BaseAssessment], tags=["Assessments"])
 async def create_assessments(payload: CreateAssessmentSchema,
-                             current_user: Annotated[User, Depends(get_current_user)]):
+                             current_user: Annotated[User, Depends(get_current_user)],
+                             db: AsyncSession = Depends(get_async_db),
+                             assessmentRepo: AssessmentRepository = Depends()):
     """Create a new assessment""" 
     
     if current_user.role == UserType.CANDIDATE:
@@ -49,6 +47,7 @@ async def create_assessments(payload: CreateAssessmentSchema,
     
     try:
         new_assessment = await assessmentRepo.create(payload)
+        await db.commit()
         return {"message":"Assessment fetched successfully","data": new_assessment}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -57,7 +56,9 @@ async def create_assessments(payload: CreateAssessmentSchema,
 @router.put("/upload-csv/{assessment_id}", response_model=CustomResponse[BaseAssessment], tags=["Files"])
 async def update_assessment_by_csv(file: UploadFile, assessment_id: Annotated[UUID, Path(title="")],
                                 current_user: Annotated[User, Depends(get_current_user)],
-                                db: Session = Depends(get_db)
+                                db: AsyncSession = Depends(get_async_db),
+                                assessmentRepo: AssessmentRepository = Depends(),
+                                questionRepo: QuestionRepository = Depends()
                             ):
     
     if not file:
@@ -85,7 +86,8 @@ async def update_assessment_by_csv(file: UploadFile, assessment_id: Annotated[UU
     # db.commit()
     
     # db.refresh(new_file)
-    await generate_questions(uploaded_file_url, assessment_id)
+    await generate_questions(uploaded_file_url, assessment_id, questionRepo)
+    await db.commit()
     
     payload = await assessmentRepo.get_by_id(assessment_id)
     
@@ -97,37 +99,47 @@ async def update_assessment_by_csv(file: UploadFile, assessment_id: Annotated[UU
 
 @router.get('/', response_model=CustomListResponse[BaseAssessment], tags=["Assessments"])
 async def fetch_assessments(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                            limit: int = 10, page: int = 1, search: str = ''):
+                            limit: int = 10, page: int = 1, search: str = '', cursor: str = None,
+                            assessmentRepo: AssessmentRepository = Depends()):
     
-    assessments = await assessmentRepo.get_list(page=page, limit=limit, filter=search)
+    assessments, next_cursor = await assessmentRepo.get_list(page=page, limit=limit, filter=search, cursor=cursor)
 
-    return {'message': 'Assessments retrieved successfully', 'count': len(assessments), 'data': assessments}
+    return {'message': 'Assessments retrieved successfully', 'count': len(assessments), 'data': assessments,
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor}
 
 
 @router.get('/{assessment_id}', response_model=CustomResponse[BaseAssessment], tags=["Assessments"])
 async def fetch_assessment(assessment_id: Annotated[UUID, Path(title="")], 
                            current_user: Annotated[BaseUser, Depends(get_current_user)],
-                           question_limit: int = 10,):
+                           question_limit: int = 10,
+                           assessmentRepo: AssessmentRepository = Depends()):
     
     assessment: BaseAssessment = await assessmentRepo.get_by_id(assessment_id=assessment_id)
 
     return {"message":"Assessment fetched successfully", "data": assessment}
 
-@router.put('/{assessment_id}', response_model=CustomResponse[BaseAssessment], tags=["Assessments"])
+@router.put('/{assessment_id}', response_model=CustomResponse[UpdatedAssessment], tags=["Assessments"])
 async def update_assessments(assessment_id: Annotated[UUID, Path(title="ID of assessment being fetched")],
-                             payload: BaseAssessment):
+                             payload: BaseAssessment,
+                             db: AsyncSession = Depends(get_async_db),
+                             assessmentRepo: AssessmentRepository = Depends()):
     
-    await assessmentRepo.update(payload)
+    changes = await assessmentRepo.update(assessment_id, payload)
+    await db.commit()
     
     assessment = await assessmentRepo.get_by_id(assessment_id) 
+    data = UpdatedAssessment.model_validate(assessment, from_attributes=True).model_copy(update={"changes": changes})
 
-    return {"message":"Assessment fetched successfully","data": assessment}
+    return {"message":"Assessment fetched successfully","data": data}
 
 
 @router.delete('/{assessment_id}', response_model=CustomResponse, tags=["Assessments"])
 async def delete_assessments(assessment_id: Annotated[UUID, Path(title="The ID of the assessment to be deleted")],
-               current_user: Annotated[BaseUser, Depends(get_current_user)]):
+               current_user: Annotated[BaseUser, Depends(get_current_user)],
+               db: AsyncSession = Depends(get_async_db),
+               assessmentRepo: AssessmentRepository = Depends()):
     assessment = await assessmentRepo.delete(assessment_id)
+    await db.commit()
     return assessment
 
 
@@ -144,27 +156,36 @@ async def delete_assessments(assessment_id: Annotated[UUID, Path(title="The ID o
 @router.get('/{assessment_id}/questions', response_model=CustomListResponse[BaseQuestion], tags=["Questions", "Assessments"])
 async def fetch_assessment_questions(assessment_id: Annotated[UUID, Path(title="The ID of the assessment to be fetched")],
                                 current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                limit: int = 10, page: int = 1, search: str = ''):
+                                limit: int = 10, page: int = 1, search: str = '', cursor: str = None,
+                                assessmentRepo: AssessmentRepository = Depends(),
+                                questionRepo: QuestionRepository = Depends()):
     
-    await assessmentRepo.get_by_id(assessment_id=assessment_id)
+    await assessmentRepo.get(assessment_id=assessment_id)
     
     if current_user.role == UserType.CANDIDATE:
-        question = await questionRepo.get_random_list(page=page, limit=limit, filter=search, assessment_id=assessment_id)
+        question, next_cursor = await questionRepo.get_random_list(page=page, limit=limit, filter=search,
+                                                                   assessment_id=assessment_id, seed=current_user.id,
+                                                                   cursor=cursor)
     
     else:
-        question = await questionRepo.get_list(page=page, limit=limit, filter=search, assessment_id=assessment_id)
+        question, next_cursor = await questionRepo.get_list(page=page, limit=limit, filter=search,
+                                                            assessment_id=assessment_id, cursor=cursor)
         
     
-    return {"message":"Question added successfully", "data": question}
+    return {"message":"Question added successfully", "data": question, 'next_cursor': next_cursor}
 
 
 @router.post('/{assessment_id}/questions', response_model=CustomResponse[BaseQuestion], tags=["Questions", "Assessments"])
 async def create_assessment_questions(assessment_id: Annotated[UUID, Path(title="The ID of the assessment to be fetched")],
                             current_user: Annotated[BaseUser, Depends(get_current_user)],
-                            payload: CreateQuestionSchema):
+                            payload: CreateQuestionSchema,
+                            db: AsyncSession = Depends(get_async_db),
+                            assessmentRepo: AssessmentRepository = Depends(),
+                            questionRepo: QuestionRepository = Depends()):
     
-    await assessmentRepo.get_by_id(assessment_id=assessment_id)
+    await assessmentRepo.get(assessment_id=assessment_id)
     question = await questionRepo.create_with_answers(payload, assessment_id)
+    await db.commit()
     # get list of question object
     # call create question on each object
     # creates question with details and options?s?
@@ -176,9 +197,11 @@ async def create_assessment_questions(assessment_id: Annotated[UUID, Path(title=
 @router.get('/{assessment_id}/questions/{question_id}', response_model=CustomResponse[BaseQuestion], tags=["Questions", "Assessments"])
 async def fetch_assessment_question(assessment_id: Annotated[UUID, Path(title="The ID of the assessment to be fetched")],
                                     question_id: Annotated[UUID, Path(title="The ID of the question to be fetched")],
-                                   current_user: Annotated[BaseUser, Depends(get_current_user)]):
+                                   current_user: Annotated[BaseUser, Depends(get_current_user)],
+                                   assessmentRepo: AssessmentRepository = Depends(),
+                                   questionRepo: QuestionRepository = Depends()):
     
-    await assessmentRepo.get_by_id(assessment_id=assessment_id)
+    await assessmentRepo.get(assessment_id=assessment_id)
     question = await questionRepo.get(question_id=question_id)
     
     return {"message":"Question fetched successfully","data": question}
@@ -187,10 +210,14 @@ async def fetch_assessment_question(assessment_id: Annotated[UUID, Path(title="T
 @router.delete('/{assessment_id}/questions/{question_id}', response_model=CustomResponse, tags=["Questions", "Assessments"])
 async def delete_assessment_questions(assessment_id: Annotated[UUID, Path(title="The ID of the assessment to be fetched")],
                                     question_id: Annotated[UUID, Path(title="The ID of the question to be deleted")],
-                                current_user: Annotated[BaseUser, Depends(get_current_user)]):
+                                current_user: Annotated[BaseUser, Depends(get_current_user)],
+                                db: AsyncSession = Depends(get_async_db),
+                                assessmentRepo: AssessmentRepository = Depends(),
+                                questionRepo: QuestionRepository = Depends()):
     
-    await assessmentRepo.get_by_id(assessment_id=assessment_id)
+    await assessmentRepo.get(assessment_id=assessment_id)
     question = await questionRepo.delete(question_id)
+    await db.commit()
 
     return question
 
@@ -207,11 +234,15 @@ async def delete_assessment_questions(assessment_id: Annotated[UUID, Path(title=
 
 @router.post('/results', response_model=CustomListResponse[BaseUserResults], tags=["Assessments", "Results"])
 async def create_assessment_results(payload: CreateAssessmentResults, 
-                                    current_user: Annotated[BaseUser, Depends(get_current_user)]):
+                                    current_user: Annotated[BaseUser, Depends(get_current_user)],
+                                    db: AsyncSession = Depends(get_async_db),
+                                    assessmentRepo: AssessmentRepository = Depends(),
+                                    resultRepo: UserResultRepository = Depends()):
     
-    assessment: BaseAssessment = await assessmentRepo.get_by_id(payload.assessment_id)
+    assessment: BaseAssessment = await assessmentRepo.get(payload.assessment_id)
     
     results = await resultRepo.create(payload)
+    await db.commit()
     results = results.__dict__
     results.update({
         "assessment_name": assessment.name,
@@ -227,13 +258,15 @@ async def create_assessment_results(payload: CreateAssessmentResults,
 
 @router.get('/results/{user_id}', response_model=CustomListResponse[BaseUserResults], tags=["Assessments", "Results"])
 async def fetch_user_results(user_id: Annotated[UUID, Path(title="ID of user")],
-                             limit: int = 10, page: int = 1, search: str = ''):
+                             limit: int = 10, page: int = 1, search: str = '', cursor: str = None,
+                             assessmentRepo: AssessmentRepository = Depends(),
+                             resultRepo: UserResultRepository = Depends()):
     print("here")
-    results = await resultRepo.get_by_user_id(page=page, limit=limit, user_id=user_id)
+    results, next_cursor = await resultRepo.get_by_user_id(page=page, limit=limit, user_id=user_id, cursor=cursor)
 
     
     for result in results:
-        assessment: BaseAssessment = await assessmentRepo.get_by_id(assessment_id = result.assessment_id)
+        assessment: BaseAssessment = await assessmentRepo.get(assessment_id = result.assessment_id)
         result = result.__dict__
         result.update({
             "assessment_name": assessment.name,
@@ -242,15 +275,19 @@ async def fetch_user_results(user_id: Annotated[UUID, Path(title="ID of user")],
             "duration": assessment.duration,  
         })
 
-    return {'message': 'Assessments retrieved successfully', 'count': len(results), 'data': results}
+    return {'message': 'Assessments retrieved successfully', 'count': len(results), 'data': results,
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor}
 
 
 @router.get('/{assessment_id}/results/', response_model=CustomListResponse[BaseUserResults], tags=["Assessments", "Results"])
 async def fetch_assessment_results(assessment_id: Annotated[UUID, Path(title="ID of assessment being fetched")],
-                                   limit: int = 10, page: int = 1, search: str = ''):
+                                   limit: int = 10, page: int = 1, search: str = '', cursor: str = None,
+                                   assessmentRepo: AssessmentRepository = Depends(),
+                                   resultRepo: UserResultRepository = Depends()):
     
-    assessment: BaseAssessment = await assessmentRepo.get_by_id(assessment_id=assessment_id)
-    results = await resultRepo.get_by_assessment_id(page=page, limit=limit, assessment_id=assessment_id)
+    assessment: BaseAssessment = await assessmentRepo.get(assessment_id=assessment_id)
+    results, next_cursor = await resultRepo.get_by_assessment_id(page=page, limit=limit, assessment_id=assessment_id,
+                                                                 cursor=cursor)
     
     for result in results:
         result = result.__dict__
@@ -261,14 +298,17 @@ async def fetch_assessment_results(assessment_id: Annotated[UUID, Path(title="ID
             "duration": assessment.duration,  
         })
 
-    return {'message': 'Assessments retrieved successfully', 'count': len(results), 'data': results}
+    return {'message': 'Assessments retrieved successfully', 'count': len(results), 'data': results,
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor}
 
 
 @router.get('/{assessment_id}/results/{result_id}', response_model=CustomListResponse[BaseUserResults], tags=["Assessments", "Results"])
 async def fetch_result(assessment_id: Annotated[UUID, Path(title="ID of assessment being fetched")],
-                result_id: Annotated[UUID, Path(title="ID of result being fetched")]):
+                result_id: Annotated[UUID, Path(title="ID of result being fetched")],
+                assessmentRepo: AssessmentRepository = Depends(),
+                resultRepo: UserResultRepository = Depends()):
     result = await resultRepo.get_by_result_id(result_id=result_id)
-    assessment: BaseAssessment = await assessmentRepo.get_by_id(assessment_id)
+    assessment: BaseAssessment = await assessmentRepo.get(assessment_id)
     result = result.__dict__
     result.update({
         "assessment_name": assessment.name,
@@ -6,15 +6,16 @@ from fastapi import Request
 from fastapi import Depends, HTTPException, status, APIRouter, Response, Path
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.encoders import jsonable_encoder
-from authlib.integrations.starlette_client import OAuthError
 from modules.files.models import File, FileType
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from google.oauth2 import id_token 
-from google.auth.transport import requests 
 
-from core.dependencies.sessions import get_db
-from core.dependencies.auth import TokenHelper, get_current_user, custom_oauth
+from core.dependencies.sessions import get_async_db
+from core.dependencies.auth import TokenHelper, get_current_user, invalidate_user, oauth2_scheme, verify_google_token
+from core.dependencies.rate_limit import RateLimit, by_email
+from core.helpers.revocation import revocation_list
 from core.helpers import password
 from core.helpers.schemas import CustomResponse, CandidateWelcomeEmail, ClientWelcomeEmail, PasswordResetEmail
 from core.env import config
@@ -23,6 +24,7 @@ from core.helpers.mail_utils import *
 
 from modules.auth.schemas import LoginUserSchema, PasswordChangeSchema, PasswordResetRequestSchema, RegisterUserSchema
 from modules.users.models import CandidateProfile, ClientProfile, Company, User
+from modules.users.repository import read_back_user, user_profiles
 from modules.users.schemas import *
 
 from modules.files.schemas import File as FileSchema
@@ -35,17 +37,24 @@ router = APIRouter(
 
 ################### Functions ########################
 
+async def rehash_password(db: AsyncSession, user: User, plain_password: str):
+    '''Re-hashes a just-verified password made with an older BCRYPT_ROUNDS'''
+    if password.needs_rehash(user.password):
+        user.password = await password.hash_password(plain_password)
+        await db.commit()
+
 
 
 ################### ROUTES ###########################
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(RateLimit("login", config.RATE_LIMIT_LOGIN_IP)),
+                                     Depends(RateLimit("login_email", config.RATE_LIMIT_LOGIN_EMAIL, key=by_email))])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()], 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(
-        User.email == form_data.username.lower()).first()
+    user = (await db.execute(select(User).options(*user_profiles()).filter(
+        User.email == form_data.username.lower()))).scalars().first()
     if not user:
         raise UserNotFoundException
 
@@ -54,8 +63,9 @@ async def login_for_access_token(
     #     raise UnauthorisedUserException
 
     # Check if the password is valid
-    if not password.verify_password(form_data.password, user.password):
+    if not await password.verify_password(form_data.password, user.password):
         raise PasswordDoesNotMatchException
+    await rehash_password(db, user, form_data.password)
 
     access_token = TokenHelper.encode(jsonable_encoder(BaseUser.from_orm(user)))
     return {"access_token": access_token, "token_type": "bearer"}
@@ -70,24 +80,25 @@ async def login_for_access_token(
 @router.post('/signup', 
              status_code=status.HTTP_201_CREATED, 
              response_model=CustomResponse[AuthUser], 
-             response_model_exclude_none=True)
-async def create_candidate(payload: RegisterUserSchema, db: Session = Depends(get_db)):
+             response_model_exclude_none=True,
+             dependencies=[Depends(RateLimit("signup", config.RATE_LIMIT_SIGNUP_IP))])
+async def create_candidate(payload: RegisterUserSchema, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exist
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
+    user = (await db.execute(select(User).filter(User.email == payload.email.lower()))).scalars().first()
     if user:
         raise DuplicateEmailException
     #  Hash the password
-    payload.password = password.hash_password(payload.password)
+    payload.password = await password.hash_password(payload.password)
     new_user = User(**payload.dict())
     new_user.role = UserType.CANDIDATE
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
     # update related models
     new_candidate_profile = CandidateProfile(user_id=new_user.id)
     new_candidate_profile.updated_at = datetime.now()
     db.add(new_candidate_profile)
-    db.commit()
+    await db.commit()
+    await db.refresh(new_user, attribute_names=['candidate_profile', 'client_profile'])
     # TODO: Generate confirm email OTP and Send Welcome email
     
     #Send welcome email
@@ -108,15 +119,16 @@ async def create_candidate(payload: RegisterUserSchema, db: Session = Depends(ge
 @router.post('/client/signup', 
              status_code=status.HTTP_201_CREATED, 
              response_model=CustomResponse[AuthUser], 
-             response_model_exclude_none=True)
-async def create_client(payload: RegisterUserSchema, db: Session = Depends(get_db)):
+             response_model_exclude_none=True,
+             dependencies=[Depends(RateLimit("signup", config.RATE_LIMIT_SIGNUP_IP))])
+async def create_client(payload: RegisterUserSchema, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exist
-    user = db.query(User).filter(
-        User.email == payload.email.lower()).first()
+    user = (await db.execute(select(User).filter(
+        User.email == payload.email.lower()))).scalars().first()
     if user:
         raise DuplicateEmailException
     #  Hash the password
-    payload.password = password.hash_password(payload.password)
+    payload.password = await password.hash_password(payload.password)
     payload.email = payload.email.lower()
     new_user = User(**payload.dict())
     new_user.role = UserType.CLIENT
@@ -124,13 +136,13 @@ async def create_client(payload: RegisterUserSchema, db: Session = Depends(get_d
     
     # TODO: Refactor to repository
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
     # update related models
     new_client_profile = ClientProfile(user_id=new_user.id)
     new_client_profile.updated_at = datetime.now()
     db.add(new_client_profile)
-    db.commit()
+    await db.commit()
+    await db.refresh(new_user, attribute_names=['candidate_profile', 'client_profile'])
     #TODO: Generate confirm email OTP and Send Welcome email
     
     #Send welcome email
@@ -152,11 +164,13 @@ Pass email, password
 @router.post('/login',
              status_code=status.HTTP_200_OK,
              response_model=CustomResponse[AuthUser], 
-             response_model_exclude_none=True)
-def login(payload: LoginUserSchema, db: Session = Depends(get_db)):
+             response_model_exclude_none=True,
+             dependencies=[Depends(RateLimit("login", config.RATE_LIMIT_LOGIN_IP)),
+                           Depends(RateLimit("login_email", config.RATE_LIMIT_LOGIN_EMAIL, key=by_email))])
+async def login(payload: LoginUserSchema, db: AsyncSession = Depends(get_async_db)):
     # Check if the user exist
-    user = db.query(User).filter(
-        User.email == payload.email.lower()).first()
+    user = (await db.execute(select(User).options(*user_profiles()).filter(
+        User.email == payload.email.lower()))).scalars().first()
     if not user:
         raise UserNotFoundException
 
@@ -165,8 +179,9 @@ def login(payload: LoginUserSchema, db: Session = Depends(get_db)):
     #     raise UnauthorisedUserException
 
     # Check if the password is valid
-    if not password.verify_password(payload.password, user.password):
+    if not await password.verify_password(payload.password, user.password):
         raise PasswordDoesNotMatchException
+    await rehash_password(db, user, payload.password)
     
     data =  { **jsonable_encoder(BaseUser.from_orm(user)), 
             "token":TokenHelper.encode(jsonable_encoder(BaseUser.from_orm(user)))}
@@ -177,20 +192,20 @@ def login(payload: LoginUserSchema, db: Session = Depends(get_db)):
 @router.post("/login/google", response_model=CustomResponse[AuthUser], 
              status_code=status.HTTP_200_OK)
 async def login_via_google(request: Request,token:str,
-                           db: Session = Depends(get_db)):
+                           db: AsyncSession = Depends(get_async_db)):
     # verify token google
     # fetch user profile from google
     try: 
         # Specify the CLIENT_ID of the app that accesses the backend: 
-        user = id_token.verify_oauth2_token(token, requests.Request(), config.GOOGLE_CLIENT_ID) 
+        user = verify_google_token(token)
 
         request.session['user'] = dict({ 
             "email" : user['email'] 
         })
 
         # Check if the user exist
-        user_object = db.query(User).filter(
-            User.email == user['email'].lower()).first()
+        user_object = (await db.execute(select(User).options(*user_profiles()).filter(
+            User.email == user['email'].lower()))).scalars().first()
 
         if not user_object:
             # register user
@@ -201,13 +216,13 @@ async def login_via_google(request: Request,token:str,
                             password='p@ss!234_')
             new_user.role = UserType.CANDIDATE
             db.add(new_user)
-            db.commit()
-            db.refresh(new_user)
+            await db.flush()
             # update related models
             new_candidate_profile = CandidateProfile(user_id=new_user.id)
             new_candidate_profile.updated_at = datetime.now()
             db.add(new_candidate_profile)
-            db.commit()
+            await db.commit()
+            await db.refresh(new_user, attribute_names=['candidate_profile', 'client_profile'])
             # TODO: Generate confirm email OTP and Send Welcome email
             data =  { **jsonable_encoder(BaseUser.from_orm(new_user)), 
                     "token":TokenHelper.encode(jsonable_encoder(BaseUser.from_orm(new_user)))}
@@ -224,12 +239,12 @@ async def login_via_google(request: Request,token:str,
 @router.post("/login/admin/google", response_model=CustomResponse[AuthUser], 
              status_code=status.HTTP_200_OK)
 async def admin_login_via_google(request: Request,token:str,
-                           db: Session = Depends(get_db)):
+                           db: AsyncSession = Depends(get_async_db)):
     # verify token google
     # fetch user profile from google
     try: 
         # Specify the CLIENT_ID of the app that accesses the backend: 
-        user = id_token.verify_oauth2_token(token, requests.Request(), config.GOOGLE_CLIENT_ID) 
+        user = verify_google_token(token)
         print(user, flush=True)
         request.session['user'] = dict({ 
             "email" : user['email'] 
@@ -240,8 +255,8 @@ async def admin_login_via_google(request: Request,token:str,
             raise UnauthorisedUserException('You are not authorised to access the page')
 
         # Check if the user exist
-        user_object = db.query(User).filter(
-            User.email == user['email'].lower()).first()
+        user_object = (await db.execute(select(User).options(*user_profiles()).filter(
+            User.email == user['email'].lower()))).scalars().first()
 
         if not user_object:
             # register user
@@ -252,8 +267,9 @@ async def admin_login_via_google(request: Request,token:str,
                             password='p@ss!234_')
             new_user.role = UserType.ADMIN
             db.add(new_user)
-            db.commit()
-            db.refresh(new_user)
+            await db.commit()
+            await db.refresh(new_user)
+            await db.refresh(new_user, attribute_names=['candidate_profile', 'client_profile'])
             # TODO: Generate confirm email OTP and Send Welcome email
             data =  { **jsonable_encoder(BaseUser.from_orm(new_user)), 
                     "token":TokenHelper.encode(jsonable_encoder(BaseUser.from_orm(new_user)))}
@@ -269,18 +285,24 @@ async def admin_login_via_google(request: Request,token:str,
 
 
 @router.get('/logout', status_code=status.HTTP_200_OK)
-def logout(response: Response):
-    # TODO: blacklist in redis cache
+async def logout(token: Annotated[str, Depends(oauth2_scheme)],
+                 current_user: Annotated[BaseUser, Depends(get_current_user)]):
+    # the token is rejected from now until it would have expired anyway
+    claims = TokenHelper.verify(token)
+    if claims.get("jti"):
+        await revocation_list.revoke(claims["jti"], claims["exp"])
     return {'status': 'success'}
 
 @router.post('/reset-password',
              response_model=CustomResponse, 
-             response_model_exclude_none=True)
+             response_model_exclude_none=True,
+             dependencies=[Depends(RateLimit("reset_password", config.RATE_LIMIT_RESET_IP)),
+                           Depends(RateLimit("reset_password_email", config.RATE_LIMIT_RESET_EMAIL, key=by_email))])
 async def password_reset_request(payload: PasswordResetRequestSchema, 
-                                 db: Session = Depends(get_db)):
+                                 db: AsyncSession = Depends(get_async_db)):
     # Check if the user exist
-    user = db.query(User).filter(
-        User.email == payload.email.lower()).first()
+    user = (await db.execute(select(User).filter(
+        User.email == payload.email.lower()))).scalars().first()
     if not user:
         raise UserNotFoundException
     
@@ -299,20 +321,20 @@ async def password_reset_request(payload: PasswordResetRequestSchema,
              response_model_exclude_none=True)
 async def change_password(payload: PasswordChangeSchema, 
                           current_user: Annotated[BaseUser, Depends(get_current_user)],
-                          db: Session = Depends(get_db)):
+                          db: AsyncSession = Depends(get_async_db)):
     
-    payload.password = password.hash_password(payload.password)
+    payload.password = await password.hash_password(payload.password)
     # TODO: Refactor to repository
     # new_user.modified = datetime.utcnow()
-    user = db.query(User).filter(User.email == current_user.email)
-    new_user = user.first()
-    if user is None:
+    new_user = (await db.execute(select(User).filter(User.email == current_user.email))).scalars().first()
+    if new_user is None:
         raise UserNotFoundException
-    user.update(payload.dict())
-    db.commit()
-    db.refresh(new_user)
+    await db.execute(update(User).filter(User.id == new_user.id).values(payload.dict()))
+    await db.commit()
+    invalidate_user(new_user.id)
+    new_user = await read_back_user(db, new_user.id)
     # TODO: Trigger email confirmation
-    return  {"message": "Password update successful", "data": BaseUser.from_orm(user.first())}
+    return  {"message": "Password update successful", "data": BaseUser.from_orm(new_user)}
 
 
 @router.post('/confirm-email')
@@ -321,7 +343,7 @@ async def confirm_email():
     return True
 
 
-def onboarding_checker(current_user: BaseUser, db):
+async def onboarding_checker(current_user: BaseUser, db):
     # get full user profile
     # user = db.query(User).filter(User.email == current_user.email)
     # new_user = user.first()
@@ -342,10 +364,10 @@ def onboarding_checker(current_user: BaseUser, db):
     if current_user.role == UserType.CLIENT and current_user.client_profile:
         if current_user.client_profile.company:
             onboarding_status.company_profile_complete = True
-            jobs = db.query(Job).options(
+            jobs = (await db.execute(select(Job).options(
                         joinedload(Job.company)
                         .joinedload(Company.profile)).filter(
-                        Job.company_id == current_user.client_profile.company.id).limit(1).offset(0).all()
+                        Job.company_id == current_user.client_profile.company.id).limit(1).offset(0))).scalars().all()
             
             if len(jobs) > 1: 
                 onboarding_status.post_first_job = True
@@ -359,20 +381,20 @@ def onboarding_checker(current_user: BaseUser, db):
             
             response_model=CustomResponse[BaseUser]
             )
-def get_current_user(current_user: Annotated[BaseUser, Depends(get_current_user)], db: Session = Depends(get_db)):
+async def get_current_user(current_user: Annotated[BaseUser, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db)):
     if(current_user.role == UserType.CANDIDATE):
-        cv_files = db.query(File).filter(
+        cv_files = (await db.execute(select(File).filter(
             File.owner_id == current_user.id, File.type == FileType.RESUME)\
-            .order_by(File.created_at.desc()).limit(3).all()
+            .order_by(File.created_at.desc()).limit(3))).scalars().all()
         if current_user.candidate_profile:
             current_user.candidate_profile.cv = TypeAdapter(List[FileSchema]).validate_python(cv_files)
     elif(current_user.role == UserType.CLIENT):
-        company = db.query(Company).options(
-                joinedload(Company.profile)).filter(Company.owner_id == str(current_user.id)).first()
+        company = (await db.execute(select(Company).options(
+                joinedload(Company.profile)).filter(Company.owner_id == str(current_user.id)))).scalars().first()
         if company:
             current_user.client_profile.company = company
 
-    current_user.onboarding_steps = onboarding_checker(current_user, db)
+    current_user.onboarding_steps = await onboarding_checker(current_user, db)
     return  {"message": "User profile successfully retrieved", "data": current_user}
 
 #  TODO: 
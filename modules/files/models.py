@@ -33,5 +33,7 @@ class File(Base):
     updated_at = Column(TIMESTAMP(timezone=True),
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
+    __table_args__ = (Index('ix_files_owner_created_at_id', 'owner_id', 'created_at', 'id'), )
+
     def __repr__(self):
         return f"<File {self.name}>"
\ No newline at end of file
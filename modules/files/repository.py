@@ -1,13 +1,41 @@
-
-
-from sqlalchemy.orm import Session
-
-from core.dependencies.sessions import get_db
+from collections import defaultdict
+from typing import Dict, Iterable, List
+from uuid import UUID
+
+from fastapi import Depends
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from core.dependencies.sessions import get_async_db
+from .models import File, FileType
+
+
+async def latest_files(db: AsyncSession, owner_ids: Iterable[UUID], type: FileType,
+                       per_owner: int = 3) -> Dict[UUID, List[File]]:
+    '''
+        The `per_owner` newest files of `type` for each owner, newest first,
+        in one query: rows are numbered per owner on the
+        ix_files_owner_created_at_id order and the first few kept
+    '''
+    owner_ids = set(owner_ids)
+    if not owner_ids:
+        return {}
+    position = func.row_number().over(partition_by=File.owner_id,
+                                      order_by=(File.created_at.desc(), File.id.desc())).label("position")
+    ranked = select(File, position).filter(File.owner_id.in_(owner_ids), File.type == type).subquery()
+    ranked_file = aliased(File, ranked)
+    query = select(ranked_file).filter(ranked.c.position <= per_owner).order_by(ranked.c.owner_id, ranked.c.position)
+
+    files = defaultdict(list)
+    for file in (await db.execute(query)).scalars():
+        files[file.owner_id].append(file)
+    return files
 
 
 class FileRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self):
         pass
@@ -22,4 +50,4 @@ class FileRepository:
         pass
 
     async def delete(self):
-        pass
\ No newline at end of file
+        pass
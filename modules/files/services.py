@@ -8,16 +8,19 @@ import magic
 from fastapi import Depends, status, APIRouter, File, UploadFile
 from modules.users.models import CandidateProfile, ClientProfile, Company, User, UserType
 from modules.users.schemas import BaseUser
-from sqlalchemy import or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-from core.dependencies.sessions import get_db
-from core.dependencies.auth import get_current_user, get_current_user_object
+from core.dependencies.sessions import get_async_db
+from core.dependencies.auth import get_current_user, get_current_user_object, invalidate_company, invalidate_user
 from core.exceptions import NotFoundException, BadRequestException
 from core.helpers.schemas import CustomListResponse, CustomResponse
+from core.helpers.pagination import paginate
 from core.helpers.s3client import upload_files
 
+from modules.jobs.repository import invalidate_company_feed
+
 from .models import File, FileType
 from .schemas import File as FilesSchema
 
@@ -39,22 +42,21 @@ SUPPORTED_FILE_TYPES = {
 
 
 @router.get("/", response_model=CustomListResponse[FilesSchema], tags=["Files"])
-async def fetch_my_files(db: Session = Depends(get_db), limit: int = 10, page: int = 1, search: str = '', 
-                          current_user: str = Depends(get_current_user)):
-    skip = (page - 1) * limit
-
-    files = db.query(File).filter(
-        File.owner_id == current_user.id).limit(limit).offset(skip).all()
+async def fetch_my_files(db: AsyncSession = Depends(get_async_db), limit: int = 10, page: int = 1, search: str = '', 
+                          cursor: str = None, current_user: str = Depends(get_current_user)):
+    files, next_cursor = await paginate(db, select(File).filter(
+        File.owner_id == current_user.id), limit=limit, cursor=cursor, page=page)
     
     if len(files) < 1: 
         raise NotFoundException('No Files found')
-    return {'message': 'File list retrieved successfully', 'count': len(files),'data': files}
+    return {'message': 'File list retrieved successfully', 'count': len(files),
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor, 'data': files}
 
 
 @router.post("/upload", response_model=CustomResponse[FilesSchema], tags=["Files"])
 async def create_upload_file(file: UploadFile, type: FileType,
                     current_user: Annotated[User, Depends(get_current_user)],
-                   db: Session = Depends(get_db)):
+                   db: AsyncSession = Depends(get_async_db)):
     if not file:
         raise NotFoundException('No upload file sent')
     # else:
@@ -85,24 +87,31 @@ async def create_upload_file(file: UploadFile, type: FileType,
 
     # update user profile
     if current_user.role == UserType.CANDIDATE: #TODO:Refactor to repo
-        user_query = db.query(User).options(joinedload(User.candidate_profile)
-                                            ).filter(User.id == current_user.id)
-        profile_query = db.query(CandidateProfile).filter(CandidateProfile.user_id == current_user.id)
+        user_query = update(User).filter(User.id == current_user.id)
+        profile_query = update(CandidateProfile).filter(CandidateProfile.user_id == current_user.id)
     else: 
-        user_query = db.query(User).options(joinedload(User.client_profile)).filter(User.id == current_user.id)
-        profile_query = db.query(ClientProfile).filter(ClientProfile.user_id == current_user.id)
-        company_query = db.query(Company).filter(or_(Company.owner_id == str(current_user.id)))
+        user_query = update(User).filter(User.id == current_user.id)
+        profile_query = update(ClientProfile).filter(ClientProfile.user_id == current_user.id)
+        company_query = update(Company).filter(or_(Company.owner_id == str(current_user.id)))
 
+    company_ids = []
     if type == FileType.PROFILE_PHOTO:
-        user_query.update({'photo': uploaded_file_url}, synchronize_session=False)
+        await db.execute(user_query.values({'photo': uploaded_file_url}).execution_options(synchronize_session=False))
     # elif type == FileType.RESUME:
     #     profile_query.update({CandidateProfile.cv : [uploaded_file_url]}, synchronize_session=False)
     elif type == FileType.LOGO and current_user.role == UserType.CLIENT:
-        company_query.update({Company.logo_url:uploaded_file_url}, synchronize_session=False)  
+        company_ids = (await db.execute(company_query.values({Company.logo_url:uploaded_file_url}).returning(
+            Company.id).execution_options(synchronize_session=False))).scalars().all()
         
     
-    db.commit()
-    db.refresh(new_file)
+    await db.commit()
+    # cached users and feed pages still show the old photo or logo
+    if type == FileType.PROFILE_PHOTO:
+        invalidate_user(current_user.id)
+    for company_id in company_ids:
+        invalidate_company(company_id)
+        invalidate_company_feed(company_id)
+    await db.refresh(new_file)
 
     return {'message': 'File uploaded successfully',
             'data': new_file}
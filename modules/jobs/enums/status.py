@@ -13,3 +13,14 @@ class ApplicationStatus(str, enum.Enum):
     INTERVIEWING = "INTERVIEWING"
     HIRED = 'HIRED'
     REJECTED = 'REJECTED'
+
+
+# status -> the statuses a recruiter may move an application to from it
+APPLICATION_TRANSITIONS = {
+    ApplicationStatus.PENDING: {ApplicationStatus.SHORTLISTED, ApplicationStatus.REJECTED},
+    ApplicationStatus.SHORTLISTED: {ApplicationStatus.INTERVIEWING, ApplicationStatus.REJECTED},
+    ApplicationStatus.INTERVIEWING: {ApplicationStatus.HIRED, ApplicationStatus.REJECTED},
+    # a rejected applicant can be reconsidered, a hire is final
+    ApplicationStatus.REJECTED: {ApplicationStatus.SHORTLISTED},
+    ApplicationStatus.HIRED: set(),
+}
@@ -0,0 +1,127 @@
+'''
+    Feed cache invalidation between workers
+
+    Every worker keeps its own feed pages (feed_cache in repository.py) and
+    drops exactly the ones a job or company write changes. The worker that
+    serves the write does that straight away; it also publishes the
+    invalidation here, and the other workers apply it before they serve a
+    cached page again.
+
+    Invalidations go to JOB_FEED_EVENTS_URL:
+    - memory://     nothing is shared, for a single worker
+    - redis://...   each one is a key feed_events:<n>, n from INCR
+                    feed_events, kept JOB_FEED_CACHE_TTL seconds (no page
+                    lives longer). A worker about to serve a cached page
+                    reads feed_events, one GET when nothing changed, and
+                    applies the invalidations it hasn't seen. One it can't
+                    read (expired, too many behind, or not written yet)
+                    drops all of its pages instead
+'''
+import asyncio
+import json
+import os
+import socket
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from core.dependencies.logging import logger
+from core.helpers.resp import RespClient
+
+
+# further behind than this, the worker drops its pages rather than reading them all
+MAX_EVENTS = 1000
+
+
+class MemoryEventStore:
+    async def publish(self, event: str) -> None:
+        pass
+
+    async def since(self, last: Optional[int]) -> Tuple[int, Optional[List[Optional[str]]]]:
+        return 0, []
+
+
+class RedisEventStore:
+    KEY = "feed_events"
+
+    def __init__(self, url: str, ttl: int):
+        self.client = RespClient(url)
+        self.ttl = ttl
+
+    async def publish(self, event: str) -> None:
+        number = await self.client.execute("INCR", self.KEY)
+        await self.client.execute("SET", f"{self.KEY}:{number}", event, "EX", self.ttl)
+
+    async def since(self, last: Optional[int]) -> Tuple[int, Optional[List[Optional[str]]]]:
+        '''The latest event number and the events after `last`, None if they can't all be read'''
+        latest = int(await self.client.execute("GET", self.KEY) or 0)
+        if last is None or latest <= last:
+            return latest, []
+        if latest - last > MAX_EVENTS:
+            return latest, None
+        return latest, await self.client.execute("MGET", *(f"{self.KEY}:{number}"
+                                                            for number in range(last + 1, latest + 1)))
+
+
+class FeedEvents:
+    def __init__(self, store):
+        self.store = store
+        # the last event applied, None until the first pull
+        self.last: Optional[int] = None
+        self.stats = {"published": 0, "applied": 0, "resets": 0, "errors": 0}
+        self._publishing = set()
+
+    @staticmethod
+    def origin() -> str:
+        # per worker, taken after the fork
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def publish(self, event: dict) -> None:
+        '''Sends the invalidation to the other workers, in the background'''
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._publish(json.dumps({**event, "origin": self.origin()}, default=str)))
+        # keep a reference until it's done, the loop only holds a weak one
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _publish(self, event: str) -> None:
+        try:
+            await self.store.publish(event)
+            self.stats["published"] += 1
+        except Exception as err:
+            # the other workers catch up when their pages expire
+            self.stats["errors"] += 1
+            logger.error(f"Could not publish a feed invalidation: {err}")
+
+    async def pull(self, apply: Callable[[dict], None], reset: Callable[[], None]) -> bool:
+        '''Applies the other workers' invalidations, False if the cache can't be trusted right now'''
+        try:
+            latest, events = await self.store.since(self.last)
+        except Exception as err:
+            self.stats["errors"] += 1
+            logger.error(f"Could not read the feed invalidations: {err}")
+            return False
+        if self.last is None or events is None or None in events:
+            # pages from before the first pull, or invalidations that are lost
+            if self.last is not None:
+                self.stats["resets"] += 1
+            reset()
+        else:
+            origin = self.origin()
+            for event in map(json.loads, events):
+                if event.pop("origin", None) != origin:
+                    apply(event)
+                    self.stats["applied"] += 1
+        self.last = latest
+        return True
+
+
+def create_store(url: str, ttl: int):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryEventStore()
+    if scheme in ("redis", "rediss"):
+        return RedisEventStore(url, ttl)
+    raise ValueError(f"Unsupported feed events store: {url}")
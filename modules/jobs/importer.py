@@ -0,0 +1,162 @@
+'''
+    Bulk job import
+
+    POST /jobs/import takes a CSV file (header row, list fields separated
+    by ";") or JSON lines, one job per row with the fields of POST /jobs.
+    The upload is already spooled by Starlette; rows are read from it one
+    at a time and validated against CreateJobSchema in a thread, so a big
+    file never sits in memory as a whole and doesn't block the event loop.
+
+    Rows that don't validate end up in the report. The valid ones get a
+    slug that is unique within the company: the existing slugs they could
+    clash with are fetched in one query, clashes get a ".2", ".3"...
+    suffix (slugs are cut at 15 characters, different titles often share
+    one). They are inserted JOB_IMPORT_BATCH_SIZE rows per INSERT in the
+    caller's transaction, which commits them, so either every valid row is
+    imported or none is. Once committed the new jobs are handed to the
+    recommendation index like created ones.
+'''
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Iterator, List, NamedTuple, Tuple, Union
+from uuid import UUID
+
+from fastapi import UploadFile
+from pydantic import ValidationError
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.env import config
+from core.exceptions.base import BadRequestException
+from core.helpers.text_utils import to_slug
+
+from .enums import JobStatus
+from .models import Job
+from .schemas import CreateJobSchema, JobImportError, JobImportReport
+
+
+LIST_FIELDS = ("qualifications", "skills", "benefits")
+LIST_SEPARATOR = ";"
+JSONL_TYPES = ("application/jsonl", "application/x-ndjson", "application/x-jsonlines")
+
+
+class ParsedUpload(NamedTuple):
+    rows: int
+    # (line, job) of the rows that validated
+    jobs: List[Tuple[int, CreateJobSchema]]
+    errors: List[JobImportError]
+
+
+class ImportedJobs(NamedTuple):
+    report: JobImportReport
+    # not committed yet
+    job_ids: List[UUID]
+
+
+def upload_format(upload: UploadFile) -> str:
+    name = (upload.filename or "").lower()
+    if name.endswith(".csv") or upload.content_type == "text/csv":
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")) or upload.content_type in JSONL_TYPES:
+        return "jsonl"
+    raise BadRequestException("Upload a .csv or .jsonl file")
+
+
+def csv_rows(stream) -> Iterator[Tuple[int, Union[dict, str]]]:
+    reader = csv.DictReader(stream)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, "More values than columns in the header"
+            continue
+        values = {}
+        for field, value in row.items():
+            field, value = field.strip(), (value or "").strip()
+            if field in LIST_FIELDS:
+                values[field] = [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+            elif value:
+                values[field] = value
+        yield reader.line_num, values
+
+
+def jsonl_rows(stream) -> Iterator[Tuple[int, Union[dict, str]]]:
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            values = json.loads(text)
+        except ValueError as err:
+            yield line, f"Invalid JSON: {err}"
+            continue
+        yield line, values if isinstance(values, dict) else "Each line must be a JSON object"
+
+
+def parse_upload(file: BinaryIO, format: str, max_rows: int) -> ParsedUpload:
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    rows, jobs, errors = 0, [], []
+    try:
+        for line, values in (csv_rows if format == "csv" else jsonl_rows)(stream):
+            rows += 1
+            if rows > max_rows:
+                errors.append(JobImportError(line=line, errors=[f"Only {max_rows} rows are imported per file, "
+                                                                "this row and the ones after it were skipped"]))
+                rows -= 1
+                break
+            if isinstance(values, str):
+                errors.append(JobImportError(line=line, errors=[values]))
+                continue
+            # the company is the one importing
+            values.pop("company_id", None)
+            try:
+                jobs.append((line, CreateJobSchema.model_validate(values)))
+            except ValidationError as err:
+                errors.append(JobImportError(line=line, errors=[
+                    f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in err.errors()]))
+    except UnicodeDecodeError:
+        raise BadRequestException("The file must be UTF-8 text")
+    finally:
+        # closing the wrapper would close the upload
+        stream.detach()
+    return ParsedUpload(rows, jobs, errors)
+
+
+async def unique_slugs(db: AsyncSession, company_id: UUID, titles: List[str]) -> List[str]:
+    '''A slug per title, unique within the company and the list'''
+    bases = [to_slug(title) for title in titles]
+    candidates = set(bases)
+    taken = set((await db.execute(select(Job.slug).filter(
+        Job.company_id == company_id,
+        # "python.dev" and the "python.dev.2"... given to earlier clashes
+        or_(Job.slug.in_(candidates), func.regexp_replace(Job.slug, r'\.\d+$', '').in_(candidates))))).scalars())
+
+    slugs = []
+    for base in bases:
+        slug, number = base, 1
+        while slug in taken:
+            number += 1
+            slug = f"{base}.{number}"
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+async def import_job_file(db: AsyncSession, upload: UploadFile, company_id: UUID) -> ImportedJobs:
+    '''Inserts the valid rows of `upload` in `db`'s transaction, the caller commits'''
+    parsed = await asyncio.to_thread(parse_upload, upload.file, upload_format(upload), int(config.JOB_IMPORT_MAX_ROWS))
+    slugs = await unique_slugs(db, company_id, [job.title for _, job in parsed.jobs])
+
+    # what create_job sets on a new job. updated_at is left to the database
+    # clock, the recommendation index syncs against it
+    deadline = datetime.now(timezone.utc) + timedelta(days=10)
+    values = [{**job.model_dump(exclude={"company_id"}), "slug": slug, "tags": [slug, to_slug(job.type)],
+               "company_id": company_id, "status": JobStatus.ACTIVE, "deadline": deadline}
+              for (_, job), slug in zip(parsed.jobs, slugs)]
+    batch_size = int(config.JOB_IMPORT_BATCH_SIZE)
+    job_ids = []
+    for start in range(0, len(values), batch_size):
+        job_ids += (await db.execute(insert(Job).returning(Job.id), values[start:start + batch_size])).scalars()
+
+    return ImportedJobs(JobImportReport(rows=parsed.rows, imported=len(values),
+                                        errors=sorted(parsed.errors, key=lambda error: error.line)), job_ids)
@@ -0,0 +1,115 @@
+'''
+    Job lifecycle
+
+    create_job gives every job a deadline, JobLifecycle closes the job once
+    it has passed. Each worker runs a tick every JOB_LIFECYCLE_INTERVAL
+    seconds: one UPDATE that closes up to JOB_LIFECYCLE_BATCH expired jobs,
+    found through ix_jobs_active_deadline. Rows another worker is already
+    closing are skipped (FOR UPDATE SKIP LOCKED), so workers share the work
+    without waiting on each other. A full batch means more jobs are due and
+    the next tick runs straight away.
+
+    Every closed job is handed to the on_transition listeners as a
+    JobTransition, in the worker that closed it. The feed cache and the
+    recommendation index listen, other workers pick the change up from
+    updated_at like any other job update.
+'''
+import asyncio
+from types import SimpleNamespace
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Row, func, select, update
+
+from core.dependencies.logging import logger
+from core.dependencies.sessions import AsyncSessionLocal
+from core.env import config
+
+from .enums import JobStatus
+from .models import Job
+from .recommender import job_index
+from .repository import invalidate_feed
+
+
+# what the listeners get about each job, enough to match it against feed filters
+TRANSITION_COLUMNS = (Job.id, Job.company_id, Job.status, Job.deadline, Job.type, Job.experienceLevel,
+                      Job.locationType, Job.currency, Job.qualifications, Job.skills,
+                      Job.salaryRangeFrom, Job.salaryRangeTo)
+
+
+class JobTransition(NamedTuple):
+    job: Row
+    previous: JobStatus
+    status: JobStatus
+
+
+class JobLifecycle:
+    def __init__(self, interval: float, batch: int):
+        self.interval = interval
+        self.batch = batch
+        self.listeners: List[Callable[[List[JobTransition]], None]] = []
+        self.stats = {"ticks": 0, "closed": 0, "errors": 0}
+        self._task = None
+
+    def on_transition(self, listener: Callable[[List[JobTransition]], None]):
+        self.listeners.append(listener)
+        return listener
+
+    def start(self) -> None:
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                closed = await self.close_expired()
+            except Exception as err:
+                self.stats["errors"] += 1
+                logger.error(f"Could not close expired jobs: {err}")
+                closed = 0
+            await asyncio.sleep(0 if closed >= self.batch else self.interval)
+
+    async def close_expired(self) -> int:
+        '''Closes one batch of ACTIVE jobs past their deadline, returns how many'''
+        expired = select(Job.id).filter(Job.status == JobStatus.ACTIVE, Job.deadline < func.now()).order_by(
+            Job.deadline).limit(self.batch).with_for_update(skip_locked=True)
+        statement = update(Job).filter(Job.id.in_(expired.scalar_subquery())).values(
+            status=JobStatus.CLOSED).returning(*TRANSITION_COLUMNS).execution_options(synchronize_session=False)
+        async with AsyncSessionLocal() as db:
+            jobs = (await db.execute(statement)).all()
+            await db.commit()
+
+        self.stats["ticks"] += 1
+        self.stats["closed"] += len(jobs)
+        if jobs:
+            logger.info(f"Closed {len(jobs)} jobs past their deadline")
+            self.emit([JobTransition(job, JobStatus.ACTIVE, JobStatus.CLOSED) for job in jobs])
+        return len(jobs)
+
+    def emit(self, transitions: List[JobTransition]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(transitions)
+            except Exception as err:
+                # the jobs are closed either way, a listener can't undo that
+                logger.error(f"Job transition listener {listener.__name__} failed: {err}")
+
+
+job_lifecycle = JobLifecycle(float(config.JOB_LIFECYCLE_INTERVAL), int(config.JOB_LIFECYCLE_BATCH))
+
+
+@job_lifecycle.on_transition
+def refresh_job_caches(transitions: List[JobTransition]) -> None:
+    for transition in transitions:
+        job_index.mark_stale(transition.job.id)
+    # the cached pages still show the jobs as they were
+    invalidate_feed(*(SimpleNamespace(**{**transition.job._asdict(), "status": transition.previous})
+                      for transition in transitions))
@@ -1,9 +1,9 @@
 import uuid
 from sqlalchemy import (TIMESTAMP, Column, ForeignKey, 
-                        String, Boolean, text, Enum, Integer, Text, cast, Index)
-from sqlalchemy.dialects.postgresql import ARRAY, array
+                        String, Boolean, text, Enum, Integer, Text, cast, Index, Computed, DDL, event)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, array
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, query_expression, relationship
 from sqlalchemy_mixins import AllFeaturesMixin
 
 
@@ -14,6 +14,19 @@ from .enums import (
     ExperienceLevel, Currency, JobType, JobStatus, 
                     LocationType, Qualification, ApplicationStatus)
 
+# array_to_string is only STABLE, a generated column needs an IMMUTABLE
+# function. Joining text with spaces doesn't depend on any setting
+SEARCH_TEXT_FUNCTION = '''
+CREATE OR REPLACE FUNCTION job_search_text(text[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT coalesce(array_to_string($1, ' '), '') $$
+'''
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', job_search_text(skills::text[]) || ' ' || job_search_text(tags)), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')")
+
+
 class Job(Base):
     __tablename__ = "jobs"
     id = Column(UUID(as_uuid=True), primary_key=True, nullable=False,
@@ -41,11 +54,45 @@ class Job(Base):
     # currency, benefits)
     # tier = 
     tags = Column(ARRAY(Text), nullable=False, default=cast(array([], type_=Text), ARRAY(Text)))
-    __table_args__ = (Index('ix_job_tags', tags, postgresql_using="gin"), )
+
+    # Full-text search document, kept up to date by postgres. Title weighs
+    # most, then skills and tags, then the description. Only used in WHERE
+    # and ORDER BY, deferred so loading a job doesn't fetch it
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR, persisted=True), nullable=False))
+    # relevance of the job to a search, only loaded by search queries
+    search_rank = query_expression()
+    __table_args__ = (Index('ix_job_tags', tags, postgresql_using="gin"),
+                      Index('ix_jobs_search_vector', search_vector, postgresql_using="gin"),
+                      # keyset pagination, see core/helpers/pagination.py
+                      Index('ix_jobs_created_at_id', 'created_at', 'id'),
+                      Index('ix_jobs_company_created_at_id', 'company_id', 'created_at', 'id'),
+                      Index('ix_jobs_status_created_at_id', 'status', 'created_at', 'id'),
+                      # feed filters, see filter_jobs in repository.py
+                      Index('ix_jobs_skills', 'skills', postgresql_using="gin"),
+                      Index('ix_jobs_qualifications', 'qualifications', postgresql_using="gin"),
+                      Index('ix_jobs_active_created_at_id', 'created_at', 'id',
+                            postgresql_where=text("status = 'ACTIVE'")),
+                      Index('ix_jobs_active_location_type', 'locationType', 'created_at', 'id',
+                            postgresql_where=text("status = 'ACTIVE'")),
+                      # covers the facet counts, an index only scan for the enum filters
+                      Index('ix_jobs_active_facets', 'locationType', 'experienceLevel', 'type', 'currency',
+                            postgresql_include=['qualifications', 'salaryRangeFrom', 'salaryRangeTo'],
+                            postgresql_where=text("status = 'ACTIVE'")),
+                      Index('ix_jobs_active_salary', 'salaryRangeTo', 'salaryRangeFrom',
+                            postgresql_where=text("status = 'ACTIVE'")),
+                      # incremental syncs of the recommendation index, see recommender.py
+                      Index('ix_jobs_updated_at', 'updated_at'),
+                      # expired job sweeps, see lifecycle.py
+                      Index('ix_jobs_active_deadline', 'deadline',
+                            postgresql_where=text("status = 'ACTIVE'")), )
 # db.session.query(Post).filter(Post.tags.contains([tag]))
     # Company owner
     company_id=Column(UUID(as_uuid=True), ForeignKey("companies.id"))
     company = relationship("Company")
+    # read only, rows are written by count_applications in repository.py and
+    # dropped with the job by the foreign key. Only the company sees them,
+    # the queries behind ClientJob responses load them
+    status_counts = relationship("JobApplicationCount", viewonly=True)
 
     # Audit logs
     created_at = Column(TIMESTAMP(timezone=True),
@@ -54,6 +101,15 @@ class Job(Base):
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
 
+    @property
+    def application_counts(self) -> dict:
+        '''status -> number of applications, statuses without any left out'''
+        return {row.status.value: row.count for row in self.status_counts if row.count}
+    
+
+event.listen(Job.__table__, "before_create", DDL(SEARCH_TEXT_FUNCTION))
+
+
 class Application(Base):
     __tablename__ = "applications"
     id = Column(UUID(as_uuid=True), primary_key=True, nullable=False,
@@ -76,6 +132,18 @@ class Application(Base):
     
 
 
+class JobApplicationCount(Base):
+    '''
+        Applications of a job per status, kept up to date in the transaction
+        that adds, moves or deletes an application, so listing jobs with
+        their counts never counts applications
+    '''
+    __tablename__ = "job_application_counts"
+    job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(Enum(ApplicationStatus), primary_key=True)
+    count = Column(Integer(), nullable=False, server_default=text("0"))
+
+
 class JobAssessment(Base):
     __tablename__ = 'job_assessments'
     id = Column(UUID(as_uuid=True), primary_key=True, nullable=False,
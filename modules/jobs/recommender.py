@@ -0,0 +1,311 @@
+'''
+    Job recommendations
+
+    Every active job is scored against the candidate's profile:
+    - skills      cosine between the candidate's skills and the job's terms
+                  (skills, title and tag words), rarer terms weigh more.
+                  The candidate's industries count as weaker skills
+    - experience  how far years_of_experience is from the job's level
+    - salary      how much of desired_earnings the job pays, same currency only
+
+    The jobs are kept in memory as a sparse job x term matrix stored by
+    term (the rows each term appears in) next to flat numpy arrays for the
+    level, salary and currency. Scoring is one bincount over the
+    candidate's terms plus a few array operations, then argpartition for
+    the top k, so a request doesn't touch the database until it loads the
+    winning jobs.
+
+    The index is per worker. It is built on first use, then brought up to
+    date with the jobs updated since the last sync: straight away for jobs
+    this worker changed (mark_stale), every RECOMMENDER_SYNC_SECONDS for
+    the rest. Changed jobs get a new row, their old row is switched off.
+    Deleted jobs are only dropped by the periodic full rebuild, the winners
+    are loaded with status = ACTIVE so they never reach a response.
+'''
+import asyncio
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.dependencies.sessions import AsyncSessionLocal
+from core.env import config
+from core.dependencies.logging import logger
+
+from .enums import Currency, ExperienceLevel, JobStatus
+from .models import Job
+
+
+SKILL_WEIGHT, EXPERIENCE_WEIGHT, SALARY_WEIGHT = 0.6, 0.25, 0.15
+# an industry is a hint, not a skill the candidate has
+INDUSTRY_TERM_WEIGHT = 0.5
+# upper bounds of years_of_experience for INTERN, ENTRY, JUNIOR, INTERMEDIATE
+EXPERIENCE_YEARS = (1, 2, 4, 7)
+LEVELS = {level: index for index, level in enumerate(ExperienceLevel)}
+CURRENCIES = {currency.value: index for index, currency in enumerate(Currency)}
+# updated_at is the transaction's start, a job committed a moment after a
+# sync can carry an earlier time. Syncs look back this far to catch it
+SYNC_OVERLAP = timedelta(seconds=5)
+
+JOB_COLUMNS = (Job.id, Job.title, Job.skills, Job.tags, Job.experienceLevel, Job.salaryRangeTo,
+               Job.currency, Job.status, Job.updated_at)
+
+NON_WORD = re.compile(r"[^a-z0-9+#.]+")
+
+
+@lru_cache(maxsize=100000)
+def normalize(value: str) -> str:
+    return NON_WORD.sub(" ", value.lower()).strip()
+
+
+def words(values: Iterable[str]) -> set:
+    return {word for value in values or () for word in normalize(value).split()}
+
+
+def job_terms(title: str, skills: List[str], tags: List[str]) -> set:
+    # tags are slugs, "senior-backend-engineer" gives its words
+    return ({normalize(skill) for skill in skills or ()} | words([title, *(tags or ())])) - {""}
+
+
+async def database_now(db: AsyncSession) -> datetime:
+    # updated_at comes from the database clock, compare it with the same clock
+    return (await db.execute(select(func.now()))).scalar()
+
+
+class JobMatrix:
+    '''The indexed jobs, one row per job version'''
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.live = 0
+        self.job_ids: List[UUID] = []
+        self.active = np.zeros(capacity, dtype=bool)
+        self.level = np.zeros(capacity, dtype=np.int8)
+        self.salary = np.zeros(capacity, dtype=np.float64)
+        self.currency = np.full(capacity, -1, dtype=np.int8)
+        # sqrt of the number of terms, the norm of the job's row
+        self.norm = np.ones(capacity, dtype=np.float64)
+        # term -> rows, the matrix in compressed column form
+        self.postings = {}
+        # job id -> row, and the updated_at the row was built from
+        self.rows = {}
+        self.versions = {}
+
+    @classmethod
+    def build(cls, jobs) -> "JobMatrix":
+        matrix = cls(max(1024, len(jobs)))
+        matrix.add(jobs)
+        return matrix
+
+    def _grow(self, needed: int):
+        capacity = len(self.active)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        for name in ("active", "level", "salary", "currency", "norm"):
+            old = getattr(self, name)
+            new = np.full(capacity, -1 if name == "currency" else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def remove(self, job_id: UUID):
+        row = self.rows.pop(job_id, None)
+        self.versions.pop(job_id, None)
+        if row is not None:
+            self.active[row] = False
+            self.live -= 1
+
+    def add(self, jobs):
+        '''Indexes active jobs, replacing their previous rows. Inactive ones are removed'''
+        new_postings = defaultdict(list)
+        level, salary, currency, norm = [], [], [], []
+        first = row = self.size
+        for job in jobs:
+            if job.id in self.rows and self.versions[job.id] == job.updated_at:
+                # seen again because of the sync overlap
+                continue
+            self.remove(job.id)
+            if job.status != JobStatus.ACTIVE:
+                continue
+            terms = job_terms(job.title, job.skills, job.tags)
+            for term in terms:
+                new_postings[term].append(row)
+            self.job_ids.append(job.id)
+            level.append(LEVELS.get(job.experienceLevel, 0))
+            salary.append(job.salaryRangeTo or 0)
+            currency.append(CURRENCIES.get(getattr(job.currency, "value", job.currency), -1))
+            norm.append(len(terms) or 1)
+            self.rows[job.id] = row
+            self.versions[job.id] = job.updated_at
+            row += 1
+
+        self._grow(row)
+        self.active[first:row] = True
+        self.level[first:row] = level
+        self.salary[first:row] = salary
+        self.currency[first:row] = currency
+        self.norm[first:row] = np.sqrt(norm)
+        self.live += row - first
+        self.size = row
+        for term, rows in new_postings.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            old = self.postings.get(term)
+            self.postings[term] = rows if old is None else np.concatenate((old, rows))
+
+    @property
+    def dead(self) -> int:
+        return self.size - self.live
+
+    def candidate_terms(self, skills: List[str], industries: List[str]) -> dict:
+        '''term -> weight, idf weighted; terms no job has are left out'''
+        weights = {}
+        for term in words(industries):
+            weights[term] = INDUSTRY_TERM_WEIGHT
+        for skill in skills or ():
+            weights[normalize(skill)] = 1.0
+        live = max(self.live, 1)
+        return {term: weight * np.log1p(live / len(self.postings[term]))
+                for term, weight in weights.items() if term in self.postings}
+
+    def score(self, skills: List[str], industries: List[str], years_of_experience: Optional[int],
+              desired_earnings: Optional[int], currency: Optional[str]) -> np.ndarray:
+        size = self.size
+        terms = self.candidate_terms(skills, industries)
+        if terms:
+            postings = [self.postings[term] for term in terms]
+            weights = np.repeat(np.fromiter(terms.values(), dtype=np.float64, count=len(terms)),
+                                [len(rows) for rows in postings])
+            overlap = np.bincount(np.concatenate(postings), weights=weights, minlength=size)
+            candidate_norm = np.sqrt(sum(weight * weight for weight in terms.values()))
+            skill = overlap / (self.norm[:size] * candidate_norm)
+        else:
+            skill = np.zeros(size)
+
+        if years_of_experience is None:
+            experience = np.full(size, 0.5)
+        else:
+            level = np.searchsorted(EXPERIENCE_YEARS, years_of_experience, side="right")
+            experience = 1 - np.abs(self.level[:size] - level) / (len(LEVELS) - 1)
+
+        salary = np.full(size, 0.5)
+        currency = CURRENCIES.get((currency or "").upper(), -1)
+        if desired_earnings and currency >= 0:
+            same_currency = self.currency[:size] == currency
+            salary[same_currency] = np.minimum(self.salary[:size][same_currency] / desired_earnings, 1)
+
+        scores = SKILL_WEIGHT * skill + EXPERIENCE_WEIGHT * experience + SALARY_WEIGHT * salary
+        scores[~self.active[:size]] = -np.inf
+        return scores
+
+    def top(self, scores: np.ndarray, k: int) -> List[UUID]:
+        k = min(k, self.live)
+        if k <= 0:
+            return []
+        # rows are appended, on equal scores the newer job wins
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((-best, -scores[best]))]
+        return [self.job_ids[row] for row in best]
+
+
+class JobIndex:
+    def __init__(self, sync_seconds: float, rebuild_seconds: float):
+        self.sync_seconds = sync_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.matrix: Optional[JobMatrix] = None
+        # jobs updated after this are fetched by the next sync, database time
+        self.watermark = None
+        # jobs changed by this worker since the last sync
+        self.stale = set()
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._rebuilding = None
+        self.stats = {"builds": 0, "syncs": 0, "requests": 0}
+
+    def mark_stale(self, job_id: UUID) -> None:
+        '''Call after committing a change to the job, the next recommendation picks it up'''
+        self.stale.add(job_id)
+
+    def needs_sync(self) -> bool:
+        now = time.monotonic()
+        return (self.matrix is None or bool(self.stale) or now - self._synced_at >= self.sync_seconds
+                or now - self._built_at >= self.rebuild_seconds)
+
+    async def sync(self, db: AsyncSession) -> None:
+        if not self.needs_sync():
+            return
+        if self._lock.locked() and self.matrix is not None:
+            # another request is syncing, the current index will do meanwhile
+            return
+        async with self._lock:
+            if not self.needs_sync():
+                return
+            matrix = self.matrix
+            if matrix is None:
+                await self.rebuild(db)
+                return
+            if time.monotonic() - self._built_at >= self.rebuild_seconds or matrix.dead > max(matrix.live, 1000):
+                # the current index keeps serving until the new one is ready
+                self._built_at = time.monotonic()
+                self._rebuilding = asyncio.create_task(self.rebuild_in_background())
+
+            stale, self.stale = self.stale, set()
+            changed = select(*JOB_COLUMNS).filter(
+                or_(Job.updated_at > self.watermark, Job.id.in_(stale)) if stale
+                else Job.updated_at > self.watermark)
+            try:
+                started = await database_now(db)
+                jobs = (await db.execute(changed)).all()
+            except Exception:
+                self.stale |= stale
+                raise
+            matrix.add(jobs)
+            # stale jobs that are gone were deleted
+            for job_id in stale - {job.id for job in jobs}:
+                matrix.remove(job_id)
+            self.watermark = started - SYNC_OVERLAP
+            self._synced_at = time.monotonic()
+            self.stats["syncs"] += 1
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        started = time.monotonic()
+        self.stale.clear()
+        now = await database_now(db)
+        jobs = (await db.execute(select(*JOB_COLUMNS).filter(Job.status == JobStatus.ACTIVE))).all()
+        # tens of thousands of rows, don't hold up the other requests while indexing
+        self.matrix = await asyncio.to_thread(JobMatrix.build, jobs)
+        self.watermark = now - SYNC_OVERLAP
+        self._built_at = self._synced_at = time.monotonic()
+        self.stats["builds"] += 1
+        logger.info(f"Indexed {len(jobs)} jobs for recommendations in {time.monotonic() - started:.2f}s")
+
+    async def rebuild_in_background(self) -> None:
+        try:
+            async with AsyncSessionLocal() as db, self._lock:
+                await self.rebuild(db)
+        except Exception as err:
+            logger.error(f"Could not rebuild the job recommendation index: {err}")
+
+    async def recommend(self, db: AsyncSession, skills: List[str] = None, industries: List[str] = None,
+                        years_of_experience: int = None, desired_earnings: int = None,
+                        currency: str = None, k: int = 10) -> List[UUID]:
+        '''Ids of the k best active jobs for the profile, best first'''
+        await self.sync(db)
+        self.stats["requests"] += 1
+        matrix = self.matrix
+        scores = matrix.score(skills, industries, years_of_experience, desired_earnings, currency)
+        return matrix.top(scores, k)
+
+    def info(self) -> dict:
+        matrix = self.matrix
+        return {**self.stats, "jobs": matrix.live if matrix else 0, "dead_rows": matrix.dead if matrix else 0,
+                "terms": len(matrix.postings) if matrix else 0}
+
+
+job_index = JobIndex(float(config.RECOMMENDER_SYNC_SECONDS), float(config.RECOMMENDER_REBUILD_SECONDS))
@@ -1,15 +1,276 @@
+import hashlib
+from collections import Counter
+from types import SimpleNamespace
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 from uuid import UUID, uuid4
-from sqlalchemy.orm import Session
+from fastapi import Depends
+from cachetools import TTLCache
+from sqlalchemy import Select, cast, func, select, true, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, noload, selectinload
 
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db
+from core.env import config
 from core.exceptions.base import BadRequestException, NotFoundException
-from .models import JobAssessment
-from .schemas import CreateJobAssessment, BaseJobAssessment 
+from core.helpers.pagination import paginate
+from modules.users.models import Company, User
+from .enums import ApplicationStatus, JobStatus
+from .enums.status import APPLICATION_TRANSITIONS
+from .feed_events import FeedEvents, create_store as create_event_store
+from .models import Application, Job, JobApplicationCount, JobAssessment
+from .schemas import (ApplicationTransition, ApplicationTransitionReport, CreateJobAssessment, BaseJobAssessment,
+                      JobFilters, JobListResponse)
+
+
+FACETS = ("type", "experienceLevel", "locationType", "currency", "qualifications")
+# facet counts per query, a few seconds stale is fine for counts shown next to filters
+facet_counts = TTLCache(maxsize=1024, ttl=int(config.JOB_FACETS_CACHE_TTL))
+
+
+class FeedPage(NamedTuple):
+    '''A serialized page of the candidate feed and what it depends on'''
+    body: bytes
+    etag: str
+    filters: JobFilters
+    search: str
+    job_ids: frozenset
+    company_ids: frozenset
+
+
+# Candidate feed pages, the same for every candidate. Keyed by the filters,
+# search and page, dropped by the job and company writes that change them
+# (invalidate_feed). Kept per process, the other workers are told through
+# feed_events
+feed_cache = TTLCache(maxsize=int(config.JOB_FEED_CACHE_SIZE), ttl=int(config.JOB_FEED_CACHE_TTL))
+feed_cache_stats = {"hits": 0, "misses": 0, "invalidated": 0}
+feed_events = FeedEvents(create_event_store(config.JOB_FEED_EVENTS_URL, int(config.JOB_FEED_CACHE_TTL)))
+# what invalidate_feed needs of a job, sent to the other workers
+FEED_JOB_FIELDS = ("id", "status", "type", "experienceLevel", "locationType", "currency", "qualifications",
+                   "skills", "salaryRangeFrom", "salaryRangeTo")
+
+
+def job_company():
+    '''Loader option for what BaseJob serialises, the company and its profile'''
+    return joinedload(Job.company).joinedload(Company.profile)
+
+
+def application_details() -> tuple:
+    '''
+        Loader options for what BaseApplication serialises, one query per
+        relationship however many applications. Applicants are candidates,
+        their client profile is never set
+    '''
+    return (joinedload(Application.job).joinedload(Job.company).selectinload(Company.profile),
+            selectinload(Application.applicant).options(
+                selectinload(User.candidate_profile), noload(User.client_profile)))
+
+
+async def read_back_application(db: AsyncSession, application_id: UUID) -> Application:
+    '''The application as written, for handlers that changed it with UPDATE statements'''
+    return (await db.execute(select(Application).options(*application_details()).filter(
+        Application.id == application_id).execution_options(populate_existing=True))).scalars().first()
+
+
+def filter_jobs(query: Select, filters: JobFilters) -> Select:
+    '''
+        Adds the feed filters to a jobs query. Enum fields and salary use the
+        ACTIVE partial indexes, the array fields use && on their GIN indexes
+    '''
+    for field in ("type", "experienceLevel", "locationType", "currency"):
+        values = getattr(filters, field)
+        if values:
+            query = query.filter(getattr(Job, field).in_(values))
+    if filters.qualifications:
+        query = query.filter(Job.qualifications.overlap(cast(array(filters.qualifications), Job.qualifications.type)))
+    if filters.skills:
+        query = query.filter(Job.skills.overlap(cast(array([skill.strip() for skill in filters.skills]), Job.skills.type)))
+    # jobs whose salary range overlaps the requested one
+    if filters.salary_min is not None:
+        query = query.filter(Job.salaryRangeTo >= filters.salary_min)
+    if filters.salary_max is not None:
+        query = query.filter(Job.salaryRangeFrom <= filters.salary_max)
+    return query
+
+
+def matches_filters(job, filters: JobFilters) -> bool:
+    '''filter_jobs in python, for one job'''
+    for field in ("type", "experienceLevel", "locationType", "currency"):
+        values = getattr(filters, field)
+        if values and getattr(job, field) not in values:
+            return False
+    if filters.qualifications and not set(job.qualifications or ()) & set(filters.qualifications):
+        return False
+    if filters.skills and not set(job.skills or ()) & {skill.strip() for skill in filters.skills}:
+        return False
+    if filters.salary_min is not None and job.salaryRangeTo < filters.salary_min:
+        return False
+    if filters.salary_max is not None and job.salaryRangeFrom > filters.salary_max:
+        return False
+    return True
+
+
+def feed_key(filters: JobFilters, search: str, limit: int, page: int, cursor: Optional[str], facets: bool) -> tuple:
+    return (filters.model_dump_json(), search.strip().lower(), limit, page, cursor, facets)
+
+
+def cache_feed_page(key: tuple, response: JobListResponse, filters: JobFilters, search: str) -> FeedPage:
+    body = response.model_dump_json(by_alias=True).encode()
+    feed_page = FeedPage(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+                         filters=filters, search=search.strip(),
+                         job_ids=frozenset(job.id for job in response.data or ()),
+                         company_ids=frozenset(str(job.company.id) for job in response.data or () if job.company))
+    feed_cache[key] = feed_page
+    return feed_page
+
+
+async def cached_feed_page(key: tuple) -> Optional[FeedPage]:
+    # catch up with the other workers' writes first, if that fails the page may be stale
+    synced = await feed_events.pull(apply_feed_event, lambda: clear_feed(publish=False))
+    feed_page = feed_cache.get(key) if synced else None
+    feed_cache_stats["hits" if feed_page else "misses"] += 1
+    return feed_page
+
+
+def apply_feed_event(event: dict) -> None:
+    '''An invalidation published by another worker'''
+    if "jobs" in event:
+        invalidate_feed(*(SimpleNamespace(**{**job, "id": UUID(job["id"])}) for job in event["jobs"]), publish=False)
+    elif "company_id" in event:
+        invalidate_company_feed(event["company_id"], publish=False)
+    else:
+        clear_feed(publish=False)
+
+
+def invalidate_feed(*jobs, publish: bool = True) -> None:
+    '''
+        Drops the feed pages a job change shows up in, call after committing
+        with the job as it was and as it is now. A page goes if it lists the
+        job, or if the job is or was ACTIVE and matches its filters (it
+        would move into the page or change the total). Pages with a search
+        go whenever an ACTIVE job changed, matching text isn't checked here
+    '''
+    job_ids = {job.id for job in jobs}
+    active = [job for job in jobs if job.status == JobStatus.ACTIVE]
+    for key, feed_page in list(feed_cache.items()):
+        if feed_page.job_ids & job_ids or any(
+                feed_page.search or matches_filters(job, feed_page.filters) for job in active):
+            feed_cache.pop(key, None)
+            feed_cache_stats["invalidated"] += 1
+    if publish:
+        feed_events.publish({"jobs": [{field: getattr(job, field) for field in FEED_JOB_FIELDS} for job in jobs]})
+
+
+def clear_feed(publish: bool = True) -> None:
+    '''Drops every feed page, for changes touching too many jobs to check page by page'''
+    feed_cache_stats["invalidated"] += len(feed_cache)
+    feed_cache.clear()
+    if publish:
+        feed_events.publish({})
+
+
+def invalidate_company_feed(company_id, publish: bool = True) -> None:
+    '''Drops the feed pages showing the company's jobs, call after changing or deleting the company'''
+    company_id = str(company_id)
+    for key, feed_page in list(feed_cache.items()):
+        if company_id in feed_page.company_ids:
+            feed_cache.pop(key, None)
+            feed_cache_stats["invalidated"] += 1
+    if publish:
+        feed_events.publish({"company_id": company_id})
+
+
+async def job_facets(db: AsyncSession, query: Select) -> dict:
+    '''
+        Number of jobs matching `query` per value of each facet. One
+        grouped statement over the matching jobs, grouped by every facet
+        column at once (a few hundred groups at most), summed up per facet
+        here. Cached for JOB_FACETS_CACHE_TTL seconds per distinct query.
+    '''
+    columns = [getattr(Job, facet) for facet in FACETS]
+    statement = select(*columns, func.count().label("jobs")).where(
+        query.whereclause if query.whereclause is not None else true()).group_by(*columns)
+
+    compiled = statement.compile(dialect=postgresql.dialect())
+    cache_key = (str(compiled), repr(sorted(compiled.params.items())))
+    if cache_key in facet_counts:
+        return facet_counts[cache_key]
+
+    facets = {facet: Counter() for facet in FACETS}
+    for *values, jobs in (await db.execute(statement)).all():
+        *scalars, qualifications = values
+        for facet, value in zip(FACETS, scalars):
+            if value is not None:
+                facets[facet][getattr(value, "value", value)] += jobs
+        for qualification in set(qualifications or []):
+            facets["qualifications"][getattr(qualification, "value", qualification)] += jobs
+    facets = {facet: dict(counts) for facet, counts in facets.items()}
+    facet_counts[cache_key] = facets
+    return facets
+
+
+async def count_applications(db: AsyncSession, changes: Iterable[Tuple[UUID, ApplicationStatus, int]]) -> None:
+    '''
+        Adds each (job_id, status, delta) to the job's application counts in
+        one upsert. Runs in the caller's transaction, the counts commit with
+        the applications they count
+    '''
+    deltas = Counter()
+    for job_id, status, delta in changes:
+        if job_id is not None:
+            deltas[(job_id, status)] += delta
+    # the same order in every transaction, concurrent ones don't deadlock on the rows
+    values = [{"job_id": job_id, "status": status, "count": delta}
+              for (job_id, status), delta in sorted(deltas.items()) if delta]
+    if not values:
+        return
+    statement = postgresql.insert(JobApplicationCount).values(values)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[JobApplicationCount.job_id, JobApplicationCount.status],
+        set_={"count": JobApplicationCount.count + statement.excluded.count}))
+
+
+async def transition_applications(db: AsyncSession, application_ids: List[UUID], status: ApplicationStatus,
+                                  company_id: Optional[UUID] = None) -> ApplicationTransitionReport:
+    '''
+        Moves the applications to `status` in one statement:
+            WITH requested AS (the applications, of the company's jobs, FOR UPDATE),
+                 updated AS (UPDATE the requested ones whose status may move to `status`)
+            SELECT every requested id with its old status and whether it was updated
+        The rows are locked as they are read, so the old status is the one
+        the update replaces and the application counts move by exactly
+        what changed. Not committed
+    '''
+    sources = [source for source, targets in APPLICATION_TRANSITIONS.items() if status in targets]
+    requested = select(Application.id, Application.job_id, Application.status).filter(
+        Application.id.in_(set(application_ids)))
+    if company_id is not None:
+        requested = requested.join(Job, Application.job_id == Job.id).filter(Job.company_id == company_id)
+    requested = requested.order_by(Application.id).with_for_update(of=Application).cte("requested")
+    updated = update(Application).where(Application.id == requested.c.id, Application.status.in_(sources)).values(
+        status=status).returning(Application.id).cte("updated")
+    statement = select(requested.c.id, requested.c.job_id, requested.c.status, updated.c.id.is_not(None)).outerjoin(
+        updated, updated.c.id == requested.c.id)
+    found = {id: (job_id, previous, moved) for id, job_id, previous, moved in (await db.execute(statement)).all()}
+
+    results = []
+    for id in dict.fromkeys(application_ids):
+        if id not in found:
+            results.append(ApplicationTransition(id=id, outcome="not_found"))
+        else:
+            _, previous, moved = found[id]
+            results.append(ApplicationTransition(id=id, outcome="updated" if moved else "not_allowed",
+                                                 previous_status=previous))
+    moved = [(job_id, previous) for job_id, previous, moved in found.values() if moved]
+    await count_applications(db, [*((job_id, previous, -1) for job_id, previous in moved),
+                                  *((job_id, status, 1) for job_id, _ in moved)])
+    return ApplicationTransitionReport(status=status, updated=len(moved), results=results)
 
 
 class JobRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self):
         pass
@@ -29,23 +290,18 @@ class JobRepository:
     
 
 class JobAssessmentRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
-        
-    async def get_list(self, page: int, limit: int, filter: str):
-        skip = (page - 1) * limit
-
-        jobAssessments = self.db.query(JobAssessment
-                                    ).limit(limit).offset(skip).all()
-
-        if len(jobAssessments) is None:
-            raise NotFoundException("No Job Assessments found!")
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
         
+    async def get_list(self, page: int, limit: int, filter: str, cursor: str = None):
+        # job assessments have no created_at, their ids are the key
+        jobAssessments = await paginate(self.db, select(JobAssessment),
+                                        limit=limit, cursor=cursor, page=page, keys=(JobAssessment.id,))
         return jobAssessments
     
     
     async def get_by_id(self, job_assessment_id: UUID):
-        jobAssessment = self.db.query(JobAssessment).filter(JobAssessment.id==job_assessment_id).first()
+        jobAssessment = (await self.db.execute(select(JobAssessment).filter(JobAssessment.id==job_assessment_id))).scalars().first()
         
         if jobAssessment is None:
             raise NotFoundException("Job assessment not found!")
@@ -56,7 +312,7 @@ class JobAssessmentRepository:
     
     async def get_by_job(self, page: int, limit: int, filter: str, job_id: UUID):
         skip = (page - 1) * limit
-        jobAssessments = self.db.query(JobAssessment).filter(JobAssessment.job_id==job_id).all()
+        jobAssessments = (await self.db.execute(select(JobAssessment).filter(JobAssessment.job_id==job_id))).scalars().all()
                                                         
         if jobAssessments is None:
             raise NotFoundException("No Job assessments found!")
@@ -64,7 +320,7 @@ class JobAssessmentRepository:
     
         
     async def create(self, payload: CreateJobAssessment):
-        job_assessment_obj = self.db.query(JobAssessment).filter(JobAssessment.assessment_id == payload.assessment_id).all()
+        job_assessment_obj = (await self.db.execute(select(JobAssessment).filter(JobAssessment.assessment_id == payload.assessment_id))).scalars().all()
         
         if len(job_assessment_obj):
             raise BadRequestException("Assessment has already been selected for this job!")
@@ -72,34 +328,31 @@ class JobAssessmentRepository:
         new_jobAssemssent = JobAssessment(**payload.__dict__)
         
         self.db.add(new_jobAssemssent)
-        self.db.commit()
-        self.db.refresh(new_jobAssemssent)
+        await self.db.flush()
+        await self.db.refresh(new_jobAssemssent)
         
         return new_jobAssemssent
     
     async def update(self, payload: BaseJobAssessment):
-        job_assessment_obj = self.db.query(JobAssessment).filter(JobAssessment.assessment_id == payload.assessment_id).first()
+        job_assessment_obj = (await self.db.execute(select(JobAssessment).filter(JobAssessment.assessment_id == payload.assessment_id))).scalars().first()
         
         if job_assessment_obj:
             raise BadRequestException("Assessment has already been selected for this job!")
         
-        print("here")
-        jobAssessment = self.db.query(JobAssessment).filter(JobAssessment.id == payload.id)
-        jobAssessment.update(payload.__dict__, synchronize_session=False)
+        await self.db.execute(update(JobAssessment).filter(JobAssessment.id == payload.id
+                                                           ).values(payload.__dict__))
+        await self.db.flush()
         
-        self.db.commit()
-        
-        return jobAssessment
+        return await self.get_by_id(payload.id)
     
     
     async def delete(self, job_id: UUID, job_assessment_id: UUID):
-        self.get_by_id(job_id)
-        jobAssessment = self.db.query(JobAssessment).filter(JobAssessment.id == job_assessment_id).first()
+        jobAssessment = await self.get_by_id(job_assessment_id)
         
         try:
-            self.db.delete(jobAssessment)
-            self.db.commit()
+            await self.db.delete(jobAssessment)
+            await self.db.flush()
             return {"message": "Job assessment deleted successfully"}
         except BadRequestException:
-            self.db.rollback()
+            await self.db.rollback()
             raise BadRequestException("Job assessment delete failed")
@@ -1,12 +1,13 @@
 from uuid import UUID
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import ConfigDict, BaseModel, Field, constr
 
 
 from modules.jobs.enums import *
 from modules.assessments.schemas import BaseAssessment
 from modules.users.schemas import BaseCompany, BaseCandidate, BaseUser
+from core.helpers.schemas import CustomListResponse
 
 class BaseJob(BaseModel):
     id: Optional[UUID] = None
@@ -29,6 +30,29 @@ class BaseJob(BaseModel):
     company: BaseCompany
     model_config = ConfigDict(from_attributes=True, validate_assignment=True)
 
+class ClientJob(BaseJob):
+    '''A job as its company (or an admin) sees it'''
+    # applications per status, e.g. {"PENDING": 12, "SHORTLISTED": 3}
+    application_counts: Dict[str, int] = {}
+
+class JobFilters(BaseModel):
+    '''Feed filters, values within a field are OR-ed, fields are AND-ed'''
+    type: Optional[List[JobType]] = None
+    experienceLevel: Optional[List[ExperienceLevel]] = None
+    locationType: Optional[List[LocationType]] = None
+    qualifications: Optional[List[Qualification]] = None
+    currency: Optional[List[Currency]] = None
+    salary_min: Optional[int] = None
+    salary_max: Optional[int] = None
+    skills: Optional[List[str]] = None
+
+class JobListResponse(CustomListResponse[BaseJob]):
+    # facet -> value -> number of matching jobs, e.g. {"locationType": {"REMOTE": 12}}
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
+class ClientJobListResponse(JobListResponse):
+    data: Optional[List[ClientJob]] = None
+
 class CreateJobSchema(BaseModel):
     title: str = Field(index=True)
     description: str
@@ -64,6 +88,17 @@ class UpdateJobSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class JobImportError(BaseModel):
+    # line of the upload, the CSV header is line 1
+    line: int
+    errors: List[str]
+
+class JobImportReport(BaseModel):
+    rows: int
+    imported: int
+    errors: List[JobImportError]
+
+
 
 # Applications
 class BaseApplication(BaseModel):
@@ -75,6 +110,25 @@ class BaseApplication(BaseModel):
     model_config = ConfigDict(from_attributes=True, validate_assignment=True)
 
 
+class ApplicationStatusUpdate(BaseModel):
+    application_ids: List[UUID] = Field(min_length=1, max_length=1000)
+    status: ApplicationStatus
+
+
+class ApplicationTransition(BaseModel):
+    id: UUID
+    # "updated", "not_allowed" (the move from `previous_status` isn't one
+    # of APPLICATION_TRANSITIONS) or "not_found" (or not yours)
+    outcome: str
+    previous_status: Optional[ApplicationStatus] = None
+
+
+class ApplicationTransitionReport(BaseModel):
+    status: ApplicationStatus
+    updated: int
+    results: List[ApplicationTransition]
+
+
 class UpdateApplication(BaseModel):
     status: Optional[ApplicationStatus] = None
     job_id: Optional[UUID] = None
@@ -1,61 +1,106 @@
 from datetime import timedelta, datetime
-from typing import Annotated
+from typing import Annotated, List, Optional
 from core.exceptions.auth import UnauthorisedUserException
 from pydantic import TypeAdapter
 from core.exceptions.base import BadRequestException, DuplicateValueException, ForbiddenException, NotFoundException
-from fastapi import Depends, HTTPException, status, APIRouter, Response, Path
+from fastapi import Depends, HTTPException, status, APIRouter, Request, Response, Path, Query, UploadFile
 from modules.files.models import File, FileType
+from modules.files.repository import latest_files
 from modules.files.schemas import File as FileSchema
 from modules.users.models import UserType
 from modules.users.schemas import BaseClient, BaseUser
-from sqlalchemy import or_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Float, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, with_expression
 
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db
 from core.dependencies.auth import get_current_user
+from core.dependencies.rate_limit import RateLimit, by_user
+from core.env import config
 from core.helpers.schemas import CustomResponse, CustomListResponse
-from core.helpers.text_utils import to_slug
+from core.helpers.pagination import paginate_with_total
+from core.helpers.text_utils import to_prefix_tsquery, to_slug
 
 from modules.users.models import Company, CompanyProfile
 
 from .models import Job, Application
 from .schemas import *
-from .repository import JobAssessmentRepository
+from .repository import (FeedPage, JobAssessmentRepository, application_details, cache_feed_page, cached_feed_page,
+                         clear_feed, count_applications, feed_key, filter_jobs, invalidate_feed, job_company,
+                         job_facets, read_back_application, transition_applications)
+from .importer import import_job_file
+from .recommender import job_index
 
 router = APIRouter(
     prefix="/jobs"
 )
 
-jobAssessmentRepo = JobAssessmentRepository()
 
-
-@router.get("/", response_model=CustomListResponse[BaseJob], tags=["Jobs"])
-async def fetch_jobs(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                     db: Session = Depends(get_db), 
-                     limit: int = 10, page: int = 1, search: str = ''):
-    
-    skip = (page - 1) * limit
-    jobs_query = db.query(Job).options(joinedload(Job.company).joinedload(Company.profile))
+def job_filters(type: Annotated[Optional[List[JobType]], Query()] = None,
+                experienceLevel: Annotated[Optional[List[ExperienceLevel]], Query()] = None,
+                locationType: Annotated[Optional[List[LocationType]], Query()] = None,
+                qualifications: Annotated[Optional[List[Qualification]], Query()] = None,
+                currency: Annotated[Optional[List[Currency]], Query()] = None,
+                salary_min: Optional[int] = None, salary_max: Optional[int] = None,
+                skills: Annotated[Optional[List[str]], Query()] = None) -> JobFilters:
+    # list query params repeat: ?locationType=REMOTE&locationType=HYBRID
+    return JobFilters(type=type, experienceLevel=experienceLevel, locationType=locationType,
+                      qualifications=qualifications, currency=currency, salary_min=salary_min,
+                      salary_max=salary_max, skills=skills)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''If-None-Match is "*" or a comma separated list of ETags, compared weakly (W/ ignored)'''
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def feed_response(request: Request, feed_page: FeedPage) -> Response:
+    # clients keep the page and revalidate it, an unchanged page is a 304 without a body
+    headers = {"ETag": feed_page.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), feed_page.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(feed_page.body, media_type="application/json", headers=headers)
+
+
+@router.get("/", response_model=ClientJobListResponse, tags=["Jobs"])
+async def fetch_jobs(request: Request, current_user: Annotated[BaseUser, Depends(get_current_user)],
+                     db: AsyncSession = Depends(get_async_db), 
+                     limit: int = 10, page: int = 1, search: str = '', cursor: str = None,
+                     filters: JobFilters = Depends(job_filters), facets: bool = False):
+    '''
+        facets=true adds the number of matching jobs per type, experienceLevel,
+        locationType, currency and qualification to the response.
+        Candidates all see the same feed, it is served from the feed cache
+        with an ETag (If-None-Match gets a 304) and without application_counts
+    '''
+    feed = current_user.role == UserType.CANDIDATE
+    if feed:
+        cache_key = feed_key(filters, search, limit, page, cursor, facets)
+        feed_page = await cached_feed_page(cache_key)
+        if feed_page is not None:
+            return feed_response(request, feed_page)
+
+    jobs_query = select(Job).options(joinedload(Job.company).joinedload(Company.profile))
     # if user is candidate; get industry related tags
     if (current_user.role == UserType.CANDIDATE):
-        jobs_query = db.query(Job).options(
+        jobs_query = select(Job).options(
             joinedload(Job.company)
             .joinedload(Company.profile)).filter(Job.status == JobStatus.ACTIVE)
-        if search:
-            jobs_query.filter(
-            Job.tags.contains([search]))
     # if user is client; filter by company jobs
     # elif(current_user.user.role == UserType.CLIENT):
     elif(current_user.role == UserType.CLIENT):
         # print('HEERE', current_user.client_profile.company, flush=True)
-        company = db.query(Company).options(
-                joinedload(Company.profile)).filter(Company.owner_id == str(current_user.id)).first()
+        company = (await db.execute(select(Company).options(
+                joinedload(Company.profile)).filter(Company.owner_id == str(current_user.id)))).scalars().first()
         if company:
             current_user.client_profile.company = company
         # print('HEERE', current_user.client_profile.company.id, flush=True)
         if current_user.client_profile and current_user.client_profile.company:
             # print('HEERE2', current_user.client_profile.company,  flush=True)
-            jobs_query = db.query(Job).options(
+            jobs_query = select(Job).options(
                 joinedload(Job.company).joinedload(Company.profile)).filter(
                 Job.company_id == current_user.client_profile.company.id)
         else:
@@ -63,33 +108,59 @@ async def fetch_jobs(current_user: Annotated[BaseUser, Depends(get_current_user)
             # raise NotFoundException('You have created no Jobs')
     # if no user; no jobs
     # if thirdparty; filter tier [platform user]
-    jobs = jobs_query.order_by(Job.created_at.desc()).limit(limit).offset(skip).all()
-    total_count = jobs_query.count()
+    if not feed:
+        jobs_query = jobs_query.options(selectinload(Job.status_counts))
+    jobs_query = filter_jobs(jobs_query, filters)
+    keys = None
+    terms = to_prefix_tsquery(search)
+    if terms:
+        # matches come from the GIN index on search_vector, best first; the
+        # cursor seeks on (rank, id) like the default one on (created_at, id)
+        tsquery = func.to_tsquery('english', terms)
+        rank = func.ts_rank_cd(Job.search_vector, tsquery, type_=Float).label("search_rank")
+        jobs_query = jobs_query.options(with_expression(Job.search_rank, rank)).filter(
+            Job.search_vector.op('@@')(tsquery))
+        keys = (rank, Job.id)
+    jobs, next_cursor, total_count = await paginate_with_total(db, jobs_query, limit=limit, cursor=cursor, page=page,
+                                                               keys=keys)
     if len(jobs) < 1: 
         raise NotFoundException('No Jobs found')
-    return {'message': 'Jobs retrieved successfully', 'total_count': total_count, 'next_page': 1,'count': len(jobs), 'data': jobs}
+    response = {'message': 'Jobs retrieved successfully', 'total_count': total_count, 'next_page': page + 1 if next_cursor else None,
+            'next_cursor': next_cursor, 'count': len(jobs), 'data': jobs,
+            'facets': await job_facets(db, jobs_query) if facets else None}
+    if not feed:
+        return response
+    return feed_response(request, cache_feed_page(
+        cache_key, JobListResponse.model_validate(response, from_attributes=True), filters, search))
 
 @router.get("/recommended", response_model=CustomListResponse[BaseJob], tags=["Jobs"])
 async def fetch_recommended_jobs(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                     db: Session = Depends(get_db)):
-
-    # if user is candidate; get industry related tags
-    jobs_query = db.query(Job).options(joinedload(Job.company).joinedload(Company.profile))
-
-    if current_user.candidate_profile:
-        jobs_query.filter(
-            Job.tags.contains([current_user.candidate_profile.skills]),
-            Job.status == JobStatus.ACTIVE)
-    
-    jobs = jobs_query.order_by(Job.deadline.desc()).limit(5).all()
-    job_count = jobs_query.count()
+                     db: AsyncSession = Depends(get_async_db), limit: int = 10):
+    '''
+        Active jobs that best match the candidate's skills, industries,
+        experience and desired earnings, best first. See recommender.py
+    '''
+    profile = current_user.candidate_profile
+    job_ids = await job_index.recommend(
+        db, k=min(max(limit, 1), 50),
+        skills=profile.skills if profile else None,
+        industries=profile.industries if profile else None,
+        years_of_experience=profile.years_of_experience if profile else None,
+        desired_earnings=profile.desired_earnings if profile else None,
+        currency=profile.currency if profile else None)
+
+    # jobs deleted or closed on another worker since the last sync drop out here
+    jobs_query = select(Job).options(joinedload(Job.company).joinedload(Company.profile)).filter(
+        Job.id.in_(job_ids), Job.status == JobStatus.ACTIVE)
+    found = {job.id: job for job in (await db.execute(jobs_query)).scalars().all()}
+    jobs = [found[job_id] for job_id in job_ids if job_id in found]
     if len(jobs) < 1: 
         raise NotFoundException('No Jobs found')
-    return {'message': 'Jobs retrieved successfully', 'total_count': job_count, 'next_page': 1,'count': len(jobs), 'data': jobs}
+    return {'message': 'Jobs retrieved successfully', 'total_count': len(jobs), 'next_page': 1,'count': len(jobs), 'data': jobs}
 
 @router.get('/applications', response_model=CustomListResponse[BaseApplication], tags=["Applications"])
 async def get_candidate_applications(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
+                                db: AsyncSession = Depends(get_async_db),):
     '''
     Candidate:
     if just applications; get all the applications of the candidate
@@ -98,8 +169,8 @@ async def get_candidate_applications(current_user: Annotated[BaseUser, Depends(g
     if (current_user.role == UserType.CLIENT):
         raise BadRequestException("Get applications by job!")
     
-    query = db.query(Application).filter(Application.applicant_id==current_user.id)
-    applications = query.all()
+    query = select(Application).options(*application_details()).filter(Application.applicant_id==current_user.id)
+    applications = (await db.execute(query)).scalars().all()
     # elif current_user.role == UserType.CLIENT: # check if client -> company -> job -> application ownership
     #     query = db.query(Application).filter(Application.job_id)
     if len(applications) < 1:
@@ -107,23 +178,31 @@ async def get_candidate_applications(current_user: Annotated[BaseUser, Depends(g
     return {"message":"Applications retrieved successful","count": len(applications),"data": applications}
 
 
-@router.get('/{job_id}', tags=["Jobs"], response_model=CustomResponse[BaseJob])
-def get_job(job_id: Annotated[UUID, Path(title="The ID of the job to be fetched")],
+@router.get('/{job_id}', tags=["Jobs"], response_model=CustomResponse[ClientJob])
+async def get_job(job_id: Annotated[UUID, Path(title="The ID of the job to be fetched")],
             current_user: Annotated[BaseUser, Depends(get_current_user)],
-            db: Session = Depends(get_db),):
+            db: AsyncSession = Depends(get_async_db),):
     
-    job = db.query(Job).filter(Job.id == job_id).first()
+    job_query = select(Job).options(job_company()).filter(Job.id == job_id)
+    if current_user.role != UserType.CANDIDATE:
+        job_query = job_query.options(selectinload(Job.status_counts))
+    job = (await db.execute(job_query)).scalars().first()
     
     if job is None:
         raise NotFoundException("Job not found!")
     
-    return {"message":"Job fetched successfully","data": job}
+    response = {"message":"Job fetched successfully","data": job}
+    if current_user.role == UserType.CANDIDATE:
+        # the application counts are for the company
+        response = CustomResponse[BaseJob].model_validate(response, from_attributes=True)
+        return Response(response.model_dump_json(by_alias=True), media_type="application/json")
+    return response
 
 
-@router.post('/', status_code=status.HTTP_201_CREATED, response_model=CustomResponse[BaseJob], tags=["Jobs"])
-def create_job(payload: CreateJobSchema,
+@router.post('/', status_code=status.HTTP_201_CREATED, response_model=CustomResponse[ClientJob], tags=["Jobs"])
+async def create_job(payload: CreateJobSchema,
                    current_user: Annotated[BaseUser, Depends(get_current_user)],
-                   db: Session = Depends(get_db), ):
+                   db: AsyncSession = Depends(get_async_db), ):
     
     #TODO: Refactor to utils
     # TODO: update tags with field slugs
@@ -132,15 +211,15 @@ def create_job(payload: CreateJobSchema,
     
 
     if current_user.role == UserType.ADMIN:
-        company = db.query(Company).filter(Company.id == str(payload.company_id)).first()
+        company = (await db.execute(select(Company).filter(Company.id == str(payload.company_id)))).scalars().first()
     else:
-        company = db.query(Company).filter(Company.owner_id == str(current_user.id)).first()
+        company = (await db.execute(select(Company).filter(Company.owner_id == str(current_user.id)))).scalars().first()
 
     # company = db.query(Company).filter(Company.owner_id == str(current_user.id)).first()
     if company is None:
         raise BadRequestException('Please complete company profile')
     title_slug = to_slug(payload.title)
-    job = db.query(Job).filter(Job.company_id == company.id ,Job.slug == title_slug).first()
+    job = (await db.execute(select(Job).filter(Job.company_id == company.id ,Job.slug == title_slug))).scalars().first()
     if job:
         # Contact company owner message, reach out to support email
         raise DuplicateValueException("There may be a similar job ad already created by your company, Check 'All Jobs' tab")
@@ -153,40 +232,77 @@ def create_job(payload: CreateJobSchema,
     new_job.deadline = datetime.now() + timedelta(days=10)
     new_job.status =  JobStatus.ACTIVE
     db.add(new_job)
-    db.commit()
-    db.refresh(new_job)
+    await db.commit()
+    job_index.mark_stale(new_job.id)
+    invalidate_feed(new_job)
+    new_job = (await db.execute(select(Job).options(job_company(), selectinload(Job.status_counts)).filter(
+        Job.id == new_job.id).execution_options(populate_existing=True))).scalars().first()
+
+    return {"message":"Job ad draft has been created successfully","data": ClientJob.from_orm(new_job)}
+
+@router.post('/import', status_code=status.HTTP_201_CREATED, response_model=CustomResponse[JobImportReport], tags=["Jobs"])
+async def import_jobs(file: UploadFile,
+                      current_user: Annotated[BaseUser, Depends(get_current_user)],
+                      db: AsyncSession = Depends(get_async_db), company_id: Optional[UUID] = None):
+    '''
+        Creates jobs from a CSV or JSON lines file, a row per job with the
+        fields of POST /jobs. In CSV, list fields are separated by ";".
+        Rows that don't validate are skipped and listed in the report.
+        Admins import for `company_id`
+    '''
+    if current_user.role == UserType.CANDIDATE:
+        raise ForbiddenException("User not authorised to create jobs")
 
-    return {"message":"Job ad draft has been created successfully","data": BaseJob.from_orm(new_job)}
+    if current_user.role == UserType.ADMIN:
+        company = (await db.execute(select(Company).filter(Company.id == str(company_id)))).scalars().first()
+    else:
+        company = (await db.execute(select(Company).filter(Company.owner_id == str(current_user.id)))).scalars().first()
+    if company is None:
+        raise BadRequestException('Please complete company profile')
 
-@router.put('/{job_id}', response_model=CustomResponse[BaseJob] , tags=["Jobs"])
-def update_job(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")],
+    # a failed insert is rolled back by get_async_db
+    report, job_ids = await import_job_file(db, file, company.id)
+    await db.commit()
+    for job_id in job_ids:
+        job_index.mark_stale(job_id)
+    if report.imported:
+        # new jobs land on the first page of most feeds
+        clear_feed()
+    return {"message": f"{report.imported} of {report.rows} jobs imported", "data": report}
+
+@router.put('/{job_id}', response_model=CustomResponse[ClientJob] , tags=["Jobs"])
+async def update_job(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")],
                payload: UpdateJobSchema,
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
 
     if current_user.role == UserType.ADMIN:
-        company = db.query(Company).filter(Company.id == str(payload.company_id)).first()
+        company = (await db.execute(select(Company).filter(Company.id == str(payload.company_id)))).scalars().first()
     else:
-        company = db.query(Company).filter(Company.owner_id == str(current_user.id)).first()
+        company = (await db.execute(select(Company).filter(Company.owner_id == str(current_user.id)))).scalars().first()
     
-    job_query = db.query(Job).options(
+    job_query = select(Job).options(
         joinedload(Job.company)
-        .joinedload(Company.profile)).filter(Job.id == job_id,
+        .joinedload(Company.profile), selectinload(Job.status_counts)).filter(Job.id == job_id,
         Job.company_id == company.id)
-    job = job_query.first()
+    job = (await db.execute(job_query)).scalars().first()
     if job is None:
         raise NotFoundException("Job not found!")
     
-    job_query.update(payload.dict(exclude_unset=True), synchronize_session=False)
-    db.commit()
+    previous = BaseJob.from_orm(job)
+    await db.execute(update(Job).filter(Job.id == job.id).values(payload.dict(exclude_unset=True)))
+    await db.commit()
+    job = (await db.execute(job_query.execution_options(populate_existing=True))).scalars().first()
+    job_index.mark_stale(job.id)
+    invalidate_feed(previous, job)
     
     return {"message":"Job updated successfully","data": job}
 
-@router.patch('/publish/{job_id}', response_model=CustomResponse[BaseJob] , tags=["Jobs"])
-def publish_job(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")],
+@router.patch('/publish/{job_id}', response_model=CustomResponse[ClientJob] , tags=["Jobs"])
+async def publish_job(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")],
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
     # if current_user.role == UserType.ADMIN:
     #     company = db.query(Company).filter(Company.id == str(payload.company_id)).first()
@@ -200,11 +316,11 @@ def publish_job(job_id: Annotated[UUID, Path(title="The ID of the job to be upda
     if current_user.role == UserType.CANDIDATE:
         raise UnauthorisedUserException("User is not authorised to edit company details")
 
-    job_query = db.query(Job).options(
+    job_query = select(Job).options(
         joinedload(Job.company)
-        .joinedload(Company.profile)).filter(Job.id == job_id)
+        .joinedload(Company.profile), selectinload(Job.status_counts)).filter(Job.id == job_id)
     
-    job = job_query.first()
+    job = (await db.execute(job_query)).scalars().first()
     if job is None:
         raise NotFoundException("Job not found!")
     
@@ -214,8 +330,12 @@ def publish_job(job_id: Annotated[UUID, Path(title="The ID of the job to be upda
     if job.status == JobStatus.CLOSED:
         raise BadRequestException('Job Deadline is past, contact support or create a new job')
     
-    job_query.update({'status':JobStatus.ACTIVE}, synchronize_session=False)
-    db.commit()
+    previous = BaseJob.from_orm(job)
+    await db.execute(update(Job).filter(Job.id == job.id).values({'status':JobStatus.ACTIVE}))
+    await db.commit()
+    job = (await db.execute(job_query.execution_options(populate_existing=True))).scalars().first()
+    job_index.mark_stale(job.id)
+    invalidate_feed(previous, job)
     
     return {"message":"Job updated successfully","data": job}
 
@@ -223,36 +343,39 @@ def publish_job(job_id: Annotated[UUID, Path(title="The ID of the job to be upda
 @router.delete('/{job_id}', response_model=CustomResponse, tags=["Jobs"])
 async def delete_job(job_id: Annotated[UUID, Path(title="The ID of the job to be deleted")],
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
-    job = db.query(Job).filter(Job.id == job_id).first()
+    job = (await db.execute(select(Job).filter(Job.id == job_id))).scalars().first()
     if job is None:
         raise NotFoundException("Job not found!")
     try:
-        db.delete(job)
-        db.commit()
+        await db.delete(job)
+        await db.commit()
+        job_index.mark_stale(job.id)
+        invalidate_feed(job)
         return {"message": "Job deleted"}
     except BadRequestException:
-        db.rollback()
+        await db.rollback()
         raise BadRequestException("Job delete failed")
     
 
 
-@router.post('/{job_id}/apply', response_model=CustomResponse[BaseApplication], tags=["Applications"])
+@router.post('/{job_id}/apply', response_model=CustomResponse[BaseApplication], tags=["Applications"],
+             dependencies=[Depends(RateLimit("apply", config.RATE_LIMIT_APPLY_USER, key=by_user))])
 async def create_application(job_id: Annotated[UUID, Path(title="The ID of the job, applied to")],
                              current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
+                                db: AsyncSession = Depends(get_async_db),):
     # only candidate can apply
     if (current_user.role != UserType.CANDIDATE):
         raise ForbiddenException('Only candidates are allowed!')
     
     # check if job is live
-    job  = db.query(Job).filter(Job.id==job_id).first()
+    job  = (await db.execute(select(Job).filter(Job.id==job_id))).scalars().first()
     if (job is None) or (job.status != JobStatus.ACTIVE):
         raise NotFoundException("Job does not exist or has been closed.")
 
-    application_query = db.query(Application).filter(Application.job_id == job_id,
-                                                      Application.applicant_id == current_user.id).first()
+    application_query = (await db.execute(select(Application).filter(Application.job_id == job_id,
+                                                      Application.applicant_id == current_user.id))).scalars().first()
     if application_query:
         raise DuplicateValueException("You may have applied for this job")
     
@@ -265,14 +388,15 @@ async def create_application(job_id: Annotated[UUID, Path(title="The ID of the j
                              "comment": 'Application started'})
     new_app.updated_at = datetime.now()
     db.add(new_app)
-    db.commit()
-    db.refresh(new_app)
+    await count_applications(db, [(job_id, ApplicationStatus.PENDING, 1)])
+    await db.commit()
+    new_app = await read_back_application(db, new_app.id)
     return {"message":"Job application successful","data": new_app}
 
 @router.get('/{job_id}/applications', response_model=CustomListResponse[BaseApplication], tags=["Applications"])
 async def get_job_applications(job_id: Annotated[Optional[UUID], Path(title="The ID of the jobs to fetch applications")],
                              current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
+                                db: AsyncSession = Depends(get_async_db),):
     '''
      CLient:
     if just applications; get all your job related applications [may be more complicated and unnecessary]
@@ -282,74 +406,114 @@ async def get_job_applications(job_id: Annotated[Optional[UUID], Path(title="The
         raise BadRequestException('Check applications!')
     
     # check if job exists
-    job  = db.query(Job).filter(Job.id==job_id).first()
+    job  = (await db.execute(select(Job.id, Job.status).filter(Job.id==job_id))).first()
     if (job is None) or (job.status == JobStatus.CLOSED):
         raise NotFoundException("Job does not exist or has been closed.")
 
     
-    application_query = db.query(Application).options(
-                                    joinedload(Application.job))
+    application_query = select(Application).options(*application_details())
     
     if current_user.role == UserType.ADMIN:
         application_query = application_query.filter(Application.job_id == str(job.id))
     elif current_user.role == UserType.CLIENT: 
-        company = db.query(Company).filter(Company.owner_id == str(current_user.id)).first()
+        company = (await db.execute(select(Company).filter(
+            Company.owner_id == str(current_user.id)))).scalars().first()
         if company is None:
             raise ForbiddenException("You dont seem to have a company profile, contact support")
-        application_query = application_query.filter(Application.job_id == job_id, Job.company_id == company.id, Application.status == ApplicationStatus.SHORTLISTED)#, Application.status == ApplicationStatus.SHORTLISTED)
+        application_query = application_query.join(Job, Application.job_id == Job.id).filter(
+            Application.job_id == job_id, Job.company_id == company.id, Application.status == ApplicationStatus.SHORTLISTED)#, Application.status == ApplicationStatus.SHORTLISTED)
 
-    total_count = application_query.count()
-    applications = application_query.all()
+    applications = (await db.execute(application_query)).scalars().all()
     if len(applications) < 1:
         # raise NotFoundException("No Applications Found")
         return {"message":"No Applications Found!"}
 
-    
+    # the 3 latest CVs of every applicant in one windowed query
+    cv_files = await latest_files(db, (application.applicant_id for application in applications), FileType.RESUME)
     for application in applications:
-        cv_files = db.query(File).filter(
-            File.owner_id == application.applicant.id, File.type == FileType.RESUME)\
-            .order_by(File.created_at.desc()).limit(3).all()
-        application.applicant.candidate_profile.cv = TypeAdapter(List[FileSchema]).validate_python(cv_files)
+        if application.applicant.candidate_profile:
+            application.applicant.candidate_profile.cv = TypeAdapter(List[FileSchema]).validate_python(
+                cv_files.get(application.applicant_id, []))
         
     return {"message":"Applications retrieved successful","count": len(applications), "total_count": len(applications), "data": applications}
 
+@router.patch('/applications/status', response_model=CustomResponse[ApplicationTransitionReport], tags=["Applications"])
+async def update_application_statuses(payload: ApplicationStatusUpdate,
+                                      current_user: Annotated[BaseUser, Depends(get_current_user)],
+                                      db: AsyncSession = Depends(get_async_db),):
+    '''
+        Moves many applications to one status, e.g. rejecting every applicant
+        left after a shortlist. Only moves allowed from an application's
+        current status happen, see APPLICATION_TRANSITIONS; the result says
+        what happened to each id
+    '''
+    company_id = await recruiter_company_id(db, current_user)
+    report = await transition_applications(db, payload.application_ids, payload.status, company_id)
+    await db.commit()
+    return {"message": f"{report.updated} of {len(report.results)} applications updated", "data": report}
+
+
+async def recruiter_company_id(db: AsyncSession, current_user: BaseUser) -> Optional[UUID]:
+    '''The company whose applications the user may move, None for an admin (any company)'''
+    if current_user.role == UserType.CANDIDATE:
+        raise ForbiddenException('You are not allowed to update this application!')
+    if current_user.role == UserType.ADMIN:
+        return None
+    company = (await db.execute(select(Company).filter(
+        Company.owner_id == str(current_user.id)))).scalars().first()
+    if company is None:
+        raise ForbiddenException("You dont seem to have a company profile, contact support")
+    return company.id
+
+
+async def transition_application(db: AsyncSession, application_id: UUID, status: ApplicationStatus,
+                                 company_id: Optional[UUID]) -> None:
+    '''Moves one application the way PATCH /applications/status does, raises if it can't'''
+    [result] = (await transition_applications(db, [application_id], status, company_id)).results
+    if result.outcome == "not_found":
+        raise NotFoundException("Application not found!")
+    if result.outcome == "not_allowed":
+        if result.previous_status == status:
+            raise BadRequestException(f"This application is already {status.value.lower()}.")
+        raise BadRequestException(f"An application can't move from {result.previous_status.value} to {status.value}.")
+
 @router.put('/applications/{application_id}', response_model=CustomResponse[BaseApplication], tags=["Applications"])
 async def update_application(application_id: Annotated[UUID, Path(title="The ID of the application to be updated")],
                              payload: UpdateApplication,
                              current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
-    if current_user == UserType.CANDIDATE:
-        raise ForbiddenException('You are not allowed to update this application!')
+                                db: AsyncSession = Depends(get_async_db),):
+    company_id = await recruiter_company_id(db, current_user)
 
-    application_query = db.query(Application).filter(or_(Application.id == application_id, Application.applicant_id == current_user.id))
-    application = application_query.first()
+    # locked until the commit, the counts move from the status it really has
+    application_query = select(Application).filter(Application.id == application_id)
+    if company_id is not None:
+        application_query = application_query.join(Job, Application.job_id == Job.id).filter(Job.company_id == company_id)
+    application = (await db.execute(application_query.with_for_update(of=Application))).scalars().first()
 
     if application is None:
         raise NotFoundException("Application not found!")
     
-    application_query.update(payload.dict(exclude_unset=True), synchronize_session=False)
-    db.commit()
+    changes = payload.dict(exclude_unset=True)
+    status = changes.pop("status", None) or application.status
+    if status != application.status:
+        await transition_application(db, application.id, status, company_id)
+    if changes:
+        counted = [(application.job_id, status, -1), (changes.get("job_id", application.job_id), status, 1)]
+        await db.execute(update(Application).filter(Application.id == application.id).values(changes))
+        await count_applications(db, counted)
+    await db.commit()
+    application = await read_back_application(db, application.id)
     
     return {"message":"Application updated successfully","data": application}
 
 @router.put('/applications/shortlist/{application_id}', response_model=CustomResponse[BaseApplication], tags=["Applications"])
 async def shortlist_application(application_id: Annotated[UUID, Path(title="The ID of the application to be updated")],
                              current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
-    if current_user == UserType.CANDIDATE:
-        raise ForbiddenException('You are not allowed to update this application!')
-
-    application_query = db.query(Application).filter(Application.id == application_id)
-    application = application_query.first()
-
-    if application is None:
-        raise NotFoundException("Application not found!")
-    
-    if application.status == ApplicationStatus.SHORTLISTED:
-        raise BadRequestException("This application has already been shortlisted.")
-    
-    application_query.update({'status': ApplicationStatus.SHORTLISTED}, synchronize_session=False)
-    db.commit()
+                                db: AsyncSession = Depends(get_async_db),):
+    company_id = await recruiter_company_id(db, current_user)
+    await transition_application(db, application_id, ApplicationStatus.SHORTLISTED, company_id)
+    await db.commit()
+    application = await read_back_application(db, application_id)
     
     return {"message":"Application updated successfully","data": application}
 
@@ -357,16 +521,17 @@ async def shortlist_application(application_id: Annotated[UUID, Path(title="The
 @router.delete('/applications/{application_id}', response_model=CustomResponse, tags=["Applications"])
 async def delete_application(application_id: Annotated[UUID, Path(title="The ID of the application to be deleted")],
                              current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
-    application = db.query(Application).filter(Application.id == application_id).first()
+                                db: AsyncSession = Depends(get_async_db),):
+    application = (await db.execute(select(Application).filter(Application.id == application_id).with_for_update())).scalars().first()
     if application is None:
         raise NotFoundException("Application not found!")
     try:
-        db.delete(application)
-        db.commit()
+        await count_applications(db, [(application.job_id, application.status, -1)])
+        await db.delete(application)
+        await db.commit()
         return {"message": "Application deleted successfully"}
     except BadRequestException:
-        db.rollback()
+        await db.rollback()
         raise BadRequestException("Application delete failed")
 
 # fetch applications
@@ -385,10 +550,11 @@ async def delete_application(application_id: Annotated[UUID, Path(title="The ID
 async def fetch_job_assessments(job_id: Annotated[UUID, Path(title="The ID of the job to be fetched")],
                             current_user: Annotated[BaseUser, Depends(get_current_user)],
                             limit: int = 10, page: int = 1, search: str = '',
-                            db: Session = Depends(get_db)
+                            db: AsyncSession = Depends(get_async_db),
+                            jobAssessmentRepo: JobAssessmentRepository = Depends()
                             ):
     
-    job = db.query(Job).filter(Job.id == job_id).first()
+    job = (await db.execute(select(Job).filter(Job.id == job_id))).scalars().first()
     
     if job is None:
         raise NotFoundException("Job not found!")
@@ -401,15 +567,17 @@ async def fetch_job_assessments(job_id: Annotated[UUID, Path(title="The ID of th
 @router.post('/{job_id}/assessments', response_model=CustomResponse[BaseJobAssessment], tags=["Job Assessments", "Jobs"])
 async def create_job_assessment(job_id: Annotated[UUID, Path(title="The ID of the job to be fetched")], payload: CreateJobAssessment,
                                 current_user: Annotated[BaseUser, Depends(get_current_user)],
-                                db: Session = Depends(get_db),):
+                                db: AsyncSession = Depends(get_async_db),
+                                jobAssessmentRepo: JobAssessmentRepository = Depends()):
     
-    job = db.query(Job).filter(Job.id == job_id).first()
+    job = (await db.execute(select(Job).filter(Job.id == job_id))).scalars().first()
     
     if job is None:
         raise NotFoundException("Job not found!")
     
     
     jobAssessment = await jobAssessmentRepo.create(payload=payload)
+    await db.commit()
     
     return {"message": 'Job assessment created successfully', 'data': jobAssessment}
 
@@ -417,10 +585,13 @@ async def create_job_assessment(job_id: Annotated[UUID, Path(title="The ID of th
 @router.put('/{job_id}/assessments/{job_assessment_id}', response_model=CustomListResponse[BaseJobAssessment], tags=["Job Assessments", "Jobs"])
 async def update_job_assessment(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")], job_assessment_id: Annotated[UUID, Path(title="The ID of the job assessments to be updated")],
                             payload: BaseJobAssessment,
-                            current_user: Annotated[BaseUser, Depends(get_current_user)]):
+                            current_user: Annotated[BaseUser, Depends(get_current_user)],
+                            db: AsyncSession = Depends(get_async_db),
+                            jobAssessmentRepo: JobAssessmentRepository = Depends()):
     
     await jobAssessmentRepo.get_by_id(job_assessment_id=job_assessment_id)
     jobAssessment = await jobAssessmentRepo.update(payload=payload)
+    await db.commit()
     
     return {'message': 'Job Assessment updated successfully', 'data': jobAssessment}
 
@@ -428,9 +599,12 @@ async def update_job_assessment(job_id: Annotated[UUID, Path(title="The ID of th
 @router.delete('/{job_id}/assessments/{job_assessment_id}', response_model=CustomResponse, tags=["Job Assessments", "Jobs"])
 async def delete_job_assessment(job_id: Annotated[UUID, Path(title="The ID of the job to be updated")], 
                             job_assessment_id: Annotated[UUID, Path(title="The ID of the job assessments to be updated")],
-                            current_user: Annotated[BaseUser, Depends(get_current_user)]):
+                            current_user: Annotated[BaseUser, Depends(get_current_user)],
+                            db: AsyncSession = Depends(get_async_db),
+                            jobAssessmentRepo: JobAssessmentRepository = Depends()):
     
     await jobAssessmentRepo.delete(job_id=job_id, job_assessment_id=job_assessment_id)
+    await db.commit()
     
     return {'message': 'Job Assessment deleted successfully'}
 
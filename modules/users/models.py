@@ -55,6 +55,8 @@ class Company(Base):
     updated_at = Column(TIMESTAMP(timezone=True),
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
+    __table_args__ = (Index('ix_companies_created_at_id', 'created_at', 'id'), )
+
     def __repr__(self):
         return f"<Company {self.name}>"
     
@@ -112,6 +114,8 @@ class User(Base):
     updated_at = Column(TIMESTAMP(timezone=True),
                         nullable=False, server_default=text("now()"), onupdate=text("now()"))
     
+    __table_args__ = (Index('ix_users_role_created_at_id', 'role', 'created_at', 'id'), )
+
     def __repr__(self):
         return f"<User {self.email}>"  
 
@@ -1,33 +1,58 @@
-from sqlalchemy.orm import Session, joinedload
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, noload, selectinload
 
-from core.dependencies.sessions import get_db
+from core.dependencies.sessions import get_async_db
 
 from .models import Company, User, CandidateProfile, ClientProfile, CompanyProfile
 
 
+def user_profiles() -> tuple:
+    '''Loader options for what BaseUser serialises: both profiles, a client's company and its profile'''
+    return (selectinload(User.candidate_profile),
+            selectinload(User.client_profile).selectinload(ClientProfile.company).selectinload(Company.profile))
+
+
+# users of one role only have that role's profile, the other one isn't queried
+def client_profile() -> tuple:
+    return (selectinload(User.client_profile).selectinload(ClientProfile.company).selectinload(Company.profile),
+            noload(User.candidate_profile))
+
+
+def candidate_profile() -> tuple:
+    return selectinload(User.candidate_profile), noload(User.client_profile)
+
+
+async def read_back_user(db: AsyncSession, user_id) -> User:
+    '''The user as written, for handlers that changed it with UPDATE statements'''
+    return (await db.execute(select(User).options(*user_profiles()).filter(User.id == user_id).execution_options(
+        populate_existing=True))).scalars().first()
+
+
 class UserRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self):
         pass
 
     async def get_by_email(self, email):
-        user = self.db.query(User).filter(User.email == email.lower()).first()
+        user = (await self.db.execute(select(User).filter(User.email == email.lower()))).scalars().first()
         return user
 
     async def get_by_email_role(self, email, role):
         pass
 
     async def get_client_profile(self, email):
-        user_profile = self.db.query(User).options(
+        user_profile = (await self.db.execute(select(User).options(
                 joinedload(User.client_profile)
-                .joinedload(ClientProfile.company)).filter(User.email == email).first()
+                .joinedload(ClientProfile.company)).filter(User.email == email))).scalars().first()
         return user_profile
 
     async def get_candidate_profile(self, email):
-        user_profile = self.db.query(User).options(
-                joinedload(User.candidate_profile)).filter(User.email == email).first()
+        user_profile = (await self.db.execute(select(User).options(
+                joinedload(User.candidate_profile)).filter(User.email == email))).scalars().first()
         return user_profile
 
     async def get_list(self):
@@ -40,8 +65,8 @@ class UserRepository:
         pass
 
 class CompanyRepository:
-    def __init__(self) -> None:
-        self.db: Session = get_db().__next__()
+    def __init__(self, db: AsyncSession = Depends(get_async_db)) -> None:
+        self.db = db
 
     async def create(self):
         pass
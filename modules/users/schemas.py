@@ -77,6 +77,7 @@ class BaseCandidate(BaseModel):
     industry_role: Optional[str] = None
     industries: Optional[List[str]] = None
     skills: Optional[List[str]] = None
+    years_of_experience: Optional[int] = None
     currency: Optional[str] = None
     current_earnings: Optional[int] = None
     desired_earnings: Optional[int] = None
@@ -8,17 +8,22 @@ from pydantic import parse_obj_as
 from uuid import UUID
 from slugify import slugify
 
-from sqlalchemy import or_
+from sqlalchemy import or_, select, update, func
 
 from fastapi import Depends, HTTPException, status, APIRouter, Response, Path
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from core.dependencies.sessions import get_db
-from core.dependencies.auth import get_current_user
+from core.dependencies.sessions import get_async_db
+from core.dependencies.auth import get_current_user, invalidate_company, invalidate_user
 from core.exceptions import DuplicateCompanyException, UnauthorisedUserException, NotFoundException
 from core.helpers.schemas import CustomListResponse, CustomResponse
+from core.helpers.pagination import paginate_with_total
+
+from modules.jobs.repository import invalidate_company_feed
 
 from .models import CandidateProfile, ClientProfile, Company, CompanyProfile, User, UserType
+from .repository import candidate_profile, client_profile, read_back_user, user_profiles
 from .schemas import BaseUser, BaseCompany, CreateCompanySchema, CreateUser, UpdateCompanySchema, UpdateUserProfile
 
 router = APIRouter(
@@ -29,20 +34,19 @@ router = APIRouter(
 @router.post('/', response_model=CustomResponse[BaseUser], tags=["User"])
 async def create_user(payload: CreateUser,
     current_user: Annotated[BaseUser, Depends(get_current_user)],
-                  db: Session = Depends(get_db)):
+                  db: AsyncSession = Depends(get_async_db)):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
+    user = (await db.execute(select(User).filter(User.email == payload.email.lower()))).scalars().first()
     if user:
         raise DuplicateEmailException
     #  Hash the password
-    payload.password = password.hash_password(payload.password)
+    payload.password = await password.hash_password(payload.password)
     new_user = User(**payload.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
     # update related models
     if payload.role == UserType.CANDIDATE:
         new_candidate_profile = CandidateProfile(user_id=new_user.id)
@@ -53,63 +57,58 @@ async def create_user(payload: CreateUser,
         new_client_profile.updated_at = datetime.now()
         db.add(new_client_profile)
 
-    db.commit()
+    await db.commit()
+    await db.refresh(new_user, attribute_names=['candidate_profile', 'client_profile'])
     
     return {'message': 'User created successfully', 'data': new_user}
 
 
 @router.get('/admin', response_model=CustomListResponse[BaseUser], tags=["User"])
 async def fetch_admin(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                  db: Session = Depends(get_db), 
-                  limit: int = 10, page: int = 1, search: str = ''):#, user_id: str = Depends(require_user)):
+                  db: AsyncSession = Depends(get_async_db), 
+                  limit: int = 10, page: int = 1, search: str = '', cursor: str = None):#, user_id: str = Depends(require_user)):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    skip = (page - 1) * limit
-    users_query = db.query(User).filter(User.role == UserType.ADMIN)
-    user_count = users_query.count()
-    users = users_query.limit(limit).offset(skip).all()
-    return {'message': 'Admin list retrieved successfully', 'total_count': user_count, 'count': len(users), 'next_page': page + 1,'data': users}
+    users_query = select(User).options(*user_profiles()).filter(User.role == UserType.ADMIN)
+    users, next_cursor, user_count = await paginate_with_total(db, users_query, limit=limit, cursor=cursor, page=page)
+    return {'message': 'Admin list retrieved successfully', 'total_count': user_count, 'count': len(users),
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor, 'data': users}
 
 
 @router.get('/clients', response_model=CustomListResponse[BaseUser], tags=["User"])
 async def fetch_clients(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                  db: Session = Depends(get_db), 
-                  limit: int = 10, page: int = 1, search: str = ''):#, user_id: str = Depends(require_user)):
+                  db: AsyncSession = Depends(get_async_db), 
+                  limit: int = 10, page: int = 1, search: str = '', cursor: str = None):#, user_id: str = Depends(require_user)):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    skip = (page - 1) * limit
-    users_query = db.query(User).options(
-                joinedload(User.client_profile)
-                .joinedload(ClientProfile.company)).filter(User.role == UserType.CLIENT)
+    users_query = select(User).options(*client_profile()).filter(User.role == UserType.CLIENT)
     if search:
         users_query = users_query.filter(or_(User.first_name.like(f"%{search}%"), User.last_name.like(f"%{search}%"), 
                                              ))
-    user_count = users_query.count()
-    users = users_query.limit(limit).offset(skip).all()
-    return {'message': 'Client list retrieved successfully', 'total_count': user_count, 'count': len(users), 'next_page': page + 1,'data': users}
+    users, next_cursor, user_count = await paginate_with_total(db, users_query, limit=limit, cursor=cursor, page=page)
+    return {'message': 'Client list retrieved successfully', 'total_count': user_count, 'count': len(users),
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor, 'data': users}
 
 
 @router.get('/candidates', response_model=CustomListResponse[BaseUser], tags=["User"])
 async def fetch_candidates(current_user: Annotated[BaseUser, Depends(get_current_user)],
-                     db: Session = Depends(get_db), 
-                  limit: int = 10, page: int = 1, search: str = ''):#, user_id: str = Depends(require_user)):
+                     db: AsyncSession = Depends(get_async_db), 
+                  limit: int = 10, page: int = 1, search: str = '', cursor: str = None):#, user_id: str = Depends(require_user)):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    skip = (page - 1) * limit
-    users_query = db.query(User).options(
-                joinedload(User.candidate_profile)).filter(User.role == UserType.CANDIDATE)
+    users_query = select(User).options(*candidate_profile()).filter(User.role == UserType.CANDIDATE)
     if search:
         users_query = users_query.filter(or_(User.first_name.like(f"%{search}%"), User.last_name.like(f"%{search}%"), 
                                             ))
-    user_count = users_query.count()
-    users = users_query.limit(limit).offset(skip).all()
-    return {'message': 'Candidate list retrieved successfully', 'total_count': user_count, 'count': len(users), 'next_page': page + 1,'data': users}
+    users, next_cursor, user_count = await paginate_with_total(db, users_query, limit=limit, cursor=cursor, page=page)
+    return {'message': 'Candidate list retrieved successfully', 'total_count': user_count, 'count': len(users),
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor, 'data': users}
 
 
 
@@ -117,12 +116,12 @@ async def fetch_candidates(current_user: Annotated[BaseUser, Depends(get_current
 async def fetch_admin_details(
     current_user: Annotated[BaseUser, Depends(get_current_user)],
     user_id: Annotated[UUID, Path(title="The ID of the User to be retrieved")],
-    db: Session = Depends(get_db)):#, user_id: str = Depends(require_user)):
+    db: AsyncSession = Depends(get_async_db)):#, user_id: str = Depends(require_user)):
 
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = (await db.execute(select(User).options(*user_profiles()).filter(User.id == user_id))).scalars().first()
     
     if user is None:
         raise NotFoundException("User not found!")
@@ -135,13 +134,12 @@ async def fetch_admin_details(
 async def fetch_candidate_details(
     current_user: Annotated[BaseUser, Depends(get_current_user)],
     user_id: Annotated[UUID, Path(title="The ID of the User to be retrieved")],
-    db: Session = Depends(get_db)):#, user_id: str = Depends(require_user)):
+    db: AsyncSession = Depends(get_async_db)):#, user_id: str = Depends(require_user)):
 
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
 
-    user = db.query(User).options(
-                joinedload(User.candidate_profile)).filter(User.id == user_id).first()
+    user = (await db.execute(select(User).options(*candidate_profile()).filter(User.id == user_id))).scalars().first()
     
     if user is None:
         raise NotFoundException("User not found!")
@@ -153,14 +151,12 @@ async def fetch_candidate_details(
 async def fetch_client_details(
     current_user: Annotated[BaseUser, Depends(get_current_user)],
     user_id: Annotated[UUID, Path(title="The ID of the User to be retrieved")],
-    db: Session = Depends(get_db)):#, user_id: str = Depends(require_user)):
+    db: AsyncSession = Depends(get_async_db)):#, user_id: str = Depends(require_user)):
 
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
 
-    user = db.query(User).options(
-                joinedload(User.client_profile)
-                .joinedload(ClientProfile.company)).filter(User.id == user_id).first()
+    user = (await db.execute(select(User).options(*client_profile()).filter(User.id == user_id))).scalars().first()
     
     if user is None:
         raise NotFoundException("User not found!")
@@ -170,28 +166,26 @@ async def fetch_client_details(
 
 # ##################################
 @router.get("/companies", response_model=CustomListResponse[BaseCompany], tags=["Companies"])
-async def fetch_companies(db: Session = Depends(get_db), limit: int = 10, page: int = 1, search: str = ''):#, user_id: str = Depends(require_user)):
-    skip = (page - 1) * limit
-
-    companies = db.query(Company).options(joinedload(Company.profile)).filter(
+async def fetch_companies(db: AsyncSession = Depends(get_async_db), limit: int = 10, page: int = 1, search: str = '', cursor: str = None):#, user_id: str = Depends(require_user)):
+    companies = select(Company).options(joinedload(Company.profile)).filter(
         Company.name.contains(search))
     
-    company_count = companies.count()
-
-    companies_object = companies.limit(limit).offset(skip).all()
+    companies_object, next_cursor, company_count = await paginate_with_total(db, companies, limit=limit,
+                                                                             cursor=cursor, page=page)
     
     if len(companies_object) < 1: 
         raise NotFoundException('No Companies found')
-    return {'message': 'Company list retrieved successfully', 'total_count': company_count,'count': len(companies_object), 'next_page': page + 1, 'data': companies_object}
+    return {'message': 'Company list retrieved successfully', 'total_count': company_count,'count': len(companies_object),
+            'next_page': page + 1 if next_cursor else None, 'next_cursor': next_cursor, 'data': companies_object}
 
 
 @router.get("/companies/{company_id}", response_model=CustomResponse[BaseCompany], tags=["Companies"])
 async def fetch_company(
     company_id: Annotated[UUID, Path(title="The ID of the company to be retrieved")],
-    db: Session = Depends(get_db)):#, user_id: str = Depends(require_user)):
+    db: AsyncSession = Depends(get_async_db)):#, user_id: str = Depends(require_user)):
 
-    company = db.query(Company).options(joinedload(Company.profile)).filter(
-        Company.id == company_id).first()
+    company = (await db.execute(select(Company).options(joinedload(Company.profile)).filter(
+        Company.id == company_id))).scalars().first()
     
     if company is None:
         raise NotFoundException("Company not found!")
@@ -202,7 +196,7 @@ async def fetch_company(
 @router.post('/companies', status_code=status.HTTP_201_CREATED, response_model=CustomResponse[BaseCompany], tags=["Companies"])
 async def create_company(payload: CreateCompanySchema,
                    current_user: Annotated[BaseUser, Depends(get_current_user)],
-                   db: Session = Depends(get_db)):
+                   db: AsyncSession = Depends(get_async_db)):
     
     if current_user.role == UserType.CANDIDATE:
         raise UnauthorisedUserException("You are not authorized to create company profiles")
@@ -214,42 +208,43 @@ async def create_company(payload: CreateCompanySchema,
     if current_user.role == UserType.ADMIN:
         if not payload.client_id:
             raise BadRequestException("Kindly pass client id")
-        user_query = db.query(User).filter(User.id == payload.client_id)
+        user_query = select(User).filter(User.id == payload.client_id)
     else:
-        user_query = db.query(User).filter(User.id == current_user.id)
+        user_query = select(User).filter(User.id == current_user.id)
 
 
-    company = db.query(Company).filter(Company.slug == slug).first()
+    company = (await db.execute(select(Company).filter(Company.slug == slug))).scalars().first()
 
     if company:
         # Contact company owner message, reach out to support email
         raise DuplicateCompanyException
     
-    user_object = user_query.first()
+    user_object = (await db.execute(user_query)).scalars().first()
     if user_object is None:
         raise NotFoundException('No such client')
     
     new_company = Company(**payload.dict(exclude={'client_id'}))
     new_company.slug = slug
-    new_company.owner_id = user_object.id
+    new_company.owner_id = str(user_object.id)
     new_company.secret_key = secrets.token_urlsafe()
     db.add(new_company)
-    db.commit()
+    await db.flush()
     # update related models
     user_object.company_id = new_company.id
     new_company_profile = CompanyProfile(company_id=new_company.id)
     new_company_profile.updated_at = datetime.now()
     db.add(new_company_profile)
-    db.commit()
+    await db.commit()
+    invalidate_user(user_object.id)
 
-    db.refresh(new_company)
+    await db.refresh(new_company, attribute_names=['profile'])
     return {'message': 'Company created successfully', 'data': BaseCompany.from_orm(new_company)}   
 
 @router.patch('/companies/{company_id}', response_model=CustomResponse[BaseCompany], tags=["Companies"])
 async def update_company_profile(company_id: Annotated[UUID, Path(title="The ID of the company to be updated")],
                                  payload: UpdateCompanySchema,
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
     if current_user.role == UserType.CANDIDATE:
         raise UnauthorisedUserException("User is not authorised to edit company details")
@@ -257,17 +252,17 @@ async def update_company_profile(company_id: Annotated[UUID, Path(title="The ID
     if current_user.role == UserType.ADMIN: 
         if not payload.client_id:
             raise BadRequestException("Kindly pass client id")
-        user_query = db.query(User).filter(User.id == payload.client_id)
+        user_query = select(User).filter(User.id == payload.client_id)
     else:
-        user_query = db.query(User).filter(User.id == current_user.id)
+        user_query = select(User).filter(User.id == current_user.id)
 
-    user = user_query.first()
+    user = (await db.execute(user_query)).scalars().first()
     if user is None:
         raise NotFoundException('No such client')
 
     
-    company_query = db.query(Company).filter(Company.id == company_id)
-    company = company_query.first()
+    company_query = select(Company).filter(Company.id == company_id)
+    company = (await db.execute(company_query)).scalars().first()
 
     if company is None:
         raise NotFoundException("Company not found!")
@@ -277,12 +272,20 @@ async def update_company_profile(company_id: Annotated[UUID, Path(title="The ID
         raise UnauthorisedUserException("User is not authorised to edit this company details")
     
     
-    company_query.update(payload.dict(exclude={'profile', 'client_id'},exclude_unset=True), synchronize_session=False)
-    if payload.profile != None:
-        company_profile_query = db.query(CompanyProfile).filter(CompanyProfile.company_id == company_id)
-        company_profile_query.update(payload.profile.dict(exclude={'company_id'}, exclude_unset=True), synchronize_session=False)
+    company_values = payload.dict(exclude={'profile', 'client_id'},exclude_unset=True)
+    if company_values:
+        await db.execute(update(Company).filter(Company.id == company_id).values(company_values))
+    profile_values = payload.profile.dict(exclude={'company_id'}, exclude_unset=True) if payload.profile != None else None
+    if profile_values:
+        await db.execute(update(CompanyProfile).filter(CompanyProfile.company_id == company_id
+                                                       ).values(profile_values))
     
-    db.commit()
+    await db.commit()
+    invalidate_company(company_id)
+    invalidate_company_feed(company_id)
+    # the UPDATEs went past the loaded company, answer with what was written
+    company = (await db.execute(select(Company).options(joinedload(Company.profile)).filter(
+        Company.id == company_id).execution_options(populate_existing=True))).scalars().first()
     
     return {"message":"Company profile updated successfully","data": company}
 
@@ -292,14 +295,14 @@ async def update_company_profile(company_id: Annotated[UUID, Path(title="The ID
               tags=["User"])
 async def update_user_profile(payload: Optional[UpdateUserProfile],
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
-    user_query = db.query(User)
+    user_query = select(User)
     
     if current_user.role == UserType.CANDIDATE:
-        user = user_query.options(joinedload(User.candidate_profile)).filter(User.id == current_user.id).first()
-        candidate_query = db.query(CandidateProfile).filter(CandidateProfile.user_id == current_user.id)
-        candidate = candidate_query.first()
+        user = (await db.execute(user_query.options(joinedload(User.candidate_profile)).filter(User.id == current_user.id))).scalars().first()
+        candidate_query = select(CandidateProfile).filter(CandidateProfile.user_id == current_user.id)
+        candidate = (await db.execute(candidate_query)).scalars().first()
         
         if candidate is None and payload.candidate_profile == None:
             new_profile = CandidateProfile(user_id = current_user.id, updated_at = datetime.now())
@@ -310,12 +313,13 @@ async def update_user_profile(payload: Optional[UpdateUserProfile],
             new_profile.updated_at = datetime.now()
             db.add(new_profile)
         elif candidate is not None and payload.candidate_profile != None:
-            candidate_query.update(payload.candidate_profile.dict(exclude_unset=True))
+            await db.execute(update(CandidateProfile).filter(CandidateProfile.id == candidate.id
+                                                             ).values(payload.candidate_profile.dict(exclude_unset=True)))
 
     elif current_user.role == UserType.CLIENT:
-        user = user_query.options(joinedload(User.client_profile)).filter(User.id == current_user.id).first()
-        client_query = db.query(ClientProfile).filter(ClientProfile.user_id == current_user.id)
-        client = client_query.first()
+        user = (await db.execute(user_query.options(joinedload(User.client_profile)).filter(User.id == current_user.id))).scalars().first()
+        client_query = select(ClientProfile).filter(ClientProfile.user_id == current_user.id)
+        client = (await db.execute(client_query)).scalars().first()
 
         if client is None and payload.client_profile == None:
             new_profile = ClientProfile(user_id = current_user.id, updated_at = datetime.now())
@@ -326,7 +330,8 @@ async def update_user_profile(payload: Optional[UpdateUserProfile],
             new_profile.updated_at = datetime.now()
             db.add(new_profile)
         elif client is not None and payload.client_profile != None:
-            client_query.update(payload.client_profile.dict(exclude_unset=True))
+            await db.execute(update(ClientProfile).filter(ClientProfile.id == client.id
+                                                          ).values(payload.client_profile.dict(exclude_unset=True)))
     
 
     
@@ -339,8 +344,9 @@ async def update_user_profile(payload: Optional[UpdateUserProfile],
     if payload.photo:
         user.photo= payload.photo
         
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    invalidate_user(user.id)
+    user = await read_back_user(db, user.id)
     
     return {"message":"User profile updated successfully","data": user}
 
@@ -352,22 +358,22 @@ async def admin_update_user_profile(
     user_id: Annotated[UUID, Path(title="The ID of the job to be updated")],
     payload: Optional[UpdateUserProfile],
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    user_query = db.query(User)
+    user_query = select(User)
 
-    user_object = user_query.filter(User.id == user_id).first()
+    user_object = (await db.execute(user_query.filter(User.id == user_id))).scalars().first()
 
     if user_object is None:
         raise NotFoundException("User not found!")
     
     if user_object.role == UserType.CANDIDATE:
-        user = user_query.options(joinedload(User.candidate_profile)).filter(User.id == user_object.id).first()
-        candidate_query = db.query(CandidateProfile).filter(CandidateProfile.user_id == user_object.id)
-        candidate = candidate_query.first()
+        user = (await db.execute(user_query.options(joinedload(User.candidate_profile)).filter(User.id == user_object.id))).scalars().first()
+        candidate_query = select(CandidateProfile).filter(CandidateProfile.user_id == user_object.id)
+        candidate = (await db.execute(candidate_query)).scalars().first()
         
         if candidate is None and payload.candidate_profile == None:
             new_profile = CandidateProfile(user_id = user_object.id, updated_at = datetime.now())
@@ -378,12 +384,13 @@ async def admin_update_user_profile(
             new_profile.updated_at = datetime.now()
             db.add(new_profile)
         elif candidate is not None and payload.candidate_profile != None:
-            candidate_query.update(payload.candidate_profile.dict(exclude_unset=True))
+            await db.execute(update(CandidateProfile).filter(CandidateProfile.id == candidate.id
+                                                             ).values(payload.candidate_profile.dict(exclude_unset=True)))
 
     elif user_object.role == UserType.CLIENT:
-        user = user_query.options(joinedload(User.client_profile)).filter(User.id == user_object.id).first()
-        client_query = db.query(ClientProfile).filter(ClientProfile.user_id == user_object.id)
-        client = client_query.first()
+        user = (await db.execute(user_query.options(joinedload(User.client_profile)).filter(User.id == user_object.id))).scalars().first()
+        client_query = select(ClientProfile).filter(ClientProfile.user_id == user_object.id)
+        client = (await db.execute(client_query)).scalars().first()
 
         if client is None and payload.client_profile == None:
             new_profile = ClientProfile(user_id = user_object.id, updated_at = datetime.now())
@@ -394,7 +401,8 @@ async def admin_update_user_profile(
             new_profile.updated_at = datetime.now()
             db.add(new_profile)
         elif client is not None and payload.client_profile != None:
-            client_query.update(payload.client_profile.dict(exclude_unset=True))
+            await db.execute(update(ClientProfile).filter(ClientProfile.id == client.id
+                                                          ).values(payload.client_profile.dict(exclude_unset=True)))
     
 
     
@@ -407,8 +415,9 @@ async def admin_update_user_profile(
     if payload.photo:
         user.photo= payload.photo
         
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    invalidate_user(user.id)
+    user = await read_back_user(db, user.id)
     
     return {"message":"User profile updated successfully","data": user}
 
@@ -416,21 +425,23 @@ async def admin_update_user_profile(
 @router.delete('/{company_id}', response_model=CustomResponse, tags=["Companies"])
 async def delete_company(company_id: Annotated[UUID, Path(title="The ID of the company to be deleted")],
                current_user: Annotated[BaseUser, Depends(get_current_user)],
-               db: Session = Depends(get_db),):
+               db: AsyncSession = Depends(get_async_db),):
     
     if current_user.role != UserType.ADMIN:
         raise UnauthorisedUserException("User is not authorised to access this view")
     
-    company = db.query(Company).filter(Company.id == company_id).first()
+    company = (await db.execute(select(Company).filter(Company.id == company_id))).scalars().first()
 
     if company is None:
         raise NotFoundException("Company not found!")
     try:
-        db.delete(company)
-        db.commit()
+        await db.delete(company)
+        await db.commit()
+        invalidate_company(company_id)
+        invalidate_company_feed(company_id)
         return {"message": "Company profile deleted"}
     except BadRequestException:
-        db.rollback()
+        await db.rollback()
         raise BadRequestException("Company delete failed")
 # TODO: 
 # CRUD Users
@@ -0,0 +1,83 @@
+'''
+    Insert time against question count for a new assessment, comparing the
+    old one-flush-per-row path with QuestionRepository.bulk_create.
+    Needs a database configured like the app (POSTGRES_* env vars), every
+    run is rolled back.
+
+        python -m tests.benchmarks.assessment_inserts [question counts...]
+'''
+import asyncio
+import sys
+import time
+from uuid import uuid4
+
+from core.dependencies.sessions import AsyncSessionLocal
+from modules.assessments.models import Answer, Assessment, AssessmentDifficulty, Question, QuestionType
+from modules.assessments.repository import QuestionRepository
+from modules.assessments.schemas import CreateAnswerSchema, CreateQuestionSchema
+
+
+QUESTION_COUNTS = (10, 50, 100, 250)
+ANSWERS_PER_QUESTION = 4
+
+
+def make_questions(count: int):
+    return [CreateQuestionSchema(
+        title=f"Question {number}",
+        category="benchmark",
+        question_type=QuestionType.SINGLE_CHOICE,
+        answers=[CreateAnswerSchema(answer_text=f"Option {option}", is_correct=option == 0)
+                 for option in range(ANSWERS_PER_QUESTION)],
+    ) for number in range(count)]
+
+
+async def row_by_row(db, questions, assessment_id):
+    # what AssessmentRepository.create used to do
+    for item in questions:
+        question = Question(title=item.title, category=item.category, assessment_id=assessment_id,
+                            question_type=item.question_type, difficulty=item.difficulty, tags=item.tags)
+        db.add(question)
+        await db.flush()
+        for answer_item in item.answers:
+            answer = Answer(question_id=question.id, answer_text=answer_item.answer_text,
+                            boolean_text=answer_item.boolean_text, is_correct=answer_item.is_correct,
+                            feedback=answer_item.feedback)
+            db.add(answer)
+            await db.flush()
+            await db.refresh(answer)
+        await db.refresh(question)
+
+
+async def bulk(db, questions, assessment_id):
+    await QuestionRepository(db).bulk_create(questions, assessment_id)
+
+
+async def timed(insert, count: int) -> float:
+    async with AsyncSessionLocal() as db:
+        assessment = Assessment(name=f"benchmark-{uuid4()}", slug="benchmark", description="-", instructions="-",
+                                difficulty=AssessmentDifficulty.JUNIOR, skills=[], duration="10")
+        db.add(assessment)
+        await db.flush()
+        questions = make_questions(count)
+
+        start = time.perf_counter()
+        await insert(db, questions, assessment.id)
+        elapsed = time.perf_counter() - start
+        await db.rollback()
+    return elapsed * 1000
+
+
+async def main(counts):
+    # warm up the pool and the statement caches
+    await timed(bulk, 1)
+    await timed(row_by_row, 1)
+
+    print(f"{'questions':>9} {'answers':>8} {'row by row ms':>14} {'bulk ms':>9} {'speedup':>8}")
+    for count in counts:
+        slow = await timed(row_by_row, count)
+        fast = await timed(bulk, count)
+        print(f"{count:>9} {count * ANSWERS_PER_QUESTION:>8} {slow:>14.1f} {fast:>9.1f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(count) for count in sys.argv[1:]] or QUESTION_COUNTS))
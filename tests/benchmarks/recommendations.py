@@ -0,0 +1,53 @@
+'''
+    Build time of the job recommendation index and time to score every
+    job for one candidate, against the number of active jobs. The jobs are
+    generated in memory, no database needed.
+
+        python -m tests.benchmarks.recommendations [job counts...]
+'''
+import random
+import statistics
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from modules.jobs.enums import Currency, ExperienceLevel, JobStatus
+from modules.jobs.recommender import JobMatrix
+
+
+JOB_COUNTS = (1000, 10000, 100000)
+SKILLS = [f"skill {number}" for number in range(2000)]
+TITLES = ["Backend Engineer", "Frontend Developer", "Data Scientist", "Product Designer", "Accountant"]
+INDUSTRIES = ["fintech", "health", "logistics", "media", "education"]
+SCORE_RUNS = 50
+
+JobRow = namedtuple("JobRow", "id title skills tags experienceLevel salaryRangeTo currency status updated_at")
+
+
+def make_jobs(count: int):
+    now = datetime.now(timezone.utc)
+    return [JobRow(uuid4(), random.choice(TITLES), random.sample(SKILLS, 6), [random.choice(INDUSTRIES)],
+                   random.choice(list(ExperienceLevel)), random.randrange(1000, 20000),
+                   random.choice(list(Currency)), JobStatus.ACTIVE, now) for _ in range(count)]
+
+
+def main(counts):
+    for count in counts:
+        jobs = make_jobs(count)
+        start = time.perf_counter()
+        matrix = JobMatrix.build(jobs)
+        built = time.perf_counter() - start
+
+        timings = []
+        for _ in range(SCORE_RUNS):
+            start = time.perf_counter()
+            matrix.top(matrix.score(random.sample(SKILLS, 8), ["Fintech"], 4, 8000, "USD"), 10)
+            timings.append(time.perf_counter() - start)
+        print(f"{count:>7} jobs  build {built:6.2f}s  "
+              f"score + top 10 median {statistics.median(timings) * 1000:6.2f}ms  max {max(timings) * 1000:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or JOB_COUNTS)
@@ -0,0 +1,50 @@
+'''
+    Time from a fresh interpreter to the first served request, the number
+    an autoscaled worker pays before it can take traffic. Each run is a new
+    process so nothing is shared between runs. Needs the app's environment
+    (POSTGRES_* etc.), the startup schema check talks to the database.
+
+        python -m tests.benchmarks.startup [runs]
+'''
+import json
+import statistics
+import subprocess
+import sys
+
+
+RUNS = 5
+
+CHILD = """
+import json, time
+# the test client is harness, not app startup
+from fastapi.testclient import TestClient
+
+start = time.perf_counter()
+from core.settings import app
+imported = time.perf_counter()
+
+with TestClient(app) as client:
+    started = time.perf_counter()
+    client.get("/api/v1/health")
+    served = time.perf_counter()
+
+print(json.dumps({"import": imported - start, "startup": started - imported,
+                  "first_request": served - start}))
+"""
+
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs: int):
+    results = [run_once() for _ in range(runs)]
+    print(f"{'phase':>14} {'median ms':>10} {'max ms':>8}")
+    for phase in ("import", "startup", "first_request"):
+        timings = [result[phase] * 1000 for result in results]
+        print(f"{phase:>14} {statistics.median(timings):>10.0f} {max(timings):>8.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
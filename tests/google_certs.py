@@ -0,0 +1,52 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.helpers.google_certs import CachingRequest, cache_lifetime
+
+
+class CertsStandIn(BaseHTTPRequestHandler):
+    '''Serves a certificate document the way Google does, counting the fetches'''
+    fetches = 0
+
+    def do_GET(self):
+        type(self).fetches += 1
+        body = json.dumps({"key-id": "-----BEGIN CERTIFICATE-----"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", "public, max-age=" + self.path.rsplit("/", 1)[-1])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CertsStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def test_certificates_are_fetched_once_within_max_age():
+    server, url = serve()
+    try:
+        CertsStandIn.fetches = 0
+        transport = CachingRequest()
+        responses = [transport(f"{url}/certs/3600") for _ in range(5)]
+        assert CertsStandIn.fetches == 1
+        assert all(json.loads(response.data) == {"key-id": "-----BEGIN CERTIFICATE-----"} for response in responses)
+
+        # max-age=0 is never reused
+        transport(f"{url}/certs/0")
+        transport(f"{url}/certs/0")
+        assert CertsStandIn.fetches == 3
+    finally:
+        server.shutdown()
+
+
+def test_cache_lifetime():
+    assert cache_lifetime({"Cache-Control": "public, max-age=19784, must-revalidate", "Age": "84"}) == 19700
+    assert cache_lifetime({"Cache-Control": "no-store, max-age=60"}) == 0
+    assert cache_lifetime({}) == 0
@@ -6,3 +6,8 @@ def test_root():
     response = client.get("/api/v1/health")
     assert response.status_code == 200
     # assert response.json() == {"message": "The API is LIVE!!"}
+
+
+def test_stats_are_not_public():
+    response = client.get("/api/v1/health/stats")
+    assert response.status_code in (401, 403)
@@ -0,0 +1,219 @@
+'''
+    Number of queries behind GET /jobs/{id}/applications, which must not
+    grow with the number of applicants, and PATCH /jobs/applications/status.
+    Needs the app's database (POSTGRES_* env vars) and is skipped without
+    it; the rows it creates are deleted.
+'''
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, select, update
+
+from core.dependencies.auth import TokenHelper
+from core.dependencies.sessions import AsyncSessionLocal, async_engine, ping_db
+from core.settings import app
+from modules.files.models import File, FileType
+from modules.jobs.enums import ApplicationStatus, ExperienceLevel, JobStatus, JobType, LocationType
+from modules.jobs.models import Application, Job, JobApplicationCount
+from modules.jobs.repository import count_applications
+from modules.users.models import CandidateProfile, ClientProfile, Company, CompanyProfile, User, UserType
+
+
+CVS_PER_APPLICANT = 4
+# job check, company, applications with their job and company, company
+# profiles, applicants, candidate profiles, CVs
+MAX_QUERIES = 7
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+
+def auth_headers(user: User) -> dict:
+    token = TokenHelper.encode({"id": str(user.id), "email": user.email, "role": user.role.value})
+    # PyJWT 1.x returns bytes
+    return {"Authorization": f"Bearer {token.decode() if isinstance(token, bytes) else token}"}
+
+
+def new_user(role: UserType) -> User:
+    return User(id=uuid4(), first_name="Test", last_name="User", email=f"{uuid4().hex}@example.com",
+                password="-", role=role)
+
+
+async def create_job(created: list):
+    owner = new_user(UserType.CLIENT)
+    company = Company(id=uuid4(), name="Test company", slug=uuid4().hex, secret_key=uuid4().hex,
+                      description="-", owner_id=str(owner.id))
+    job = Job(id=uuid4(), title="Test job", slug=uuid4().hex[:15], description="-", type=JobType.FULL_TIME,
+              experienceLevel=ExperienceLevel.ENTRY, status=JobStatus.ACTIVE, location="-",
+              locationType=LocationType.REMOTE, qualifications=[], salaryRangeFrom=1, salaryRangeTo=2,
+              skills=[], benefits=[], tags=[], company_id=company.id,
+              deadline=datetime.now() + timedelta(days=10))
+    async with AsyncSessionLocal() as db:
+        db.add_all([owner, company])
+        await db.flush()
+        db.add_all([ClientProfile(user_id=owner.id, company_id=company.id), CompanyProfile(company_id=company.id), job])
+        await db.commit()
+    created.append(("user", owner.id))
+    created.append(("company", company.id))
+    return owner, job
+
+
+async def add_applicants(job: Job, count: int, created: list):
+    async with AsyncSessionLocal() as db:
+        for _ in range(count):
+            applicant = new_user(UserType.CANDIDATE)
+            db.add(applicant)
+            await db.flush()
+            db.add(CandidateProfile(user_id=applicant.id, skills=[]))
+            db.add(Application(job_id=job.id, applicant_id=applicant.id, status=ApplicationStatus.SHORTLISTED))
+            db.add_all([File(name=f"cv {number}", url=f"https://files.example.com/{uuid4().hex}",
+                             type=FileType.RESUME, owner_id=applicant.id,
+                             created_at=datetime.now() - timedelta(days=number))
+                        for number in range(CVS_PER_APPLICANT)])
+            created.append(("user", applicant.id))
+        await count_applications(db, [(job.id, ApplicationStatus.SHORTLISTED, count)])
+        await db.commit()
+
+
+async def application_ids(job: Job, status: ApplicationStatus = None) -> list:
+    query = select(Application.id).filter(Application.job_id == job.id).order_by(Application.id)
+    if status is not None:
+        query = query.filter(Application.status == status)
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(query)).scalars())
+
+
+async def applicant(application_id) -> User:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(User).join(Application, Application.applicant_id == User.id).filter(
+            Application.id == application_id))).scalars().first()
+
+
+async def set_status(application_id, status: ApplicationStatus):
+    async with AsyncSessionLocal() as db:
+        application = await db.get(Application, application_id)
+        counted = [(application.job_id, application.status, -1), (application.job_id, status, 1)]
+        await db.execute(update(Application).filter(Application.id == application_id).values(status=status))
+        await count_applications(db, counted)
+        await db.commit()
+
+
+async def clean_up(created: list):
+    users = [id for kind, id in created if kind == "user"]
+    companies = [id for kind, id in created if kind == "company"]
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(File).filter(File.owner_id.in_(users)))
+        await db.execute(delete(Application).filter(Application.applicant_id.in_(users)))
+        await db.execute(delete(Job).filter(Job.company_id.in_(companies)))
+        await db.execute(delete(CandidateProfile).filter(CandidateProfile.user_id.in_(users)))
+        await db.execute(delete(ClientProfile).filter(ClientProfile.user_id.in_(users)))
+        await db.execute(delete(CompanyProfile).filter(CompanyProfile.company_id.in_(companies)))
+        await db.execute(delete(Company).filter(Company.id.in_(companies)))
+        await db.execute(delete(User).filter(User.id.in_(users)))
+        await db.commit()
+
+
+def test_job_applications_query_count_does_not_grow_with_applicants():
+    with TestClient(app) as client:
+        try:
+            client.portal.call(ping_db)
+        except Exception:
+            pytest.skip("database unreachable")
+
+        created = []
+        try:
+            owner, job = client.portal.call(create_job, created)
+            headers = auth_headers(owner)
+            url = f"/api/v1/jobs/{job.id}/applications"
+
+            queries, added = [], 0
+            for applicants in (2, 10):
+                client.portal.call(add_applicants, job, applicants - added, created)
+                added = applicants
+                # the first request also loads the user for the token
+                client.get(url, headers=headers)
+                with count_queries() as statements:
+                    response = client.get(url, headers=headers)
+                assert response.status_code == 200
+                data = response.json()["data"]
+                assert len(data) == applicants
+                assert all(len(application["applicant"]["candidate_profile"]["cv"]) == 3 for application in data)
+                queries.append(len(statements))
+
+            assert queries[0] == queries[1] <= MAX_QUERIES, queries
+        finally:
+            client.portal.call(clean_up, created)
+
+
+def test_bulk_status_update_only_moves_allowed_applications_of_own_jobs():
+    with TestClient(app) as client:
+        try:
+            client.portal.call(ping_db)
+        except Exception:
+            pytest.skip("database unreachable")
+
+        created = []
+        try:
+            owner, job = client.portal.call(create_job, created)
+            other_owner, other_job = client.portal.call(create_job, created)
+            client.portal.call(add_applicants, job, 3, created)
+            client.portal.call(add_applicants, other_job, 1, created)
+            ids = client.portal.call(application_ids, job)
+            other_ids = client.portal.call(application_ids, other_job)
+            client.portal.call(set_status, ids[0], ApplicationStatus.HIRED)
+            headers = auth_headers(owner)
+
+            missing = uuid4()
+            response = client.patch("/api/v1/jobs/applications/status", headers=headers, json={
+                "application_ids": [str(id) for id in (*ids, *other_ids, missing)], "status": "INTERVIEWING"})
+            assert response.status_code == 200
+            report = response.json()["data"]
+            assert report["updated"] == 2
+            outcomes = {result["id"]: (result["outcome"], result["previous_status"]) for result in report["results"]}
+            assert outcomes == {
+                str(ids[0]): ("not_allowed", "HIRED"),
+                str(ids[1]): ("updated", "SHORTLISTED"),
+                str(ids[2]): ("updated", "SHORTLISTED"),
+                # another company's application looks like a missing one
+                str(other_ids[0]): ("not_found", None),
+                str(missing): ("not_found", None),
+            }
+            assert client.portal.call(application_ids, other_job, ApplicationStatus.SHORTLISTED) == other_ids
+
+            # one application at a time follows the same rules
+            applications = "/api/v1/jobs/applications"
+            assert client.put(f"{applications}/shortlist/{ids[0]}", headers=headers).status_code == 400
+            assert client.put(f"{applications}/{ids[0]}", headers=headers, json={"status": "SHORTLISTED"}).status_code == 400
+            assert client.put(f"{applications}/shortlist/{other_ids[0]}", headers=headers).status_code == 404
+            response = client.put(f"{applications}/{ids[1]}", headers=headers, json={"status": "INTERVIEWING", "comment": "-"})
+            assert response.status_code == 200
+            assert response.json()["data"]["status"] == "INTERVIEWING" and response.json()["data"]["comment"] == "-"
+
+            # the counts moved with the applications, without counting them
+            job_url = f"/api/v1/jobs/{job.id}"
+            assert client.get(job_url, headers=headers).json()["data"]["application_counts"] == {
+                "HIRED": 1, "INTERVIEWING": 2}
+            # they are the company's, candidates don't see them
+            candidate_headers = auth_headers(client.portal.call(applicant, ids[1]))
+            assert "application_counts" not in client.get(job_url, headers=candidate_headers).json()["data"]
+            with count_queries() as statements:
+                feed = client.get("/api/v1/jobs/", headers=candidate_headers, params={"limit": 99}).json()["data"]
+            assert feed and not any("application_counts" in listed for listed in feed)
+            # nor are they queried for them
+            assert statements and not any("job_application_counts" in statement for statement in statements)
+        finally:
+            client.portal.call(clean_up, created)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+
+from modules.jobs.enums import JobStatus, LocationType
+from modules.jobs.feed_events import FeedEvents, RedisEventStore
+from modules.jobs.repository import FEED_JOB_FIELDS, FeedPage, apply_feed_event, feed_cache
+from modules.jobs.schemas import JobFilters
+from modules.jobs.services import etag_matches
+
+from .token_revocation import RedisStandIn
+
+
+class StringsStandIn(RedisStandIn):
+    '''Adds the string commands RedisEventStore uses'''
+
+    def __init__(self):
+        super().__init__()
+        self.strings = {}
+
+    def reply(self, command, key, *args) -> bytes:
+        if command == "INCR":
+            self.strings[key] = str(int(self.strings.get(key, 0)) + 1)
+            return b":%s\r\n" % self.strings[key].encode()
+        if command == "SET":
+            self.strings[key] = args[0]
+            return b"+OK\r\n"
+        if command == "GET":
+            value = self.strings.get(key)
+            return b"$-1\r\n" if value is None else self.string(value)
+        if command == "MGET":
+            values = [self.strings.get(name) for name in (key, *args)]
+            return b"*%d\r\n" % len(values) + b"".join(
+                b"$-1\r\n" if value is None else self.string(value) for value in values)
+        return super().reply(command, key, *args)
+
+
+def worker(url: str, name: str) -> FeedEvents:
+    events = FeedEvents(RedisEventStore(url, 60))
+    events.origin = lambda: name
+    return events
+
+
+def test_invalidations_reach_the_other_workers():
+    async def run():
+        stand_in = StringsStandIn()
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        async with server:
+            first, second = worker(url, "first"), worker(url, "second")
+            applied, resets = [], []
+
+            async def pull(events):
+                return await events.pull(applied.append, lambda: resets.append(events.origin()))
+
+            # pages cached before the first pull can't be trusted
+            await pull(first), await pull(second)
+            first.publish({"company_id": "company"})
+            await asyncio.gather(*first._publishing)
+            await pull(first), await pull(second)
+            after_publish = list(applied), list(resets)
+
+            # an invalidation that expired before it was read drops everything
+            first.publish({})
+            await asyncio.gather(*first._publishing)
+            stand_in.strings.pop("feed_events:2")
+            await pull(second)
+            return after_publish, resets
+
+    (applied, resets_before), resets = asyncio.run(run())
+    # the worker that published already dropped its pages
+    assert applied == [{"company_id": "company"}]
+    assert resets_before == ["first", "second"]
+    assert resets == ["first", "second", "second"]
+
+
+def test_job_invalidation_from_another_worker_drops_matching_pages():
+    job = SimpleNamespace(id=uuid4(), status=JobStatus.ACTIVE, type=None, experienceLevel=None,
+                          locationType=LocationType.REMOTE, currency=None, qualifications=[], skills=["python"],
+                          salaryRangeFrom=1, salaryRangeTo=2)
+
+    def page(filters: JobFilters, job_ids=frozenset()) -> FeedPage:
+        return FeedPage(body=b"{}", etag='"-"', filters=filters, search="", job_ids=job_ids, company_ids=frozenset())
+
+    feed_cache.clear()
+    feed_cache["remote"] = page(JobFilters(locationType=[LocationType.REMOTE]))
+    feed_cache["onsite"] = page(JobFilters(locationType=[LocationType.ONSITE]))
+    feed_cache["listing"] = page(JobFilters(locationType=[LocationType.ONSITE]), frozenset({job.id}))
+
+    # as it arrives from the other worker
+    event = json.loads(json.dumps({"jobs": [{field: getattr(job, field) for field in FEED_JOB_FIELDS}]},
+                                  default=str))
+    apply_feed_event(event)
+    assert set(feed_cache) == {"onsite"}
+    feed_cache.clear()
+
+
+def test_if_none_match():
+    etag = '"0f3a"'
+    assert etag_matches('"0f3a"', etag)
+    assert etag_matches('"other", W/"0f3a"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"0f3a0", "1b"', etag)
+    assert not etag_matches(None, etag)
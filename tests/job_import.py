@@ -0,0 +1,103 @@
+'''
+    POST /jobs/import. Parsing runs without a database; the import itself
+    needs the app's database (POSTGRES_* env vars) and is skipped without
+    it, the rows it creates are deleted.
+'''
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from core.dependencies.auth import TokenHelper
+from core.dependencies.sessions import AsyncSessionLocal, ping_db
+from core.env import config
+from core.settings import app
+from modules.jobs.importer import parse_upload
+from modules.jobs.models import Job
+from modules.jobs.recommender import job_index
+
+from .job_applications import clean_up, create_job
+
+
+HEADER = "title,description,location,type,experienceLevel,locationType,qualifications,salaryRangeFrom,salaryRangeTo,skills,benefits\n"
+
+
+def job_row(title: str, **values) -> dict:
+    return {"title": title, "description": "-", "location": "Lagos", "type": "FULL_TIME", "experienceLevel": "ENTRY",
+            "locationType": "REMOTE", "qualifications": ["BACHELORS"], "salaryRangeFrom": 1, "salaryRangeTo": 2,
+            "skills": ["sql"], "benefits": [], **values}
+
+
+def jsonl(*rows) -> bytes:
+    return "\n".join(json.dumps(row) for row in rows).encode()
+
+
+def test_csv_rows_are_validated_and_reported_by_line():
+    upload = (HEADER
+              + "Data Analyst,-,Lagos,FULL_TIME,ENTRY,REMOTE,BACHELORS; MASTERS,1,2,sql;python ; ,health\n"
+              + "Data Analyst,-,Lagos,BOGUS,ENTRY,REMOTE,BACHELORS,1,abc,sql,\n"
+              + "Data Analyst,-,Lagos,FULL_TIME,ENTRY,REMOTE,BACHELORS,1,2,sql,,extra\n")
+    parsed = parse_upload(io.BytesIO(upload.encode()), "csv", 100)
+
+    assert parsed.rows == 3
+    [(line, job)] = parsed.jobs
+    assert line == 2 and job.skills == ["sql", "python"] and job.qualifications == ["BACHELORS", "MASTERS"]
+    assert [error.line for error in parsed.errors] == [3, 4]
+    assert {error.split(":")[0] for error in parsed.errors[0].errors} == {"type", "salaryRangeTo"}
+    assert parsed.errors[1].errors == ["More values than columns in the header"]
+
+
+def test_jsonl_errors_and_the_row_cap():
+    upload = jsonl(job_row("Data Analyst"), [1], job_row("Data Engineer"), job_row("Data Scientist")) + b"\n{bad"
+    parsed = parse_upload(io.BytesIO(upload), "jsonl", 3)
+
+    assert parsed.rows == 3
+    assert [line for line, _ in parsed.jobs] == [1, 3]
+    assert parsed.errors[0].line == 2 and parsed.errors[0].errors == ["Each line must be a JSON object"]
+    # the 4th row and the ones after it aren't read
+    assert parsed.errors[1].line == 4 and parsed.errors[1].errors[0].startswith("Only 3 rows")
+
+
+def test_import_gives_unique_slugs_and_is_all_or_nothing(monkeypatch):
+    with TestClient(app, raise_server_exceptions=False) as client:
+        try:
+            client.portal.call(ping_db)
+        except Exception:
+            pytest.skip("database unreachable")
+
+        async def company_jobs(company_id):
+            async with AsyncSessionLocal() as db:
+                return (await db.execute(select(Job.id, Job.slug, Job.updated_at <= func.now()).filter(
+                    Job.company_id == company_id))).all()
+
+        created = []
+        try:
+            owner, job = client.portal.call(create_job, created)
+            token = TokenHelper.encode({"id": str(owner.id), "email": owner.email, "role": owner.role.value})
+            headers = {"Authorization": f"Bearer {token.decode() if isinstance(token, bytes) else token}"}
+            monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+            monkeypatch.setattr(config, "JOB_IMPORT_BATCH_SIZE", 2)
+
+            def upload(*rows):
+                return client.post("/api/v1/jobs/import", headers=headers,
+                                   files={"file": ("jobs.jsonl", jsonl(*rows), "application/x-ndjson")})
+
+            # the 4th row passes validation, postgres refuses it in the second batch
+            response = upload(*(job_row("Data Analyst") for _ in range(3)), job_row("Data \u0000 Analyst"))
+            assert response.status_code != 201
+            assert len(client.portal.call(company_jobs, job.company_id)) == 1
+
+            response = upload(*(job_row("Data Analyst") for _ in range(3)))
+            assert response.status_code == 201
+            assert response.json()["data"]["imported"] == 3
+            response = upload(job_row("Data Analyst"))
+            jobs = client.portal.call(company_jobs, job.company_id)
+            assert sorted(slug for _, slug, _ in jobs if slug.startswith("data")) == [
+                "data.analyst", "data.analyst.2", "data.analyst.3", "data.analyst.4"]
+            # stamped by the database clock, and picked up by the next recommendation
+            assert all(database_time for _, _, database_time in jobs)
+            assert {id for id, slug, _ in jobs if slug.startswith("data")} <= job_index.stale
+        finally:
+            client.portal.call(clean_up, created)
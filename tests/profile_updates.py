@@ -0,0 +1,40 @@
+'''
+    PATCH /users/companies/{id} and PATCH /users/profile answer with what
+    was written. Needs the app's database (POSTGRES_* env vars) and is
+    skipped without it; the rows it creates are deleted.
+'''
+import pytest
+from fastapi.testclient import TestClient
+
+from core.dependencies.sessions import ping_db
+from core.settings import app
+
+from .job_applications import auth_headers, clean_up, create_job
+
+
+def test_updates_return_the_new_values():
+    with TestClient(app) as client:
+        try:
+            client.portal.call(ping_db)
+        except Exception:
+            pytest.skip("database unreachable")
+
+        created = []
+        try:
+            owner, job = client.portal.call(create_job, created)
+            headers = auth_headers(owner)
+
+            response = client.patch(f"/api/v1/users/companies/{job.company_id}", headers=headers, json={
+                "name": "Renamed company", "profile": {"location": "Lagos"}})
+            assert response.status_code == 200
+            company = response.json()["data"]
+            assert company["name"] == "Renamed company" and company["profile"]["location"] == "Lagos"
+
+            response = client.patch("/api/v1/users/profile", headers=headers, json={
+                "first_name": "Renamed", "client_profile": {"title": "Recruiter"}})
+            assert response.status_code == 200
+            user = response.json()["data"]
+            assert user["first_name"] == "Renamed" and user["client_profile"]["title"] == "Recruiter"
+            assert user["client_profile"]["company"]["name"] == "Renamed company"
+        finally:
+            client.portal.call(clean_up, created)
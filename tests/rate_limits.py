@@ -0,0 +1,133 @@
+import asyncio
+import time
+from uuid import uuid4
+
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from core.dependencies.rate_limit import RateLimit, by_email, by_ip
+from core.helpers import rate_limit
+from core.helpers.rate_limit import MemoryBucketStore, RedisBucketStore, take_token
+from core.settings import init_listeners
+
+from .token_revocation import RedisStandIn
+
+
+class ScriptingStandIn(RedisStandIn):
+    '''Adds EVAL: the script runs in a real Lua interpreter, its redis.call on hashes kept here'''
+
+    def __init__(self, lupa):
+        super().__init__()
+        self.hashes, self.expires = {}, {}
+        self.lua = lupa.LuaRuntime()
+        self.lua.globals().redis = self.lua.table_from({"call": self.call})
+
+    def call(self, command, key, *args):
+        values = self.hashes.setdefault(key, {})
+        if command == "HMGET":
+            # nil replies reach Lua as false
+            return self.lua.table(*(values.get(field, False) for field in args))
+        if command == "HSET":
+            values.update(zip(args[::2], args[1::2]))
+            return len(args) // 2
+        if command == "PEXPIRE":
+            self.expires[key] = int(args[0])
+            return 1
+        raise ValueError(command)
+
+    def reply(self, command, *args) -> bytes:
+        if command != "EVAL":
+            return super().reply(command, *args)
+        script, count = args[0], int(args[1])
+        self.lua.globals().KEYS = self.lua.table(*args[2:2 + count])
+        self.lua.globals().ARGV = self.lua.table(*args[2 + count:])
+        return self.string(str(self.lua.execute(script)))
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def limited_app(rate: str) -> FastAPI:
+    app = FastAPI()
+    init_listeners(app)
+
+    @app.post("/limited", dependencies=[Depends(RateLimit(f"test_{uuid4().hex}", rate, key=by_email))])
+    async def limited():
+        return {"ok": True}
+    return app
+
+
+def test_bucket_allows_a_burst_then_refills(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    store = MemoryBucketStore(100)
+
+    async def take():
+        # 2/minute: a burst of 2, then a token every 30 seconds
+        return await store.take("login:1.2.3.4", 2, 2 / 60)
+
+    assert [asyncio.run(take()) for _ in range(3)] == [0, 0, pytest.approx(30)]
+    clock.now += 15
+    assert asyncio.run(take()) == pytest.approx(15)
+    clock.now += 15
+    assert asyncio.run(take()) == 0
+    # other keys have their own bucket
+    assert asyncio.run(store.take("login:5.6.7.8", 2, 2 / 60)) == 0
+
+
+def test_429_with_retry_after_per_email_from_form_and_json():
+    client = TestClient(limited_app("2/minute"))
+    form = {"username": "Someone@Example.com", "password": "-"}
+    assert [client.post("/limited", data=form).status_code for _ in range(2)] == [200, 200]
+
+    # the same email from a JSON body shares the bucket, case and spaces aside
+    response = client.post("/limited", json={"email": " someone@example.com "})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
+
+    assert client.post("/limited", json={"email": "other@example.com"}).status_code == 200
+    # without an email there's nothing to count
+    assert all(client.post("/limited", json={}).status_code == 200 for _ in range(3))
+
+
+def test_redis_buckets_are_shared_between_workers():
+    lupa = pytest.importorskip("lupa")
+
+    async def run():
+        stand_in = ScriptingStandIn(lupa)
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        async with server:
+            first, second = RedisBucketStore(url), RedisBucketStore(url)
+            waits = [await store.take("signup:1.2.3.4", 2, 2 / 60) for store in (first, second, first)]
+            return waits, stand_in.expires["rate_limit:signup:1.2.3.4"]
+
+    waits, expires = asyncio.run(run())
+    assert waits[:2] == [0, 0] and 29 < waits[2] <= 30
+    # the key outlives the time the bucket takes to fill up again
+    assert expires >= 60000
+
+
+def test_store_errors_let_requests_through(monkeypatch):
+    class Unreachable:
+        async def take(self, *args):
+            raise ConnectionError("Redis closed the connection")
+
+    monkeypatch.setattr(rate_limit, "bucket_store", Unreachable())
+    assert asyncio.run(take_token("test_unreachable", "1/minute", "1.2.3.4")) == 0
+    assert rate_limit.rate_limit_stats["test_unreachable"]["errors"] == 1
+
+
+def test_proxy_addresses_are_not_limited_per_ip():
+    def request(host):
+        return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "client": (host, 1234)})
+
+    assert by_ip(request("203.0.113.7")) == "203.0.113.7"
+    # the default FORWARDED_ALLOW_IPS, a proxy that didn't say who the client is
+    assert by_ip(request("127.0.0.1")) is None
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from core.helpers.revocation import BloomFilter, MemoryStore, RedisStore, RevocationList
+
+
+class RedisStandIn:
+    '''Serves the sorted set commands RedisStore uses, over RESP'''
+
+    def __init__(self):
+        self.sets = {}
+
+    async def handle(self, reader, writer):
+        while line := await reader.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode())
+            writer.write(self.reply(*args))
+            await writer.drain()
+        writer.close()
+
+    def reply(self, command, key, *args) -> bytes:
+        members = self.sets.setdefault(key, {})
+        if command == "ZADD":
+            members[args[1]] = float(args[0])
+            return b":1\r\n"
+        if command == "ZSCORE":
+            score = members.get(args[0])
+            return b"$-1\r\n" if score is None else self.string(str(score))
+        low = float(args[0].lstrip("(")) if args[0] != "-inf" else float("-inf")
+        high = float(args[1]) if args[1] != "+inf" else float("inf")
+        matched = [member for member, score in members.items() if low < score <= high]
+        if command == "ZREMRANGEBYSCORE":
+            for member in matched:
+                del members[member]
+            return b":%d\r\n" % len(matched)
+        return self.bulk(matched)
+
+    @staticmethod
+    def string(item: str) -> bytes:
+        return b"$%d\r\n%s\r\n" % (len(item), item.encode())
+
+    def bulk(self, items) -> bytes:
+        return b"*%d\r\n" % len(items) + b"".join(self.string(item) for item in items)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"token-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert sum(f"other-{i}" in bloom for i in range(10000)) < 300
+
+
+def test_memory_store_revokes_until_expiry():
+    async def run():
+        revoked = RevocationList(MemoryStore(), 1000, 0.01, refresh_seconds=60)
+        await revoked.revoke("current", time.time() + 60)
+        await revoked.revoke("expired", time.time() - 1)
+        return await revoked.is_revoked("current"), await revoked.is_revoked("expired"), await revoked.is_revoked("other")
+
+    assert asyncio.run(run()) == (True, False, False)
+
+
+def test_redis_store_is_shared_between_workers():
+    async def run():
+        stand_in = RedisStandIn()
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        async with server:
+            first = RevocationList(RedisStore(url), 1000, 0.01, refresh_seconds=60)
+            second = RevocationList(RedisStore(url), 1000, 0.01, refresh_seconds=60)
+            await first.revoke("logged-out", time.time() + 60)
+            # the other worker only sees it once its filter is rebuilt
+            before = await second.is_revoked("logged-out")
+            await second.refresh()
+            return before, await second.is_revoked("logged-out"), await second.is_revoked("other")
+
+    assert asyncio.run(run()) == (False, True, False)